@@ -0,0 +1,80 @@
+"""Стоимость access лога uvicorn на запрос в режимах dev и production
+
+Запуск: PYTHONPATH=src python benchmarks/log_modes.py --records 20000
+"""
+
+import argparse
+import contextlib
+import logging
+import os
+import threading
+import time
+from collections.abc import Iterator
+from typing import TextIO
+
+import offline_settings  # noqa: F401  до модулей приложения
+from loguru import logger
+
+from core.logs import UvicornHandler, configure_logger
+from core.settings_model import LoggingSettings
+
+ACCESS_FORMAT = '%s - "%s %s HTTP/%s" %d'
+ACCESS_ARGS = ("127.0.0.1:50000", "POST", "/api/webhook/new_message", "1.1", 200)
+
+
+@contextlib.contextmanager
+def collector() -> Iterator[TextIO]:
+    """stdout в канал, который вычитывает отдельный поток, как сборщик логов контейнера"""
+    read_fd, write_fd = os.pipe()
+
+    def drain() -> None:
+        while os.read(read_fd, 65536):
+            pass
+
+    reader = threading.Thread(target=drain)
+    reader.start()
+    with open(write_fd, "w", encoding="utf-8") as stream:
+        yield stream
+    reader.join()
+    os.close(read_fd)
+
+
+def measure(config: LoggingSettings, records: int) -> tuple[float, float]:
+    """Вернуть микросекунды на запись: в потоке запроса и вместе с выводом в sink"""
+    access = logging.getLogger("uvicorn.access")
+    access.handlers = [UvicornHandler(config.mode != "production", config.access_sample_rate)]
+    access.propagate = False
+    access.setLevel(logging.INFO)
+
+    with collector() as stdout, contextlib.redirect_stdout(stdout):
+        configure_logger(config)
+        started = time.perf_counter()
+        for _ in range(records):
+            # Через logging, как uvicorn: обход кадров идёт сквозь его обёртки
+            access.info(ACCESS_FORMAT, *ACCESS_ARGS)
+        emitted = time.perf_counter()
+        # remove() дожидается, пока фоновый поток допишет очередь
+        logger.remove()
+        flushed = time.perf_counter()
+
+    return (emitted - started) / records * 1e6, (flushed - started) / records * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=20_000)
+    args = parser.parse_args()
+
+    cases = [
+        ("dev", LoggingSettings(mode="dev")),
+        ("production", LoggingSettings(mode="production")),
+        ("production, 10% access", LoggingSettings(mode="production", access_sample_rate=0.1)),
+    ]
+    print(f"{'mode':<24}{'request us':>12}{'total us':>12}")  # noqa: T201
+    for name, config in cases:
+        request_cost, total_cost = measure(config, args.records)
+        print(f"{name:<24}{request_cost:>12.2f}{total_cost:>12.2f}")  # noqa: T201
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,9 @@
+"""Окружение для бенчмарков без бд, импортируется до модулей приложения
+
+Модулю настроек нужна строка подключения к mongo, самой бд такие бенчмарки не касаются.
+"""
+
+import os
+
+os.environ.setdefault("MONGO__URL", "mongodb://localhost:27017")
+os.environ.setdefault("MONGO__DB_NAME", "benchmark")
@@ -0,0 +1,117 @@
+"""Кодирование ответа со списком сообщений и тела исходящей доставки
+
+Сравнивает прежний путь FastAPI (response_model, dict и json.dumps) с
+PydanticJSONResponse на диалоге из --messages сообщений, а также кодирование
+тела доставки на каждую попытку с однократным. Бд не нужна.
+
+Запуск: PYTHONPATH=src python benchmarks/serialization.py --messages 10000
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from collections.abc import Awaitable, Callable
+from datetime import UTC, datetime
+from functools import partial
+
+import httpx
+import offline_settings  # noqa: F401  до модулей приложения
+import orjson
+from beanie import PydanticObjectId
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, ORJSONResponse
+
+from app.responses import PydanticJSONResponse
+from app.routers.api.schemas import MESSAGES_OUT, MessageOut
+from core.database.models import MessageRole
+
+
+def dialogue(size: int) -> list[MessageOut]:
+    now = datetime.now(UTC)
+    return [
+        MessageOut(
+            id=PydanticObjectId(),
+            chat_id=f"chat-{i % 10}",
+            seq=i,
+            role=MessageRole.USER if i % 2 else MessageRole.ASSISTANT,
+            text=f"Сообщение номер {i}: как узнать статус заказа и часы работы?",
+            created_at=now,
+        )
+        for i in range(size)
+    ]
+
+
+def build_apps(messages: list[MessageOut]) -> dict[str, FastAPI]:
+    before = FastAPI(default_response_class=JSONResponse)
+
+    @before.get("/messages")
+    async def list_before() -> list[MessageOut]:
+        return messages
+
+    after = FastAPI(default_response_class=ORJSONResponse)
+
+    @after.get("/messages", response_model=list[MessageOut])
+    async def list_after() -> PydanticJSONResponse:
+        return PydanticJSONResponse(messages, MESSAGES_OUT)
+
+    return {"response_model + json": before, "PydanticJSONResponse": after}
+
+
+async def timed(call: Callable[[], Awaitable[object]], repeat: int) -> float:
+    """Медиана в миллисекундах"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await call()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+async def measure_responses(messages: list[MessageOut], repeat: int) -> dict[str, float]:
+    results = {}
+    bodies = []
+    for name, app in build_apps(messages).items():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+            bodies.append((await client.get("/messages")).json())
+            results[name] = await timed(partial(client.get, "/messages"), repeat)
+    assert bodies[0] == bodies[1], "ответы отличаются"
+    return results
+
+
+async def measure_delivery(attempts: int, repeat: int) -> dict[str, float]:
+    payload = {"event_type": "new_message", "chat_id": "chat-1", "text": "Ответ бота " * 50}
+    body = orjson.dumps(payload)
+
+    async def per_attempt() -> None:
+        for _ in range(attempts):
+            httpx.Request("POST", "http://channel/webhook", json=payload)
+
+    async def once() -> None:
+        for _ in range(attempts):
+            httpx.Request("POST", "http://channel/webhook", content=body)
+
+    return {"json= на попытку": await timed(per_attempt, repeat), "body один раз": await timed(once, repeat)}
+
+
+def report(title: str, results: dict[str, float]) -> None:
+    baseline = next(iter(results.values()))
+    print(f"\n{title}")  # noqa: T201
+    for name, ms in results.items():
+        print(f"  {name:<26}{ms:>10.2f} ms{baseline / ms:>8.1f}x")  # noqa: T201
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--attempts", type=int, default=10_000, help="попыток доставки")
+    args = parser.parse_args()
+
+    messages = dialogue(args.messages)
+    report(f"GET сообщений, {args.messages} шт.", asyncio.run(measure_responses(messages, args.repeat)))
+    report(f"Тела доставки, {args.attempts} попыток", asyncio.run(measure_delivery(args.attempts, args.repeat)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""Нагрузочный прогон вебхука: задержка приёма, задержка ответа и пропускная способность
+
+Приложение работает в этом же процессе через ASGITransport, ответы принимает фейковый
+канал вместо сети, llm - mock бэкенд с заданной задержкой. База - локальная mongo,
+на время прогона создаётся отдельная бд и удаляется после. Заглушка в памяти вроде
+mongomock не подходит: без настоящих индексов и движка хранения задержки ничего не
+говорят о проде, поэтому прогону нужна настоящая mongo:
+
+    docker compose up -d mongodb
+    PYTHONPATH=src python benchmarks/webhook_load.py --customers 50 --messages 20 --output base.json
+    PYTHONPATH=src python benchmarks/webhook_load.py --customers 50 --messages 20 --compare base.json
+
+С --compare прогон завершается с кодом 1, если p95/p99 выросли или пропускная
+способность упала больше чем на --tolerance.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import statistics
+import sys
+import time
+from collections.abc import Iterator
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+import httpx
+
+os.environ.setdefault("MONGO__URL", "mongodb://localhost:27017/")
+os.environ.setdefault("MONGO__DB_NAME", "webhook_bench")
+
+from loguru import logger
+from motor.motor_asyncio import AsyncIOMotorClient
+
+import delivery.http_client
+from app.app import app
+from core import settings
+from core.settings_model import RateLimit
+from delivery.http_client import ChannelHttpClient
+from predict.coalescer import inference_coalescer
+from predict.scheduler import inference_scheduler
+
+CHANNEL_URL = "http://channel.bench/webhook"
+PERCENTILES = {"p50": 50, "p95": 95, "p99": 99}
+# Метрики, рост которых считается регрессией; пропускная способность проверяется на падение
+LATENCY_METRICS = ["ingest_p95", "ingest_p99", "reply_p95", "reply_p99"]
+
+
+@dataclass
+class RunResult:
+    config: dict
+    duration: float = 0.0
+    sent: int = 0
+    accepted: int = 0
+    rejected: int = 0
+    failed: int = 0
+    unanswered: int = 0
+    messages_per_second: float = 0.0
+    latencies: dict[str, float] = field(default_factory=dict)
+
+
+class FakeChannel:
+    """Получатель ответов бота: отмечает, какие сообщения каждого чата получили ответ"""
+
+    def __init__(self, latency: float) -> None:
+        self.latency = latency
+        self.reply_latencies: list[float] = []
+        self._pending: dict[str, list[float]] = {}
+        self._answered: dict[str, asyncio.Event] = {}
+        self.drained = asyncio.Event()
+
+    @property
+    def unanswered(self) -> int:
+        return sum(len(sent) for sent in self._pending.values())
+
+    def expect(self, chat_id: str, sent_at: float) -> asyncio.Event:
+        self._pending.setdefault(chat_id, []).append(sent_at)
+        self.drained.clear()
+        event = self._answered.setdefault(chat_id, asyncio.Event())
+        event.clear()
+        return event
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        chat_id = json.loads(request.content)["chat_id"]
+        now = time.perf_counter()
+        # Склеенные сообщения получают один ответ, задержка считается для каждого из них
+        self.reply_latencies.extend(now - sent_at for sent_at in self._pending.pop(chat_id, []))
+        self._answered.setdefault(chat_id, asyncio.Event()).set()
+        if not self._pending:
+            self.drained.set()
+        return httpx.Response(200)
+
+
+def percentiles(name: str, samples: list[float]) -> Iterator[tuple[str, float]]:
+    if len(samples) < 2:
+        return
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    for label, percentile in PERCENTILES.items():
+        yield f"{name}_{label}", cuts[percentile - 1]
+
+
+async def customer(
+    client: httpx.AsyncClient,
+    channel: FakeChannel,
+    token: str,
+    chat_id: str,
+    args: argparse.Namespace,
+    result: RunResult,
+    ingest: list[float],
+) -> None:
+    headers = {"Authorization": f"Bearer {token}"}
+    for i in range(args.messages):
+        message = {
+            "message_id": f"{chat_id}-{i}",
+            "chat_id": chat_id,
+            "text": f"Вопрос {i}",
+            "message_sender": "customer",
+        }
+        started = time.perf_counter()
+        response = await client.post("/api/webhook/new_message", json=message, headers=headers)
+        ingest.append(time.perf_counter() - started)
+        result.sent += 1
+
+        if response.status_code == httpx.codes.TOO_MANY_REQUESTS:
+            result.rejected += 1
+            continue
+        if response.status_code != httpx.codes.OK:
+            result.failed += 1
+            continue
+        result.accepted += 1
+
+        answered = channel.expect(chat_id, started)
+        if args.wait_reply:
+            # Клиент ждёт ответа перед следующим вопросом, как живой собеседник
+            try:
+                await asyncio.wait_for(answered.wait(), args.reply_timeout)
+            except TimeoutError:
+                return
+        if args.think_time:
+            await asyncio.sleep(args.think_time)
+
+
+async def run(args: argparse.Namespace) -> RunResult:
+    settings.mongo.db_name = args.db_name
+    settings.llm.mock_latency_min = args.llm_latency_min
+    settings.llm.mock_latency_max = args.llm_latency_max
+    if not args.rate_limits:
+        disabled = RateLimit(rate=0, burst=0)
+        settings.rate_limit.chat = settings.rate_limit.channel = settings.rate_limit.chatbot = disabled
+    inference_scheduler.concurrency = args.llm_concurrency
+    inference_coalescer.window = args.coalesce_window
+
+    mongo: AsyncIOMotorClient = AsyncIOMotorClient(settings.mongo.url)
+    await mongo.drop_database(args.db_name)
+
+    channel = FakeChannel(args.receiver_latency)
+    # Пул исходящих запросов подменяется до старта приложения, lifespan возьмёт его же
+    delivery.http_client._http_client = ChannelHttpClient(
+        settings.http_client,
+        transport=httpx.MockTransport(channel.handle),
+    )
+
+    result = RunResult(config={k: v for k, v in vars(args).items() if k not in ("output", "compare")})
+    ingest: list[float] = []
+    transport = httpx.ASGITransport(app=app)
+    try:
+        async with (
+            app.router.lifespan_context(app),
+            httpx.AsyncClient(transport=transport, base_url="http://bench") as client,
+        ):
+            logger.remove()
+            logger.add(sys.stderr, level="WARNING")
+
+            bot = await client.post("/api/chatbots/", json={"name": "bench", "secret_token": "bench-secret"})
+            created = await client.post(
+                "/api/channel/",
+                params={"chat_bot_id": bot.json()["id"]},
+                json={"webhook_url": CHANNEL_URL},
+            )
+            token = created.json()["token"]
+
+            started = time.perf_counter()
+            await asyncio.gather(
+                *(customer(client, channel, token, f"chat-{n}", args, result, ingest) for n in range(args.customers)),
+            )
+            result.messages_per_second = result.accepted / (time.perf_counter() - started)
+            # Без ожидания ответов хвост ответов дожидаемся после отправки
+            if channel.unanswered:
+                with contextlib.suppress(TimeoutError):
+                    await asyncio.wait_for(channel.drained.wait(), args.reply_timeout)
+            result.duration = time.perf_counter() - started
+    finally:
+        await mongo.drop_database(args.db_name)
+
+    result.unanswered = channel.unanswered
+    result.latencies = dict([*percentiles("ingest", ingest), *percentiles("reply", channel.reply_latencies)])
+    return result
+
+
+def compare(current: RunResult, baseline: dict, tolerance: float) -> bool:
+    """Напечатать разницу с прошлым прогоном, вернуть True при регрессии"""
+    regressed = False
+    # Имя, прошлое и текущее значение, лучше ли меньшее
+    rows: list[tuple[str, float | None, float | None, bool]] = [
+        ("messages_per_second", baseline["messages_per_second"], current.messages_per_second, False),
+    ]
+    rows += [(name, baseline["latencies"].get(name), current.latencies.get(name), True) for name in LATENCY_METRICS]
+    print(f"{'metric':<22}{'baseline':>12}{'current':>12}{'change':>10}")  # noqa: T201
+    for name, before, after, lower_is_better in rows:
+        if not before or after is None:
+            continue
+        change = (after - before) / before
+        worse = change > tolerance if lower_is_better else change < -tolerance
+        regressed |= worse
+        mark = "  REGRESSION" if worse else ""
+        print(f"{name:<22}{before:>12.4f}{after:>12.4f}{change:>+10.1%}{mark}")  # noqa: T201
+    if baseline["config"] != current.config:
+        print("warning: runs used different parameters")  # noqa: T201
+    return regressed
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--customers", type=int, default=20, help="параллельных чатов")
+    parser.add_argument("--messages", type=int, default=10, help="сообщений от каждого чата")
+    parser.add_argument("--wait-reply", action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument("--think-time", type=float, default=0.0)
+    parser.add_argument("--llm-latency-min", type=float, default=0.05)
+    parser.add_argument("--llm-latency-max", type=float, default=0.05)
+    parser.add_argument("--llm-concurrency", type=int, default=settings.inference.concurrency)
+    parser.add_argument("--coalesce-window", type=float, default=settings.inference.coalesce_window)
+    parser.add_argument("--receiver-latency", type=float, default=0.0)
+    parser.add_argument("--rate-limits", action=argparse.BooleanOptionalAction, default=False)
+    parser.add_argument("--reply-timeout", type=float, default=30.0)
+    parser.add_argument("--db-name", default="webhook_bench")
+    parser.add_argument("--output", type=Path, help="сохранить результат в json")
+    parser.add_argument("--compare", type=Path, help="json прошлого прогона для сравнения")
+    parser.add_argument("--tolerance", type=float, default=0.10)
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    result = asyncio.run(run(args))
+    print(json.dumps(asdict(result), indent=2))  # noqa: T201
+    if args.output:
+        args.output.write_text(json.dumps(asdict(result), indent=2))
+    if args.compare and compare(result, json.loads(args.compare.read_text()), args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,20 +2,57 @@ from collections.abc import AsyncGenerator
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
-from fastapi.responses import RedirectResponse
+from fastapi.responses import ORJSONResponse, RedirectResponse
+from loguru import logger
 
+from app.metrics import MetricsMiddleware
 from app.routers import router as main_router
 from core.database import initialize_database
+from core.database.cache import warm_channel_cache
+from core.database.invalidation import start_cache_invalidation, stop_cache_invalidation
+from core.database.purge import start_purge_worker, stop_purge_worker
+from core.database.retention import start_compactor, stop_compactor
+from core.logs import configure_logger
+from core.metrics import mark_worker_dead
+from delivery.http_client import close_http_client, get_http_client
+from delivery.worker import start_delivery_workers, stop_delivery_workers
+from predict.llm import close_llm_backend, get_llm_backend
+from predict.scheduler import inference_scheduler
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
 @asynccontextmanager
 async def lifespan(app: FastAPI) -> AsyncGenerator[None]:
+    # Воркеры uvicorn запускаются отдельными процессами и не проходят через main()
+    configure_logger()
     await initialize_database()
+    # Токены каналов резолвятся из памяти с первого запроса воркера
+    await warm_channel_cache()
+    # Изменения ботов и каналов из других воркеров сбрасывают кэши этого процесса
+    start_cache_invalidation()
+    # Один пул соединений с каналами на весь процесс
+    get_http_client()
+    start_delivery_workers()
+    start_purge_worker()
+    start_compactor()
+    get_llm_backend()
+    inference_scheduler.start()
     yield
+    await inference_scheduler.stop()
+    await close_llm_backend()
+    await stop_compactor()
+    await stop_purge_worker()
+    await stop_delivery_workers()
+    await close_http_client()
+    await stop_cache_invalidation()
+    mark_worker_dead()
+    # Дописать очередь неблокирующего sink до выхода процесса
+    await logger.complete()
 
 
 app = FastAPI(
     lifespan=lifespan,
+    # orjson вместо json.dumps для всех ответов, которые не кодируются схемой сами
+    default_response_class=ORJSONResponse,
 )
 
 @app.get("/", include_in_schema=False)
@@ -23,4 +60,5 @@ def index_to_docs_redirect() -> RedirectResponse:
     return RedirectResponse(url="docs")
 
 
+app.add_middleware(MetricsMiddleware)
 app.include_router(main_router)
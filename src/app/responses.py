@@ -0,0 +1,31 @@
+from collections.abc import Mapping
+from typing import Any
+
+from fastapi.responses import Response
+from pydantic import BaseModel, TypeAdapter
+
+
+class PydanticJSONResponse(Response):
+    """JSON ответ, собранный pydantic-core сразу в байты
+
+    Обычный путь FastAPI для response_model делает из моделей dict, проверяет
+    их заново и только потом кодирует. На длинных списках сообщений это
+    основная работа ответа, здесь остаётся один проход model_dump_json или
+    dump_json адаптера для списков.
+    """
+
+    media_type = "application/json"
+
+    def __init__(
+        self,
+        content: BaseModel | Any,
+        adapter: TypeAdapter | None = None,
+        status_code: int = 200,
+        headers: Mapping[str, str] | None = None,
+    ) -> None:
+        # by_alias как у FastAPI по умолчанию, чтобы формат ответа не поменялся
+        if adapter is not None:
+            body = adapter.dump_json(content, by_alias=True)
+        else:
+            body = content.model_dump_json(by_alias=True).encode()
+        super().__init__(body, status_code, headers)
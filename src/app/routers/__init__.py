@@ -1,6 +1,8 @@
 from fastapi import APIRouter
 
 from app.routers.api import router as api_router
+from app.routers.metrics import router as metrics_router
 
 router = APIRouter()
 router.include_router(api_router)
+router.include_router(metrics_router)
@@ -1,40 +1,177 @@
+from collections.abc import AsyncIterator
+from datetime import UTC, datetime, timedelta
+
+from beanie import PydanticObjectId
+from beanie.operators import In, Set
 from fastapi import APIRouter, HTTPException
-from core.database.models import Dialogue
-from .schemas import ChannelCreate, ChannelUpdate, ChannelOut
-from typing import List
-from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from app.responses import PydanticJSONResponse
+from core import settings
+from core.database.cache import evict_channel, evict_channel_id
+from core.database.models import ChatBot, Dialogue, Message
+from core.database.purge import ChannelId, schedule_purge
+from core.tokens import hash_token, new_channel_token
+from .pagination import Cursor, Limit, set_next_cursor
+from .schemas import (
+    CHANNELS_OUT,
+    MESSAGES_OUT,
+    ChannelBulkCreate,
+    ChannelBulkDelete,
+    ChannelBulkUpdate,
+    ChannelCreate,
+    ChannelOut,
+    ChannelToken,
+    ChannelUpdate,
+    MessageOut,
+)
 router = APIRouter(prefix="/channel")
 
+# Хэши токенов наружу не отдаются
+TOKEN_FIELDS = {"token_hash", "previous_token_hash", "previous_token_expires_at"}
+
+def new_channel(chat_bot_id: PydanticObjectId, data: ChannelCreate) -> tuple[Dialogue, str]:
+    # Открытый токен показывается один раз, в базе остаётся только хэш
+    token = new_channel_token()
+    return Dialogue(chat_bot_id=chat_bot_id, webhook_url=data.webhook_url, token_hash=hash_token(token)), token
+
+def created_channel(channel: Dialogue, token: str) -> dict:
+    return {**jsonable_encoder(channel, exclude=TOKEN_FIELDS), "token": token}
+
+async def ensure_chatbot(chat_bot_id: PydanticObjectId) -> None:
+    if await ChatBot.find(ChatBot.id == chat_bot_id).count() == 0:
+        raise HTTPException(404, "ChatBot not found")
+
 @router.post("/", response_model=None, status_code=201)
-async def create_channel(data: ChannelCreate, chat_bot_id: str):
-    channel = Dialogue(chat_bot_id=chat_bot_id, webhook_url=data.webhook_url)
+async def create_channel(data: ChannelCreate, chat_bot_id: PydanticObjectId):
+    await ensure_chatbot(chat_bot_id)
+    channel, token = new_channel(chat_bot_id, data)
     await channel.insert()
-    return channel
+    return created_channel(channel, token)
 
-@router.put("/{token}")
-async def update_channel(token: str, data: ChannelUpdate):
-    ch = await Dialogue.find_one({"_id": ObjectId(token)})
+# Пачки объявлены до /{channel_id}, иначе "bulk" разбирался бы как id канала
+@router.post("/bulk", response_model=None, status_code=201)
+async def create_channels(data: ChannelBulkCreate) -> list[dict]:
+    await ensure_chatbot(data.chat_bot_id)
+    created = [new_channel(data.chat_bot_id, item) for item in data.channels]
+    result = await Dialogue.insert_many([channel for channel, _ in created])
+    # insert_many не проставляет id в документы
+    for (channel, _), channel_id in zip(created, result.inserted_ids, strict=True):
+        channel.id = channel_id
+    return [created_channel(channel, token) for channel, token in created]
+
+@router.patch("/bulk")
+async def update_channels(data: ChannelBulkUpdate) -> dict[str, int]:
+    result = await Dialogue.find(In(Dialogue.id, data.ids)).update_many(Set({Dialogue.webhook_url: data.webhook_url}))
+    for channel_id in data.ids:
+        evict_channel_id(channel_id)
+    return {"matched": result.matched_count, "modified": result.modified_count}
+
+@router.post("/bulk/delete")
+async def delete_channels(data: ChannelBulkDelete) -> dict[str, int]:
+    # Канал удаляется сразу, чтобы вебхуки перестали проходить, история - фоновой очисткой
+    ids = [channel.id for channel in await Dialogue.find(In(Dialogue.id, data.ids)).project(ChannelId).to_list()]
+    result = await Dialogue.find(In(Dialogue.id, ids)).delete()
+    await schedule_purge(ids)
+    for channel_id in ids:
+        evict_channel_id(channel_id)
+    return {"deleted": result.deleted_count}
+
+@router.post("/{channel_id}/token", response_model=ChannelToken)
+async def rotate_channel_token(channel_id: PydanticObjectId) -> ChannelToken:
+    ch = await Dialogue.get(channel_id)
+    if not ch:
+        raise HTTPException(404, "Channel not found")
+    # Старый токен работает ещё token_grace секунд, пока интеграция переходит на новый
+    evict_channel(ch)
+    token = new_channel_token()
+    ch.previous_token_hash = ch.token_hash
+    ch.previous_token_expires_at = datetime.now(UTC) + timedelta(seconds=settings.channel.token_grace)
+    ch.token_hash = hash_token(token)
+    await ch.save()
+    return ChannelToken(token=token, previous_token_expires_at=ch.previous_token_expires_at)
+
+@router.put("/{channel_id}")
+async def update_channel(channel_id: PydanticObjectId, data: ChannelUpdate):
+    ch = await Dialogue.get(channel_id)
     if not ch:
         raise HTTPException(404, "Channel not found")
     ch.webhook_url = data.webhook_url
     await ch.save()
+    evict_channel(ch)
     return {}
 
-@router.delete("/{token}", status_code=204)
-async def delete_channel(token: str):
-    ch = await Dialogue.find_one({"_id": ObjectId(token)})
+@router.delete("/{channel_id}", status_code=204)
+async def delete_channel(channel_id: PydanticObjectId):
+    ch = await Dialogue.get(channel_id)
     if not ch:
         raise HTTPException(404, "Channel not found")
     await ch.delete()
+    evict_channel(ch)
+    # Длинная история не держит запрос: её удалит фоновая очистка
+    await schedule_purge([ch.id])
 
-@router.get("/", response_model=List[ChannelOut])
-async def list_channels():
-    dialogs = await Dialogue.find_all().to_list()
-    return dialogs #[ChannelOut(webhook_url=d.webhook_url) for d in dialogs]
+@router.get("/", response_model=list[ChannelOut])
+async def list_channels(
+    cursor: Cursor = None,
+    limit: Limit = 100,
+    chat_bot_id: PydanticObjectId | None = None,
+):
+    query = Dialogue.find()
+    if chat_bot_id is not None:
+        query = query.find(Dialogue.chat_bot_id == chat_bot_id)
+    if cursor is not None:
+        query = query.find(Dialogue.id > cursor)
+    # Проекция отдаёт только метаданные канала
+    dialogs = await query.sort(+Dialogue.id).limit(limit).project(ChannelOut).to_list()
+    return set_next_cursor(PydanticJSONResponse(dialogs, CHANNELS_OUT), dialogs, limit)
 
-@router.get("/{token}/messages")
-async def get_channel_messages(token: str):
-    ch = await Dialogue.find_one({"_id": ObjectId(token)})
+@router.get("/{channel_id}/messages", response_model=list[MessageOut])
+async def get_channel_messages(
+    channel_id: PydanticObjectId,
+    chat_id: str | None = None,
+    cursor: Cursor = None,
+    limit: Limit = 100,
+):
+    ch = await Dialogue.get(channel_id)
     if not ch:
         raise HTTPException(404, "Channel not found")
-    return ch.message_list
+
+    # seq у каждого чата свой, поэтому страницы всего канала идут по _id
+    query = Message.find(Message.dialogue_id == ch.id)
+    if chat_id is not None:
+        query = query.find(Message.chat_id == chat_id)
+    if cursor is not None:
+        query = query.find(Message.id > cursor)
+    messages = await query.sort(+Message.id).limit(limit).project(MessageOut).to_list()
+    return set_next_cursor(PydanticJSONResponse(messages, MESSAGES_OUT), messages, limit)
+
+@router.get("/{channel_id}/messages/export", response_class=StreamingResponse)
+async def export_channel_messages(
+    channel_id: PydanticObjectId,
+    chat_id: str | None = None,
+    after: PydanticObjectId | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+) -> StreamingResponse:
+    ch = await Dialogue.get(channel_id)
+    if not ch:
+        raise HTTPException(404, "Channel not found")
+
+    query = Message.find(Message.dialogue_id == ch.id)
+    if chat_id is not None:
+        query = query.find(Message.chat_id == chat_id)
+    # after исключающий: чтобы продолжить выгрузку, передаётся id последней полученной строки
+    if after is not None:
+        query = query.find(Message.id > after)
+    if since is not None:
+        query = query.find(Message.created_at >= since)
+    if until is not None:
+        query = query.find(Message.created_at <= until)
+
+    async def lines() -> AsyncIterator[str]:
+        # Курсор отдаёт сообщения пачками, в памяти не держим больше одной пачки
+        async for message in query.sort(+Message.id).project(MessageOut):
+            yield message.model_dump_json() + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
@@ -2,27 +2,39 @@ from fastapi import FastAPI, HTTPException, APIRouter, HTTPException, status
 from fastapi.encoders import jsonable_encoder
 from typing import List
 from motor.motor_asyncio import AsyncIOMotorClient
-from pydantic import BaseModel
+from pydantic import BaseModel, TypeAdapter
+from app.responses import PydanticJSONResponse
 from beanie import PydanticObjectId
-from core.database.models import ChatBot
+from beanie.exceptions import RevisionIdWasChanged
+from core.database.cache import channel_cache, chatbot_cache, chatbot_id_cache
+from core.database.models import CachedReply, ChatBot, Dialogue
+from core.database.purge import schedule_chatbot_purge
+from .pagination import Cursor, Limit, set_next_cursor
 from .schemas import ChatBotCreate, ChatBotUpdate, ChatBotResponse
 from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
 # Инициализация приложения
 router = APIRouter()
+CHATBOTS = TypeAdapter(list[ChatBot])
 
 # CREATE
 @router.post("/chatbots/", response_model=ChatBotResponse, status_code=status.HTTP_201_CREATED)
 async def create_chatbot(chatbot: ChatBotCreate):
     chatbot_data = jsonable_encoder(chatbot)
     new_chatbot = ChatBot(**chatbot_data)
-    await new_chatbot.insert()
+    try:
+        await new_chatbot.insert()
+    except DuplicateKeyError:
+        raise HTTPException(status_code=409, detail="secret_token already in use")
     return new_chatbot
 
 
 # READ (все)
 @router.get("/chatbots", response_model=List[ChatBot])
-async def get_all_chatbots():
-    return await ChatBot.find_all().to_list()
+async def get_all_chatbots(cursor: Cursor = None, limit: Limit = 100):
+    query = ChatBot.find() if cursor is None else ChatBot.find(ChatBot.id > cursor)
+    chatbots = await query.sort(+ChatBot.id).limit(limit).to_list()
+    return set_next_cursor(PydanticJSONResponse(chatbots, CHATBOTS), chatbots, limit)
 
 
 # READ (по ID)
@@ -42,10 +54,18 @@ async def update_chatbot(chatbot_id: str, data: ChatBotUpdate):
         raise HTTPException(status_code=404, detail="ChatBot not found")
 
     update_data = data.dict(exclude_unset=True)
+    old_token = chatbot.secret_token
     for field, value in update_data.items():
         setattr(chatbot, field, value)
 
-    await chatbot.save()
+    try:
+        await chatbot.save()
+    except RevisionIdWasChanged:
+        # Beanie так оборачивает DuplicateKeyError уникального secret_token
+        raise HTTPException(status_code=409, detail="secret_token already in use")
+    chatbot_cache.invalidate(old_token)
+    chatbot_cache.invalidate(chatbot.secret_token)
+    chatbot_id_cache.invalidate(chatbot.id)
     return chatbot
 
 
@@ -56,5 +76,14 @@ async def delete_chatbot(chatbot_id: str):
     if not chatbot:
         raise HTTPException(status_code=404, detail="ChatBot not found")
 
+    # Каналы бота удаляются вместе с ним, иначе их вебхуки продолжили бы вызывать llm.
+    # Бот удаляется последним: после сбоя посередине повторный DELETE доделает остальное
+    await schedule_chatbot_purge(chatbot.id)
+    await Dialogue.find(Dialogue.chat_bot_id == chatbot.id).delete()
+    channel_cache.invalidate_if(lambda _, channel: channel.chat_bot_id == chatbot.id)
+    await CachedReply.find(CachedReply.chat_bot_id == chatbot.id).delete()
+
     await chatbot.delete()
+    chatbot_cache.invalidate(chatbot.secret_token)
+    chatbot_id_cache.invalidate(chatbot.id)
     return {"detail": "ChatBot deleted"}
@@ -0,0 +1,18 @@
+from typing import Annotated
+
+from beanie import PydanticObjectId
+from fastapi import Query, Response
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+Cursor = Annotated[
+    PydanticObjectId | None, Query(description=f"Значение заголовка {NEXT_CURSOR_HEADER} прошлой страницы")
+]
+Limit = Annotated[int, Query(ge=1, le=1000)]
+
+
+def set_next_cursor(response: Response, page: list, limit: int) -> Response:
+    # Курсор - _id последней записи, следующая страница читается по индексу с $gt
+    if len(page) == limit:
+        response.headers[NEXT_CURSOR_HEADER] = str(page[-1].id)
+    return response
@@ -1,8 +1,9 @@
-from pydantic import BaseModel, HttpUrl
+from pydantic import AliasChoices, BaseModel, Field, HttpUrl, TypeAdapter
 from enum import Enum
 from typing import Literal
 from beanie import PydanticObjectId
-from core.database.models import DialogueMessage
+from datetime import datetime
+from core.database.models import MessageRole
 
 class ChannelCreate(BaseModel):
     webhook_url: HttpUrl
@@ -10,30 +11,79 @@ class ChannelCreate(BaseModel):
 class ChannelUpdate(BaseModel):
     webhook_url: HttpUrl
 
+class ChannelBulkCreate(BaseModel):
+    chat_bot_id: PydanticObjectId
+    channels: list[ChannelCreate] = Field(min_length=1, max_length=500)
+
+class ChannelBulkUpdate(BaseModel):
+    ids: list[PydanticObjectId] = Field(min_length=1, max_length=1000)
+    webhook_url: HttpUrl
+
+class ChannelBulkDelete(BaseModel):
+    ids: list[PydanticObjectId] = Field(min_length=1, max_length=1000)
+
 class IncomingMessage(BaseModel):
     message_id: str
     chat_id: str
     text: str
     message_sender: Literal["customer", "employee"]
 
+class IncomingBatch(BaseModel):
+    messages: list[IncomingMessage] = Field(min_length=1, max_length=500)
+
+class BatchMessageStatus(BaseModel):
+    message_id: str
+    status: Literal["accepted", "duplicate"]
+
+class BatchResult(BaseModel):
+    results: list[BatchMessageStatus]
+
 class OutgoingPayload(BaseModel):
     event_type: str = "new_message"
     chat_id: str
     text: str
 
+class ChannelToken(BaseModel):
+    token: str
+    previous_token_expires_at: datetime
+
 class ChannelOut(BaseModel):
-    id: PydanticObjectId
-    message_list: list[DialogueMessage]
+    id: PydanticObjectId = Field(validation_alias=AliasChoices("_id", "id"))
+    chat_bot_id: PydanticObjectId
     webhook_url: HttpUrl
 
+    class Settings:
+        projection = {"_id": 1, "chat_bot_id": 1, "webhook_url": 1}
+
+class MessageOut(BaseModel):
+    id: PydanticObjectId = Field(validation_alias=AliasChoices("_id", "id"))
+    chat_id: str | None = None
+    seq: int
+    role: MessageRole
+    text: str
+    created_at: datetime
+
+    class Settings:
+        projection = {"_id": 1, "chat_id": 1, "seq": 1, "role": 1, "text": 1, "created_at": 1}
+
+# Списки кодируются через PydanticJSONResponse без промежуточных dict
+CHANNELS_OUT = TypeAdapter(list[ChannelOut])
+MESSAGES_OUT = TypeAdapter(list[MessageOut])
+
 
 class ChatBotUpdate(BaseModel):
     name: str | None = None
     secret_token: str | None = None
+    response_cache: bool | None = None
+    retention_days: float | None = Field(default=None, gt=0)
+    retention_messages: int | None = Field(default=None, gt=0)
 
 class ChatBotCreate(BaseModel):
     name: str
     secret_token: str
+    response_cache: bool = False
+    retention_days: float | None = Field(default=None, gt=0)
+    retention_messages: int | None = Field(default=None, gt=0)
 
 
 class ChatBotResponse(ChatBotCreate):
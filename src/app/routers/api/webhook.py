@@ -1,91 +1,194 @@
-from fastapi import APIRouter, Header, HTTPException, BackgroundTasks, Depends
-from .schemas import IncomingMessage, OutgoingPayload
-from core.database.models import Dialogue, MessageRole, DialogueMessage, ChatBot
-from predict.mock_llm_call import mock_llm_call
-from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
-from typing import Optional
+import asyncio
+import math
+from collections import Counter
+from functools import partial
+from typing import Annotated
+
+from beanie.operators import In
 from bson import ObjectId
-import httpx
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from loguru import logger
+from pymongo.errors import DuplicateKeyError
+
+from app.responses import PydanticJSONResponse
+from core import settings
+from core.database.cache import resolve_channel, resolve_chatbot, resolve_chatbot_by_id
+from core.database.models import ChatBot, Dialogue, Message, MessageRole, NewMessage
+from core.database.rate_limit import rate_limiter
+from core.database.response_cache import response_cache, response_key
+from delivery.outbox import enqueue_reply
+from predict.coalescer import inference_coalescer
+from predict.context import build_context
+from predict.llm import generate, get_llm_backend
+from predict.scheduler import SchedulerFullError, inference_scheduler
+
+from .schemas import BatchMessageStatus, BatchResult, IncomingBatch, IncomingMessage
 
 router = APIRouter(prefix="/webhook")
 bearer = HTTPBearer(auto_error=False)
 
 
 async def get_chatbot(
-    creds: Optional[HTTPAuthorizationCredentials] = Depends(bearer)
-):
+    creds: Annotated[HTTPAuthorizationCredentials | None, Depends(bearer)],
+) -> ChatBot:
     if creds is None or creds.scheme.lower() != "bearer":
         raise HTTPException(status_code=401, detail="Недостаточно прав")
     secret = creds.credentials
-    cb = await ChatBot.find_one(ChatBot.secret_token == secret)
+    cb = await resolve_chatbot(secret)
     if not cb:
         raise HTTPException(status_code=403, detail="Недействительный токен")
     return cb
 
 
-@router.post("/new_message", status_code=200)
-async def inbound_message(
-    msg: IncomingMessage,
-    background: BackgroundTasks,
-    creds: Optional[HTTPAuthorizationCredentials] = Depends(bearer)
-):
+async def get_channel(
+    creds: Annotated[HTTPAuthorizationCredentials | None, Depends(bearer)],
+) -> Dialogue:
     if creds is None or creds.scheme.lower() != "bearer":
         raise HTTPException(status_code=401, detail="Недостаточно прав")
-    secret = creds.credentials
-
-    dialog = await Dialogue.find_one({"_id": ObjectId(secret)})
+    # Токен неверного формата отбивается без запроса в бд
+    dialog = await resolve_channel(creds.credentials)
     if not dialog:
         raise HTTPException(status_code=404, detail="not found")
+    return dialog
+
+
+async def enforce_rate_limits(dialog: Dialogue, chat_ids: Counter[str]) -> None:
+    # До любой записи в бд: сначала чат, чтобы один клиент не выедал лимит всего канала
+    limits = settings.rate_limit
+    total = chat_ids.total()
+    buckets = [
+        *((f"chat:{dialog.id}:{chat_id}", limits.chat, count) for chat_id, count in chat_ids.items()),
+        (f"channel:{dialog.id}", limits.channel, total),
+        (f"chatbot:{dialog.chat_bot_id}", limits.chatbot, total),
+    ]
+    for spent, (key, limit, cost) in enumerate(buckets):
+        retry_after = await rate_limiter.acquire(key, limit, cost)
+        if retry_after:
+            # Отклонённый запрос не должен тратить лимит чата: клиент повторит его позже
+            for refund_key, refund_limit, refund_cost in buckets[:spent]:
+                await rate_limiter.refund(refund_key, refund_limit, refund_cost)
+            raise HTTPException(
+                status_code=429,
+                detail="Rate limit exceeded",
+                headers={"Retry-After": str(math.ceil(retry_after))},
+            )
+
+
+async def admit_inference(dialog: Dialogue, message_ids: list[str], replies: int = 1) -> None:
+    # Место в очереди llm нужно только сообщениям, на которые будет ответ, по одному на чат.
+    # При отказе сохранённые сообщения удаляются, чтобы повтор канала не отсекло как дубль
+    try:
+        inference_scheduler.admit(replies)
+    except SchedulerFullError:
+        await Message.find(Message.dialogue_id == dialog.id, In(Message.message_id, message_ids)).delete()
+        raise HTTPException(status_code=429, detail="Too many pending messages", headers={"Retry-After": "1"})
+
+
+def request_reply(dialog: Dialogue, token: str, chat_id: str) -> None:
+    # Серия сообщений клиента получает один ответ, чаты канала отвечают независимо.
+    # Ответ уходит с тем токеном, которым канал подписал запрос: в окне ротации годятся оба
+    inference_coalescer.request(
+        (dialog.id, chat_id),
+        dialog.chat_bot_id,
+        partial(process_and_respond, dialog.id, dialog.chat_bot_id, str(dialog.webhook_url), token, chat_id),
+    )
 
-    if dialog.message_list:
-        last_msg = dialog.message_list[-1]
-        if last_msg.text == msg.message_id:
-            return {}
 
-    # Добавляем пользовательское сообщение
-    dialog.message_list.append(DialogueMessage(role=MessageRole.USER, text=msg.text))
-    await dialog.save()
+@router.post("/new_message", status_code=200)
+async def inbound_message(
+    msg: IncomingMessage,
+    dialog: Annotated[Dialogue, Depends(get_channel)],
+    creds: Annotated[HTTPAuthorizationCredentials, Depends(bearer)],
+) -> dict:
+    await enforce_rate_limits(dialog, Counter([msg.chat_id]))
 
-    # Отправляем в фон дальнейшую обработку
-    background.add_task(
-        process_and_respond,
-        dialog.id,
-        msg.chat_id,
-        msg.message_sender,
-    )
+    # Добавляем пользовательское сообщение, ретрай канала отсекает уникальный индекс.
+    # Сообщение клиента создаёт разговор, поэтому append его не теряет
+    try:
+        await Message.append(dialog.id, MessageRole.USER, msg.text, message_id=msg.message_id, chat_id=msg.chat_id)
+    except DuplicateKeyError:
+        return {}
+
+    # Бот не отвечает сотрудникам
+    if msg.message_sender == "customer":
+        await admit_inference(dialog, [msg.message_id])
+        request_reply(dialog, creds.credentials, msg.chat_id)
 
     return {}  # Ответ немедленно
 
 
-async def process_and_respond(dialog_id: ObjectId, chat_id: str, sender: str):
-    # Повторно достаём диалог (безопасно для фоновой задачи)
-    dialog = await Dialogue.find_one({"_id": dialog_id})
-    if not dialog:
-        print(f"Диалог {dialog_id} не найден")
-        return
+@router.post("/new_messages", response_model=BatchResult)
+async def inbound_batch(
+    batch: IncomingBatch,
+    dialog: Annotated[Dialogue, Depends(get_channel)],
+    creds: Annotated[HTTPAuthorizationCredentials, Depends(bearer)],
+) -> PydanticJSONResponse:
+    await enforce_rate_limits(dialog, Counter(msg.chat_id for msg in batch.messages))
 
-    # Генерация ответа
-    reply = await mock_llm_call(dialog.message_list)
+    # Повторы внутри пачки отсекаем сразу, повторы уже сохранённых - уникальный индекс
+    unique: dict[str, IncomingMessage] = {}
+    for msg in batch.messages:
+        unique.setdefault(msg.message_id, msg)
+    messages = list(unique.values())
 
-    # Сохраняем ответ
-    dialog.message_list.append(DialogueMessage(role=MessageRole.ASSISTANT, text=reply))
-    await dialog.save()
+    inserted = await Message.append_batch(
+        dialog.id,
+        [NewMessage(MessageRole.USER, msg.text, msg.message_id, msg.chat_id) for msg in messages],
+    )
 
-    # Отправка ответа, если инициатор — клиент
-    if sender == "customer":
-        await send_reply(
-            url=str(dialog.webhook_url),
-            token=str(dialog.id),
-            chat_id=chat_id,
-            text=reply
+    accepted = {msg.message_id for msg, ok in zip(messages, inserted, strict=True) if ok}
+    # Один ответ на каждый чат, где клиент написал что-то новое
+    reply_chats = dict.fromkeys(
+        msg.chat_id for msg in messages if msg.message_id in accepted and msg.message_sender == "customer"
+    )
+    if reply_chats:
+        await admit_inference(dialog, list(accepted), len(reply_chats))
+    for chat_id in reply_chats:
+        request_reply(dialog, creds.credentials, chat_id)
+
+    results = [
+        BatchMessageStatus(
+            message_id=msg.message_id,
+            status="accepted" if msg is unique[msg.message_id] and msg.message_id in accepted else "duplicate",
         )
+        for msg in batch.messages
+    ]
+    return PydanticJSONResponse(BatchResult(results=results))
+
+
+async def process_and_respond(
+    dialog_id: ObjectId,
+    chat_bot_id: ObjectId,
+    webhook_url: str,
+    token: str,
+    chat_id: str,
+    superseded: asyncio.Event | None = None,
+) -> None:
+    # Генерация ответа по окну контекста, включая склеенные сообщения
+    context = await build_context(dialog_id, chat_id)
+
+    # Боты с включённым кэшем отвечают на уже виденный контекст без вызова llm
+    chatbot = await resolve_chatbot_by_id(chat_bot_id)
+    cache_key = response_key(chatbot, context) if chatbot is not None and chatbot.response_cache else None
+    reply = await response_cache.get(cache_key) if cache_key else None
+
+    if reply is None:
+        try:
+            reply = await generate(get_llm_backend(), context, settings.llm.deadline, superseded)
+        except TimeoutError:
+            logger.warning(f"LLM reply for dialogue {dialog_id} missed the {settings.llm.deadline}s deadline")
+            return
+        if reply is None:
+            # Клиент дописал во время генерации, ответ на свежий контекст даст повторный ход
+            return
+        if cache_key:
+            await response_cache.set(cache_key, chatbot, reply)
+
+    # Сохраняем ответ, заодно проверяя, что разговор ещё существует
+    if await Message.append(dialog_id, MessageRole.ASSISTANT, reply, chat_id=chat_id) is None:
+        logger.warning(f"Dialogue {dialog_id} was deleted before the reply was saved")
+        return
 
-
-async def send_reply(url, token, chat_id, text):
-    payload = OutgoingPayload(chat_id=chat_id, text=text)
-    headers = {"Authorization": f"Bearer {token}"}
-    try:
-        async with httpx.AsyncClient() as client:
-            await client.post(url, json=payload.dict(), headers=headers)
-    except Exception as e:
-        print(f"Ошибка при отправке ответа: {e}")
+    # Ответ уходит через outbox, доставку с ретраями берут на себя воркеры
+    await enqueue_reply(dialog_id, webhook_url, token, chat_id, reply)
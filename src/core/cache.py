@@ -0,0 +1,90 @@
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+
+from core.metrics import CACHE_REQUESTS
+
+
+class TTLCache[K: Hashable, V]:
+    """Ограниченный по размеру LRU кэш с временем жизни записей
+
+    index_by задаёт второй ключ записи, например _id документа для кэша по токену:
+    invalidate_by сбрасывает все записи с этим ключом без прохода по кэшу.
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: float,
+        name: str | None = None,
+        index_by: Callable[[V], Hashable] | None = None,
+    ) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.name = name
+        self.index_by = index_by
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[K, tuple[float, V]] = OrderedDict()
+        self._index: dict[Hashable, set[K]] = {}
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: K) -> V | None:
+        item = self._data.get(key)
+        if item is None or item[0] < time.monotonic():
+            if item is not None:
+                self._drop(key)
+            self.misses += 1
+            if self.name is not None:
+                CACHE_REQUESTS.labels(self.name, "miss").inc()
+            return None
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        if self.name is not None:
+            CACHE_REQUESTS.labels(self.name, "hit").inc()
+        return item[1]
+
+    def set(self, key: K, value: V) -> None:
+        self._drop(key)
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        if self.index_by is not None:
+            self._index.setdefault(self.index_by(value), set()).add(key)
+        while len(self._data) > self.maxsize:
+            self._drop(next(iter(self._data)))
+
+    def invalidate(self, key: K) -> None:
+        self._drop(key)
+
+    def invalidate_by(self, index_key: Hashable) -> int:
+        keys = self._index.pop(index_key, set())
+        for key in keys:
+            self._data.pop(key, None)
+        return len(keys)
+
+    def invalidate_if(self, predicate: Callable[[K, V], bool]) -> int:
+        # Полный проход: нужен для редких изменений, когда известен только _id документа
+        stale = [key for key, (_, value) in self._data.items() if predicate(key, value)]
+        for key in stale:
+            self._drop(key)
+        return len(stale)
+
+    def clear(self) -> None:
+        self._data.clear()
+        self._index.clear()
+
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._data)}
+
+    def _drop(self, key: K) -> None:
+        item = self._data.pop(key, None)
+        if item is None or self.index_by is None:
+            return
+        index_key = self.index_by(item[1])
+        keys = self._index.get(index_key)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._index[index_key]
@@ -0,0 +1,93 @@
+from beanie import PydanticObjectId
+
+from core import settings
+from core.cache import TTLCache
+from core.database.models import ChatBot, Dialogue
+from core.tokens import hash_token, is_channel_token
+
+# Только метаданные по токену, история сообщений сюда не попадает
+chatbot_cache: TTLCache[str, ChatBot] = TTLCache(
+    settings.cache.maxsize,
+    settings.cache.ttl,
+    "chatbot",
+    index_by=lambda chatbot: chatbot.id,
+)
+# Ключ - хэш токена канала, открытые токены в памяти не копятся.
+# Второй ключ - _id канала: по нему сбрасываются записи, когда хэши токенов неизвестны
+channel_cache: TTLCache[str, Dialogue] = TTLCache(
+    settings.cache.maxsize,
+    settings.cache.ttl,
+    "channel",
+    index_by=lambda channel: channel.id,
+)
+# Настройки бота для генерации ответа, канал знает только chat_bot_id
+chatbot_id_cache: TTLCache[PydanticObjectId, ChatBot] = TTLCache(
+    settings.cache.maxsize,
+    settings.cache.ttl,
+    "chatbot_id",
+)
+
+
+async def resolve_chatbot(secret_token: str) -> ChatBot | None:
+    chatbot = chatbot_cache.get(secret_token)
+    if chatbot is None:
+        chatbot = await ChatBot.find_one(ChatBot.secret_token == secret_token)
+        if chatbot is not None:
+            chatbot_cache.set(secret_token, chatbot)
+    return chatbot
+
+
+async def resolve_chatbot_by_id(chat_bot_id: PydanticObjectId) -> ChatBot | None:
+    chatbot = chatbot_id_cache.get(chat_bot_id)
+    if chatbot is None:
+        chatbot = await ChatBot.get(chat_bot_id)
+        if chatbot is not None:
+            chatbot_id_cache.set(chat_bot_id, chatbot)
+    return chatbot
+
+
+def channel_token_query(token_hash: str) -> dict:
+    # Каждую ветку $or обслуживает свой частичный индекс
+    return {"$or": [{"token_hash": token_hash}, {"previous_token_hash": token_hash}]}
+
+
+async def resolve_channel(token: str) -> Dialogue | None:
+    if not is_channel_token(token):
+        return None
+    token_hash = hash_token(token)
+    channel = channel_cache.get(token_hash)
+    if channel is None:
+        channel = await Dialogue.find_one(channel_token_query(token_hash))
+        if channel is not None:
+            channel_cache.set(token_hash, channel)
+    # Срок прошлого токена проверяем и для записи из кэша
+    if channel is None or not channel.accepts(token_hash):
+        return None
+    return channel
+
+
+def evict_channel(channel: Dialogue) -> None:
+    for token_hash in (channel.token_hash, channel.previous_token_hash):
+        if token_hash is not None:
+            channel_cache.invalidate(token_hash)
+
+
+def evict_channel_id(channel_id: PydanticObjectId) -> None:
+    # Хэши токенов могли смениться, сбрасываем записи по самому каналу
+    channel_cache.invalidate_by(channel_id)
+
+
+def evict_chatbot_id(chat_bot_id: PydanticObjectId) -> None:
+    chatbot_id_cache.invalidate(chat_bot_id)
+    chatbot_cache.invalidate_by(chat_bot_id)
+
+
+async def warm_channel_cache() -> int:
+    """Загрузить каналы в кэш токенов, чтобы первые вебхуки воркера не ходили в mongo"""
+    warmed = 0
+    async for channel in Dialogue.find({"token_hash": {"$type": "string"}}).limit(channel_cache.maxsize):
+        channel_cache.set(channel.token_hash, channel)
+        if channel.previous_token_hash is not None and channel.accepts(channel.previous_token_hash):
+            channel_cache.set(channel.previous_token_hash, channel)
+        warmed += 1
+    return warmed
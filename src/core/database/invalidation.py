@@ -0,0 +1,125 @@
+import asyncio
+import contextlib
+from collections.abc import AsyncIterator, Callable, Mapping
+from contextlib import AbstractAsyncContextManager
+from typing import Any
+
+from loguru import logger
+from pymongo.errors import OperationFailure, PyMongoError
+
+from core import settings
+from core.cache import TTLCache
+from core.database.cache import channel_cache, chatbot_cache, chatbot_id_cache, evict_channel_id, evict_chatbot_id
+from core.database.models import ChatBot, Dialogue
+from core.metrics import CACHE_INVALIDATIONS
+
+type Change = Mapping[str, Any]
+type ChangeSource = Callable[[Change | None], AbstractAsyncContextManager[AsyncIterator[Change]]]
+
+# Standalone mongod без реплики и старые версии: ждать бесполезно, остаётся TTL
+CHANGE_STREAMS_UNSUPPORTED = {40573, 40324}
+CHANGE_STREAM_HISTORY_LOST = 286
+
+CACHES: list[TTLCache] = [chatbot_cache, chatbot_id_cache, channel_cache]
+
+
+def watch_mongo(resume_after: Change | None) -> AbstractAsyncContextManager[AsyncIterator[Change]]:
+    collections = [ChatBot.get_collection_name(), Dialogue.get_collection_name()]
+    database = Dialogue.get_motor_collection().database
+    # Вставки кэш не портят: отрицательных записей в нём нет
+    pipeline = [{"$match": {"ns.coll": {"$in": collections}, "operationType": {"$ne": "insert"}}}]
+    return database.watch(pipeline, resume_after=resume_after)
+
+
+class CacheInvalidator:
+    """Сбрасывает кэши процесса по изменениям ботов и каналов из других воркеров
+
+    Пока поток изменений подключён, записи кэшей живут stream_ttl. При обрыве
+    кэши очищаются, потому что изменения за время обрыва могли потеряться, и
+    возвращаются к короткому ttl до переподключения.
+    """
+
+    def __init__(self, source: ChangeSource = watch_mongo, retry_max: float = 30.0) -> None:
+        self.source = source
+        self.retry_max = retry_max
+        self.connected = False
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        self._set_connected(False)
+
+    def apply(self, change: Change) -> None:
+        collection = change.get("ns", {}).get("coll")
+        if change["operationType"] in ("drop", "rename", "dropDatabase", "invalidate"):
+            for cache in CACHES:
+                cache.clear()
+        elif collection == ChatBot.get_collection_name():
+            evict_chatbot_id(change["documentKey"]["_id"])
+        elif collection == Dialogue.get_collection_name():
+            evict_channel_id(change["documentKey"]["_id"])
+        CACHE_INVALIDATIONS.labels(collection or "all").inc()
+
+    async def _run(self) -> None:
+        resume_after: Change | None = None
+        delay = min(1.0, self.retry_max)
+        while True:
+            try:
+                async with self.source(resume_after) as stream:
+                    self._set_connected(True)
+                    delay = min(1.0, self.retry_max)
+                    async for change in stream:
+                        self.apply(change)
+                        # После invalidate поток закрыт, продолжить с его токена нельзя
+                        resume_after = None if change["operationType"] == "invalidate" else change["_id"]
+            except OperationFailure as e:
+                if e.code in CHANGE_STREAMS_UNSUPPORTED:
+                    logger.warning(f"Change streams are unavailable, caches fall back to TTL: {e}")
+                    self._set_connected(False)
+                    return
+                if e.code == CHANGE_STREAM_HISTORY_LOST:
+                    resume_after = None
+                logger.warning(f"Change stream failed: {e}")
+            except PyMongoError as e:
+                logger.warning(f"Change stream failed: {e!r}")
+            except Exception:
+                logger.exception("Change stream listener crashed")
+
+            self._set_connected(False)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.retry_max)
+
+    def _set_connected(self, connected: bool) -> None:
+        if connected == self.connected:
+            return
+        self.connected = connected
+        for cache in CACHES:
+            cache.ttl = settings.cache.stream_ttl if connected else settings.cache.ttl
+            if not connected:
+                cache.clear()
+        logger.info(f"Cache invalidation stream {'connected' if connected else 'disconnected'}")
+
+
+_invalidator: CacheInvalidator | None = None
+
+
+def start_cache_invalidation() -> None:
+    global _invalidator
+    if not settings.cache.change_stream:
+        return
+    _invalidator = CacheInvalidator()
+    _invalidator.start()
+
+
+async def stop_cache_invalidation() -> None:
+    global _invalidator
+    if _invalidator is not None:
+        await _invalidator.stop()
+        _invalidator = None
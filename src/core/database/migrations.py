@@ -0,0 +1,149 @@
+from collections.abc import Awaitable, Callable
+
+from loguru import logger
+from pymongo.errors import BulkWriteError
+
+from core.database.models import (
+    AppliedMigration,
+    Conversation,
+    DeliveryStatus,
+    Dialogue,
+    Message,
+    MessageRole,
+    OutboxItem,
+)
+from core.database.models.message import DUPLICATE_KEY_ERROR
+from core.tokens import hash_token, seal_token
+
+
+async def migrate_embedded_histories() -> int:
+    """Перенести устаревший Dialogue.message_list в коллекцию сообщений"""
+    dialogues = Dialogue.get_motor_collection()
+    messages = Message.get_motor_collection()
+    migrated = 0
+
+    async for raw in dialogues.find({"message_list.0": {"$exists": True}}, {"message_list": 1}):
+        embedded = raw["message_list"]
+        # Отрицательные seq ставят историю перед уже дописанными сообщениями,
+        # а повторный запуск после сбоя упирается в уникальный индекс
+        documents = [
+            Message(
+                dialogue_id=raw["_id"],
+                seq=index - len(embedded),
+                role=item.get("role", MessageRole.USER),
+                text=item.get("text", ""),
+            ).model_dump(exclude={"id"})
+            for index, item in enumerate(embedded)
+        ]
+        try:
+            await messages.insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            if any(error["code"] != DUPLICATE_KEY_ERROR for error in e.details["writeErrors"]):
+                raise
+
+        await dialogues.update_one({"_id": raw["_id"]}, {"$unset": {"message_list": ""}})
+        migrated += 1
+
+    if migrated:
+        logger.info(f"Migrated embedded history of {migrated} dialogues")
+    return migrated
+
+
+async def split_conversations() -> int:
+    """Перенести счётчик seq и свёртку с канала на разговоры его чатов"""
+    dialogues = Dialogue.get_motor_collection()
+    conversations = Conversation.get_motor_collection()
+    split = 0
+
+    # Устаревшие каналы узнаём по общему счётчику next_seq
+    async for raw in dialogues.find({"next_seq": {"$exists": True}}, {"_id": 1}):
+        last_seqs = Message.get_motor_collection().aggregate(
+            [
+                {"$match": {"dialogue_id": raw["_id"]}},
+                {"$group": {"_id": "$chat_id", "last_seq": {"$max": "$seq"}}},
+            ],
+        )
+        async for chat in last_seqs:
+            # $max не откатит счётчик, если параллельно уже прошли новые append
+            await conversations.update_one(
+                {"dialogue_id": raw["_id"], "chat_id": chat["_id"]},
+                {"$max": {"next_seq": chat["last_seq"] + 1}},
+                upsert=True,
+            )
+        # Общая свёртка смешивает чаты, разговоры соберут свою заново
+        await dialogues.update_one({"_id": raw["_id"]}, {"$unset": {"next_seq": "", "summary": "", "summary_seq": ""}})
+        split += 1
+
+    if split:
+        logger.info(f"Split message history of {split} dialogues into conversations")
+    return split
+
+
+async def hash_legacy_channel_tokens() -> int:
+    """Сохранить хэш старого токена канала - его _id, чтобы интеграции продолжили работать до ротации"""
+    dialogues = Dialogue.get_motor_collection()
+    hashed = 0
+
+    async for raw in dialogues.find({"token_hash": None}, {"_id": 1}):
+        # Условие на отсутствие хэша не даёт затереть токен, выданный параллельно
+        await dialogues.update_one(
+            {"_id": raw["_id"], "token_hash": None},
+            {"$set": {"token_hash": hash_token(str(raw["_id"]))}},
+        )
+        hashed += 1
+
+    if hashed:
+        logger.info(f"Hashed legacy tokens of {hashed} channels")
+    return hashed
+
+
+async def seal_outbox_tokens() -> int:
+    """Зашифровать токены каналов, сохранённые в очереди доставки открытыми"""
+    outbox = OutboxItem.get_motor_collection()
+    sealed = 0
+
+    async for raw in outbox.find({"token": {"$exists": True}}, {"token": 1, "status": 1}):
+        update: dict = {"$unset": {"token": ""}}
+        # Мёртвые записи не отправляются, их токен просто удаляем
+        if raw["status"] != DeliveryStatus.DEAD:
+            update["$set"] = {"sealed_token": seal_token(raw["token"])}
+        await outbox.update_one({"_id": raw["_id"]}, update)
+        sealed += 1
+
+    if sealed:
+        logger.info(f"Sealed channel tokens of {sealed} queued deliveries")
+    return sealed
+
+
+# По порядку применения; новая миграция дописывается в конец
+MIGRATIONS: list[Callable[[], Awaitable[int]]] = [
+    migrate_embedded_histories,
+    split_conversations,
+    hash_legacy_channel_tokens,
+    seal_outbox_tokens,
+]
+
+
+async def apply_migrations() -> list[str]:
+    """Выполнить миграции, ещё не отмеченные в этой базе
+
+    Запросы миграций не обслуживаются индексами, поэтому каждая выполняется один
+    раз, а не при каждом старте воркера. Воркеры, стартовавшие одновременно, могут
+    выполнить её параллельно: миграции идемпотентны.
+    """
+    applied = {raw["_id"] async for raw in AppliedMigration.get_motor_collection().find({}, {"_id": 1})}
+    pending = [migration for migration in MIGRATIONS if migration.__name__ not in applied]
+    if not pending:
+        return []
+
+    # В новой базе переносить нечего: все миграции касаются уже созданных каналов
+    fresh = await Dialogue.find_one() is None
+    for migration in pending:
+        if not fresh:
+            await migration()
+        await AppliedMigration.get_motor_collection().update_one(
+            {"_id": migration.__name__},
+            {"$setOnInsert": AppliedMigration(id=migration.__name__).model_dump(exclude={"id"})},
+            upsert=True,
+        )
+    return [migration.__name__ for migration in pending]
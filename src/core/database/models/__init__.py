@@ -1,9 +1,29 @@
+from core.database.models.applied_migration import AppliedMigration
+from core.database.models.cached_reply import CachedReply
 from core.database.models.chat_bot import ChatBot
+from core.database.models.conversation import Conversation
 from core.database.models.dialogue import Dialogue, DialogueMessage, MessageRole
+from core.database.models.message import Message, NewMessage
+from core.database.models.message_archive import MessageArchive
+from core.database.models.outbox import DeliveryStatus, OutboxItem
+from core.database.models.purge_job import PurgeJob
+from core.database.models.rate_bucket import RateBucket
+from core.database.models.scheduled_job import ScheduledJob
+
 __all__ = [
+    "AppliedMigration",
+    "CachedReply",
     "ChatBot",
+    "Conversation",
+    "DeliveryStatus",
     "Dialogue",
     "DialogueMessage",
-    #"Channel",
-    "MessageRole"
+    "Message",
+    "MessageArchive",
+    "MessageRole",
+    "NewMessage",
+    "OutboxItem",
+    "PurgeJob",
+    "RateBucket",
+    "ScheduledJob",
 ]
@@ -0,0 +1,14 @@
+from datetime import UTC, datetime
+
+from beanie import Document
+from pydantic import Field
+
+
+class AppliedMigration(Document):
+    """Отметка о миграции данных, уже выполненной на этой базе"""
+
+    id: str  # type: ignore[assignment]
+    applied_at: datetime = Field(default_factory=lambda: datetime.now(UTC))
+
+    class Settings:
+        name = "applied_migrations"
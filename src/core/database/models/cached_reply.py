@@ -0,0 +1,20 @@
+from datetime import datetime
+
+from beanie import Document, PydanticObjectId
+from pymongo import ASCENDING, IndexModel
+
+
+class CachedReply(Document):
+    """Ответ llm, общий для всех процессов уровень кэша ответов"""
+
+    id: str  # type: ignore[assignment]
+    chat_bot_id: PydanticObjectId
+    reply: str
+    expires_at: datetime
+
+    class Settings:
+        name = "cached_replies"
+        indexes = [
+            IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+            IndexModel([("chat_bot_id", ASCENDING)]),
+        ]
@@ -1,6 +1,12 @@
-from beanie import Document
+from beanie import Document, Indexed
 
 
 class ChatBot(Document):
     name: str
-    secret_token: str
+    secret_token: Indexed(str, unique=True)  # type: ignore[valid-type]
+    # Повторять ответ llm на одинаковый контекст вместо новой генерации
+    response_cache: bool = False
+    # Хранение истории: сообщения старше retention_days или сверх последних
+    # retention_messages каждого чата уходят в архив
+    retention_days: float | None = None
+    retention_messages: int | None = None
@@ -0,0 +1,40 @@
+from beanie import Document, PydanticObjectId
+from pymongo import ASCENDING, IndexModel, ReturnDocument
+
+
+class Conversation(Document):
+    """Переписка с одним чатом канала: свой счётчик seq и своя свёртка контекста"""
+
+    dialogue_id: PydanticObjectId
+    chat_id: str | None = None
+    next_seq: int = 0
+    # Свёртка сообщений, выпавших из окна контекста llm, и seq последнего из них
+    summary: str | None = None
+    summary_seq: int | None = None
+
+    class Settings:
+        name = "conversations"
+        indexes = [
+            IndexModel([("dialogue_id", ASCENDING), ("chat_id", ASCENDING)], unique=True),
+        ]
+
+    @classmethod
+    async def reserve_seq(
+        cls,
+        dialogue_id: PydanticObjectId,
+        chat_id: str | None,
+        count: int = 1,
+        create: bool = True,
+    ) -> int | None:
+        # Счётчик у каждого чата свой, так что параллельные чаты канала не пишут в один документ.
+        # Гонку двух первых upsert по уникальному индексу сервер повторяет сам
+        raw = await cls.get_motor_collection().find_one_and_update(
+            {"dialogue_id": dialogue_id, "chat_id": chat_id},
+            {"$inc": {"next_seq": count}},
+            projection={"next_seq": 1},
+            upsert=create,
+            return_document=ReturnDocument.AFTER,
+        )
+        if raw is None:
+            return None
+        return raw["next_seq"] - count
@@ -1,8 +1,10 @@
+from datetime import UTC, datetime
 from enum import StrEnum, auto
 
 from beanie import Document, PydanticObjectId, Indexed
 from pydantic import BaseModel, HttpUrl, Field
 from bson import ObjectId
+from pymongo import ASCENDING, IndexModel
 
 class MessageRole(StrEnum):
     ASSISTANT = auto()
@@ -17,5 +19,34 @@ class DialogueMessage(BaseModel):
 
 class Dialogue(Document):
     chat_bot_id: PydanticObjectId
-    message_list: list[DialogueMessage] = []
-    webhook_url: HttpUrl
\ No newline at end of file
+    webhook_url: HttpUrl
+    # sha256 bearer токена канала, сам токен не хранится
+    token_hash: str | None = None
+    # Прошлый токен после ротации принимается до previous_token_expires_at
+    previous_token_hash: str | None = None
+    previous_token_expires_at: datetime | None = None
+
+    class Settings:
+        indexes = [
+            # Списки каналов бота с курсором по _id
+            IndexModel([("chat_bot_id", ASCENDING), ("_id", ASCENDING)]),
+            # Частичные: у каналов до миграции токена ещё нет
+            IndexModel(
+                [("token_hash", ASCENDING)],
+                unique=True,
+                partialFilterExpression={"token_hash": {"$type": "string"}},
+            ),
+            IndexModel(
+                [("previous_token_hash", ASCENDING)],
+                partialFilterExpression={"previous_token_hash": {"$type": "string"}},
+            ),
+        ]
+
+    def accepts(self, token_hash: str) -> bool:
+        if token_hash == self.token_hash:
+            return True
+        if token_hash != self.previous_token_hash or self.previous_token_expires_at is None:
+            return False
+        # mongo возвращает время без зоны, хранится оно в UTC
+        return self.previous_token_expires_at.replace(tzinfo=UTC) > datetime.now(UTC)
+
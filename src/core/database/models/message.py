@@ -0,0 +1,89 @@
+from datetime import UTC, datetime
+from typing import NamedTuple
+
+from beanie import Document, PydanticObjectId
+from pydantic import Field
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import BulkWriteError
+
+from core.database.models.conversation import Conversation
+from core.database.models.dialogue import MessageRole
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+class NewMessage(NamedTuple):
+    role: MessageRole
+    text: str
+    message_id: str | None = None
+    chat_id: str | None = None
+
+
+class Message(Document):
+    dialogue_id: PydanticObjectId
+    seq: int
+    role: MessageRole
+    text: str
+    message_id: str | None = None
+    chat_id: str | None = None
+    created_at: datetime = Field(default_factory=lambda: datetime.now(UTC))
+
+    class Settings:
+        name = "messages"
+        indexes = [
+            # История одного чата: хвост для контекста llm и уникальность seq
+            IndexModel([("dialogue_id", ASCENDING), ("chat_id", ASCENDING), ("seq", ASCENDING)], unique=True),
+            # Выгрузка всего канала с курсором по _id
+            IndexModel([("dialogue_id", ASCENDING), ("_id", ASCENDING)]),
+            # Вставка входящего сообщения и есть проверка на дубль
+            IndexModel(
+                [("dialogue_id", ASCENDING), ("message_id", ASCENDING)],
+                unique=True,
+                partialFilterExpression={"message_id": {"$type": "string"}},
+            ),
+        ]
+
+    @classmethod
+    async def append(
+        cls,
+        dialogue_id: PydanticObjectId,
+        role: MessageRole,
+        text: str,
+        message_id: str | None = None,
+        chat_id: str | None = None,
+    ) -> "Message | None":
+        # Повтор уже сохранённого message_id падает с DuplicateKeyError.
+        # Ответ бота пишется только в существующий разговор: канал могли удалить во время генерации
+        seq = await Conversation.reserve_seq(dialogue_id, chat_id, create=role is not MessageRole.ASSISTANT)
+        if seq is None:
+            return None
+        message = cls(dialogue_id=dialogue_id, seq=seq, role=role, text=text, message_id=message_id, chat_id=chat_id)
+        await message.insert()
+        return message
+
+    @classmethod
+    async def append_batch(cls, dialogue_id: PydanticObjectId, items: list[NewMessage]) -> list[bool]:
+        """Дописать пачку одним insert_many, для каждого сообщения вернуть False, если это дубль"""
+        # Блок seq резервируется на каждый чат пачки, порядок внутри чата сохраняется
+        by_chat: dict[str | None, list[int]] = {}
+        for index, item in enumerate(items):
+            by_chat.setdefault(item.chat_id, []).append(index)
+        seqs = [0] * len(items)
+        for chat_id, indices in by_chat.items():
+            first_seq = await Conversation.reserve_seq(dialogue_id, chat_id, len(indices))
+            assert first_seq is not None
+            for offset, index in enumerate(indices):
+                seqs[index] = first_seq + offset
+
+        messages = [
+            cls(dialogue_id=dialogue_id, seq=seq, **item._asdict()) for seq, item in zip(seqs, items, strict=True)
+        ]
+        inserted = [True] * len(items)
+        try:
+            await cls.insert_many(messages, ordered=False)
+        except BulkWriteError as e:
+            for error in e.details["writeErrors"]:
+                if error["code"] != DUPLICATE_KEY_ERROR:
+                    raise
+                inserted[error["index"]] = False
+        return inserted
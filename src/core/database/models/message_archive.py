@@ -0,0 +1,44 @@
+import gzip
+from datetime import UTC, datetime
+
+from beanie import Document, PydanticObjectId
+from pydantic import Field, TypeAdapter
+from pymongo import ASCENDING, IndexModel
+
+from core.database.models.message import Message
+
+_MESSAGES = TypeAdapter(list[Message])
+
+
+class MessageArchive(Document):
+    """Сжатая пачка старых сообщений одного чата, вытесненная из горячей коллекции"""
+
+    dialogue_id: PydanticObjectId
+    chat_id: str | None = None
+    first_seq: int
+    last_seq: int
+    message_count: int
+    # gzip от json списка сообщений
+    data: bytes
+    archived_at: datetime = Field(default_factory=lambda: datetime.now(UTC))
+
+    class Settings:
+        name = "message_archive"
+        indexes = [
+            IndexModel([("dialogue_id", ASCENDING), ("chat_id", ASCENDING), ("first_seq", ASCENDING)]),
+        ]
+
+    @classmethod
+    def pack(cls, messages: list[Message]) -> "MessageArchive":
+        first, last = messages[0], messages[-1]
+        return cls(
+            dialogue_id=first.dialogue_id,
+            chat_id=first.chat_id,
+            first_seq=first.seq,
+            last_seq=last.seq,
+            message_count=len(messages),
+            data=gzip.compress(_MESSAGES.dump_json(messages)),
+        )
+
+    def unpack(self) -> list[Message]:
+        return _MESSAGES.validate_json(gzip.decompress(self.data))
@@ -0,0 +1,38 @@
+from datetime import UTC, datetime
+from enum import StrEnum, auto
+from typing import Any
+
+from beanie import Document, PydanticObjectId
+from pydantic import Field
+from pymongo import ASCENDING, IndexModel
+
+
+class DeliveryStatus(StrEnum):
+    PENDING = auto()
+    IN_PROGRESS = auto()
+    DEAD = auto()
+
+
+class OutboxItem(Document):
+    dialogue_id: PydanticObjectId
+    url: str
+    # Токен канала для ответа, зашифрованный: открытым в базе он не хранится, у DEAD удаляется
+    sealed_token: bytes | None = None
+    # Тело запроса кодируется один раз при постановке и без изменений уходит во все попытки
+    body: bytes | None = None
+    # Записи, поставленные до появления body
+    payload: dict[str, Any] | None = None
+    status: DeliveryStatus = DeliveryStatus.PENDING
+    attempts: int = 0
+    # Для PENDING - когда можно пробовать снова, для IN_PROGRESS - когда истекает аренда
+    available_at: datetime = Field(default_factory=lambda: datetime.now(UTC))
+    last_error: str | None = None
+    created_at: datetime = Field(default_factory=lambda: datetime.now(UTC))
+
+    class Settings:
+        name = "outbox"
+        indexes = [
+            IndexModel([("status", ASCENDING), ("available_at", ASCENDING)]),
+            # Очистка очереди удалённого канала, включая DEAD записи
+            IndexModel([("dialogue_id", ASCENDING)]),
+        ]
@@ -0,0 +1,21 @@
+from datetime import UTC, datetime
+
+from beanie import Document, PydanticObjectId
+from pydantic import Field
+from pymongo import ASCENDING, IndexModel
+
+
+class PurgeJob(Document):
+    """Удаление истории удалённого канала, выполняется фоном по частям"""
+
+    dialogue_id: PydanticObjectId
+    attempts: int = 0
+    # Когда задачу можно взять: сразу или после истечения аренды упавшего воркера
+    available_at: datetime = Field(default_factory=lambda: datetime.now(UTC))
+    created_at: datetime = Field(default_factory=lambda: datetime.now(UTC))
+
+    class Settings:
+        name = "purge_jobs"
+        indexes = [
+            IndexModel([("available_at", ASCENDING)]),
+        ]
@@ -0,0 +1,19 @@
+from datetime import datetime
+
+from beanie import Document
+from pymongo import ASCENDING, IndexModel
+
+
+class RateBucket(Document):
+    """Общая для всех процессов корзина token bucket"""
+
+    id: str  # type: ignore[assignment]
+    tokens: float
+    updated_at: datetime
+
+    class Settings:
+        name = "rate_buckets"
+        indexes = [
+            # Давно не тронутая корзина всё равно была бы полной, её можно удалить
+            IndexModel([("updated_at", ASCENDING)], expireAfterSeconds=3600),
+        ]
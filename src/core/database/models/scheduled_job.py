@@ -0,0 +1,81 @@
+import time
+import uuid
+from datetime import UTC, datetime, timedelta
+
+from beanie import Document
+from pymongo.errors import DuplicateKeyError
+
+
+class LeaseLostError(Exception):
+    """Аренду задачи перехватил другой процесс, пока эта её выполняла"""
+
+
+class JobLease:
+    """Аренда запуска задачи: пока она продлевается, другой процесс задачу не начнёт
+
+    Упавший процесс аренду не снимет, она истечёт через duration секунд.
+    """
+
+    def __init__(self, name: str, owner: str, duration: float) -> None:
+        self.name = name
+        self.owner = owner
+        self.duration = duration
+        self._renewed_at = time.monotonic()
+
+    async def renew(self) -> None:
+        # Продлеваем на треть срока заранее, а не на каждой пачке работы
+        if time.monotonic() - self._renewed_at < self.duration / 3:
+            return
+        result = await ScheduledJob.get_motor_collection().update_one(
+            {"_id": self.name, "owner": self.owner},
+            {"$set": {"lease_until": datetime.now(UTC) + timedelta(seconds=self.duration)}},
+        )
+        if result.matched_count == 0:
+            raise LeaseLostError(self.name)
+        self._renewed_at = time.monotonic()
+
+    async def release(self) -> None:
+        await ScheduledJob.get_motor_collection().update_one(
+            {"_id": self.name, "owner": self.owner},
+            {"$set": {"owner": None, "lease_until": None}},
+        )
+
+
+class ScheduledJob(Document):
+    """Время следующего запуска периодической задачи и аренда идущего, общие для всех процессов"""
+
+    id: str  # type: ignore[assignment]
+    next_run_at: datetime
+    owner: str | None = None
+    lease_until: datetime | None = None
+
+    class Settings:
+        name = "scheduled_jobs"
+
+    @classmethod
+    async def acquire(cls, name: str, interval: float, lease: float, force: bool = False) -> JobLease | None:
+        """Занять запуск задачи, если подошёл её срок и её никто не выполняет
+
+        force запускает задачу до срока, например из CLI, но не поверх идущего запуска.
+        """
+        now = datetime.now(UTC)
+        owner = uuid.uuid4().hex
+        query: dict = {"_id": name, "$or": [{"lease_until": None}, {"lease_until": {"$lte": now}}]}
+        if not force:
+            query["next_run_at"] = {"$lte": now}
+        try:
+            await cls.get_motor_collection().find_one_and_update(
+                query,
+                {
+                    "$set": {
+                        "next_run_at": now + timedelta(seconds=interval),
+                        "owner": owner,
+                        "lease_until": now + timedelta(seconds=lease),
+                    },
+                },
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            # Запись есть, но срок не подошёл или аренда занята: upsert пытался вставить второй документ
+            return None
+        return JobLease(name, owner, lease)
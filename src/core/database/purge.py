@@ -0,0 +1,141 @@
+import asyncio
+import contextlib
+from collections.abc import Iterable
+from datetime import UTC, datetime, timedelta
+from typing import Any
+
+from beanie import PydanticObjectId
+from loguru import logger
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pydantic import BaseModel, Field
+from pymongo import ASCENDING, ReturnDocument
+
+from core import settings
+from core.database.models import Conversation, Dialogue, Message, MessageArchive, OutboxItem, PurgeJob
+
+# Будит воркер этого процесса сразу после удаления канала
+purge_available = asyncio.Event()
+
+
+class ChannelId(BaseModel):
+    id: PydanticObjectId = Field(validation_alias="_id")
+
+    class Settings:
+        projection = {"_id": 1}
+
+
+async def schedule_purge(dialogue_ids: Iterable[PydanticObjectId]) -> int:
+    jobs = [PurgeJob(dialogue_id=dialogue_id) for dialogue_id in dialogue_ids]
+    if jobs:
+        await PurgeJob.insert_many(jobs)
+        purge_available.set()
+    return len(jobs)
+
+
+async def schedule_chatbot_purge(chat_bot_id: PydanticObjectId) -> int:
+    """Поставить на очистку историю всех каналов бота, читая их курсором пачками"""
+    scheduled = 0
+    batch: list[PydanticObjectId] = []
+    async for channel in Dialogue.find(Dialogue.chat_bot_id == chat_bot_id).project(ChannelId):
+        batch.append(channel.id)
+        if len(batch) == settings.purge.chunk_size:
+            scheduled += await schedule_purge(batch)
+            batch = []
+    return scheduled + await schedule_purge(batch)
+
+
+async def delete_in_chunks(
+    collection: AsyncIOMotorCollection,
+    query: dict[str, Any],
+    chunk_size: int,
+    pause: float,
+) -> int:
+    """delete_many пачками по _id, чтобы не держать коллекцию одной долгой операцией"""
+    deleted = 0
+    while True:
+        ids = [raw["_id"] async for raw in collection.find(query, {"_id": 1}).limit(chunk_size)]
+        if not ids:
+            return deleted
+        result = await collection.delete_many({"_id": {"$in": ids}})
+        deleted += result.deleted_count
+        # Между пачками цикл событий обслуживает вебхуки, а mongo - другие запросы
+        await asyncio.sleep(pause)
+
+
+async def purge_dialogue(dialogue_id: PydanticObjectId) -> int:
+    config = settings.purge
+    # Сначала разговоры: без них ответ llm, сгенерированный до удаления, уже не сохранится
+    deleted = 0
+    for model in (Conversation, Message, MessageArchive, OutboxItem):
+        deleted += await delete_in_chunks(
+            model.get_motor_collection(),
+            {"dialogue_id": dialogue_id},
+            config.chunk_size,
+            config.pause,
+        )
+    return deleted
+
+
+async def claim_purge() -> PurgeJob | None:
+    now = datetime.now(UTC)
+    raw = await PurgeJob.get_motor_collection().find_one_and_update(
+        {"available_at": {"$lte": now}},
+        {"$set": {"available_at": now + timedelta(seconds=settings.purge.lease)}, "$inc": {"attempts": 1}},
+        sort=[("available_at", ASCENDING)],
+        return_document=ReturnDocument.AFTER,
+    )
+    if raw is None:
+        return None
+    return PurgeJob.model_validate(raw)
+
+
+async def run_purge(job: PurgeJob) -> None:
+    # Удаление идемпотентно: если аренда истекла и задачу взял второй воркер, он просто доделает
+    deleted = await purge_dialogue(job.dialogue_id)
+    await job.delete()
+    logger.info(f"Purged {deleted} documents of dialogue {job.dialogue_id}")
+
+
+class PurgeWorker:
+    def __init__(self, poll_interval: float) -> None:
+        self.poll_interval = poll_interval
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            purge_available.clear()
+            try:
+                job = await claim_purge()
+                if job is not None:
+                    await run_purge(job)
+                    continue
+            except Exception:
+                logger.exception("Purge failed, lease will expire")
+            with contextlib.suppress(TimeoutError):
+                await asyncio.wait_for(purge_available.wait(), self.poll_interval)
+
+
+_worker: PurgeWorker | None = None
+
+
+def start_purge_worker() -> None:
+    global _worker
+    _worker = PurgeWorker(settings.purge.poll_interval)
+    _worker.start()
+
+
+async def stop_purge_worker() -> None:
+    global _worker
+    if _worker is not None:
+        await _worker.stop()
+        _worker = None
@@ -0,0 +1,66 @@
+from datetime import UTC, datetime
+
+from pymongo import ReturnDocument
+
+from core import settings
+from core.database.models import RateBucket
+from core.rate_limit import InMemoryRateLimiter, allowance, retry_after
+from core.settings_model import RateLimit
+
+
+class MongoRateLimiter:
+    """Token bucket в mongo: лимит общий для всех воркеров uvicorn"""
+
+    def __init__(self) -> None:
+        self.rejected = 0
+
+    async def acquire(self, key: str, limit: RateLimit, cost: float = 1) -> float:
+        if limit.rate <= 0:
+            return 0.0
+        now = datetime.now(UTC)
+        need = allowance(limit, cost)
+        # Пополнение и списание одним update с конвейером, без гонки чтения и записи между процессами.
+        # Отрицательный прошедший интервал от расхождения часов не отнимает токены
+        elapsed = {"$max": [0, {"$divide": [{"$subtract": [now, {"$ifNull": ["$updated_at", now]}]}, 1000]}]}
+        raw = await RateBucket.get_motor_collection().find_one_and_update(
+            {"_id": key},
+            [
+                {
+                    "$set": {
+                        "tokens": {
+                            "$min": [
+                                limit.burst,
+                                {"$add": [{"$ifNull": ["$tokens", limit.burst]}, {"$multiply": [elapsed, limit.rate]}]},
+                            ],
+                        },
+                        "updated_at": now,
+                    },
+                },
+                {
+                    "$set": {
+                        "allowed": {"$gte": ["$tokens", need]},
+                        "tokens": {"$cond": [{"$gte": ["$tokens", need]}, {"$subtract": ["$tokens", cost]}, "$tokens"]},
+                    },
+                },
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        if raw["allowed"]:
+            return 0.0
+        self.rejected += 1
+        return retry_after(limit, raw["tokens"], cost)
+
+    async def refund(self, key: str, limit: RateLimit, cost: float = 1) -> None:
+        """Вернуть списанные токены запроса, который отклонила следующая корзина"""
+        if limit.rate <= 0:
+            return
+        await RateBucket.get_motor_collection().update_one(
+            {"_id": key},
+            [{"$set": {"tokens": {"$min": [limit.burst, {"$add": ["$tokens", cost]}]}}}],
+        )
+
+
+rate_limiter: InMemoryRateLimiter | MongoRateLimiter = (
+    MongoRateLimiter() if settings.rate_limit.shared else InMemoryRateLimiter(settings.rate_limit.maxsize)
+)
@@ -3,17 +3,45 @@ from loguru import logger
 from motor.motor_asyncio import AsyncIOMotorClient
 
 from core import settings
-from core.database.models import ChatBot, Dialogue
+from core.database.migrations import apply_migrations
+from core.database.models import (
+    AppliedMigration,
+    CachedReply,
+    ChatBot,
+    Conversation,
+    Dialogue,
+    Message,
+    MessageArchive,
+    OutboxItem,
+    PurgeJob,
+    RateBucket,
+    ScheduledJob,
+)
+from core.metrics import MongoCommandListener
 
 
 async def initialize_database() -> None:
     logger.info("Initialising DB...")
 
+    client: AsyncIOMotorClient = AsyncIOMotorClient(settings.mongo.url, event_listeners=[MongoCommandListener()])
+    # init_beanie создаёт объявленные в моделях индексы, повторный вызов ничего не меняет
     await init_beanie(
-        database=AsyncIOMotorClient(settings.mongo.url).get_database(settings.mongo.db_name),
+        database=client.get_database(settings.mongo.db_name),
         document_models=[
+            AppliedMigration,
+            CachedReply,
             ChatBot,
+            Conversation,
             Dialogue,
+            Message,
+            MessageArchive,
+            OutboxItem,
+            PurgeJob,
+            RateBucket,
+            ScheduledJob,
         ],
     )
+    applied = await apply_migrations()
+    if applied:
+        logger.info(f"Applied migrations: {', '.join(applied)}")
     logger.success("DB is ready!")
@@ -0,0 +1,67 @@
+import hashlib
+import json
+import string
+from datetime import UTC, datetime, timedelta
+
+from core import settings
+from core.cache import TTLCache
+from core.database.models import CachedReply, ChatBot, DialogueMessage
+from core.metrics import CACHE_REQUESTS
+from core.settings_model import ResponseCacheSettings
+
+_STRIP = string.punctuation + string.whitespace
+
+
+def normalize(text: str) -> str:
+    # "Привет!" и " привет " дают один промпт: регистр, пробелы и пунктуация по краям не важны
+    return " ".join(text.casefold().split()).strip(_STRIP)
+
+
+def response_key(chatbot: ChatBot, context: list[DialogueMessage]) -> str:
+    """Хэш нормализованного окна контекста и настроек, от которых зависит ответ"""
+    payload = {
+        "chat_bot_id": str(chatbot.id),
+        "name": chatbot.name,
+        "llm": [settings.llm.backend, settings.llm.http_model],
+        "context": [[message.role, normalize(message.text)] for message in context],
+    }
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False).encode()).hexdigest()
+
+
+class ResponseCache:
+    """Кэш ответов llm: LRU в памяти процесса и, по настройке, общий уровень в mongo"""
+
+    def __init__(self, config: ResponseCacheSettings) -> None:
+        self.shared = config.shared
+        self.ttl = config.ttl
+        self.memory: TTLCache[str, str] = TTLCache(config.maxsize, config.ttl, "response")
+
+    async def get(self, key: str) -> str | None:
+        reply = self.memory.get(key)
+        if reply is not None or not self.shared:
+            return reply
+
+        # Монитор TTL индекса удаляет раз в минуту, просроченное отсекаем сами
+        cached = await CachedReply.find_one({"_id": key, "expires_at": {"$gt": datetime.now(UTC)}})
+        CACHE_REQUESTS.labels("response_shared", "miss" if cached is None else "hit").inc()
+        if cached is None:
+            return None
+        self.memory.set(key, cached.reply)
+        return cached.reply
+
+    async def set(self, key: str, chatbot: ChatBot, reply: str) -> None:
+        self.memory.set(key, reply)
+        if not self.shared:
+            return
+        expires_at = datetime.now(UTC) + timedelta(seconds=self.ttl)
+        await CachedReply.get_motor_collection().update_one(
+            {"_id": key},
+            {"$set": {"chat_bot_id": chatbot.id, "reply": reply, "expires_at": expires_at}},
+            upsert=True,
+        )
+
+    def clear(self) -> None:
+        self.memory.clear()
+
+
+response_cache = ResponseCache(settings.response_cache)
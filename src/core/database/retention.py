@@ -0,0 +1,141 @@
+import asyncio
+import contextlib
+from datetime import UTC, datetime, timedelta
+
+from beanie.operators import In, Or
+from loguru import logger
+from pydantic import BaseModel
+
+from core import settings
+from core.database.models import ChatBot, Conversation, Dialogue, Message, MessageArchive, ScheduledJob
+from core.database.models.scheduled_job import JobLease, LeaseLostError
+from core.database.purge import ChannelId
+from core.metrics import MESSAGES_ARCHIVED
+
+JOB_NAME = "retention"
+
+
+class _Seq(BaseModel):
+    seq: int
+
+
+async def archive_conversation(
+    conversation: Conversation,
+    chatbot: ChatBot,
+    now: datetime,
+    lease: JobLease | None = None,
+) -> int:
+    """Перенести устаревшие по политике бота сообщения чата в архив пачками"""
+    dialogue_id, chat_id = conversation.dialogue_id, conversation.chat_id
+    in_chat = (Message.dialogue_id == dialogue_id, Message.chat_id == chat_id)
+    expired = []
+    if chatbot.retention_messages:
+        # seq идут с разрывами, поэтому граница - seq последнего сохраняемого сообщения
+        oldest_kept = (
+            await Message.find(*in_chat)
+            .sort(-Message.seq)
+            .skip(chatbot.retention_messages - 1)
+            .limit(1)
+            .project(_Seq)
+            .first_or_none()
+        )
+        if oldest_kept is not None:
+            expired.append(Message.seq < oldest_kept.seq)
+    if chatbot.retention_days:
+        expired.append(Message.created_at < now - timedelta(days=chatbot.retention_days))
+    if not expired:
+        return 0
+
+    config = settings.retention
+    archived = 0
+    while True:
+        # Без аренды пачку мог бы взять параллельный запуск и заархивировать её второй раз
+        if lease is not None:
+            await lease.renew()
+        batch = await Message.find(*in_chat, Or(*expired)).sort(+Message.seq).limit(config.chunk_size).to_list()
+        if not batch:
+            return archived
+        # Сначала архив, потом удаление: после сбоя между ними пачка попадёт в архив дважды, но не пропадёт
+        await MessageArchive.pack(batch).insert()
+        await Message.find(In(Message.id, [message.id for message in batch])).delete()
+        archived += len(batch)
+        MESSAGES_ARCHIVED.inc(len(batch))
+        await asyncio.sleep(config.pause)
+
+
+async def compact_chatbot(chatbot: ChatBot, now: datetime | None = None, lease: JobLease | None = None) -> int:
+    now = now or datetime.now(UTC)
+    archived = 0
+    async for channel in Dialogue.find(Dialogue.chat_bot_id == chatbot.id).project(ChannelId):
+        async for conversation in Conversation.find(Conversation.dialogue_id == channel.id):
+            archived += await archive_conversation(conversation, chatbot, now, lease)
+    return archived
+
+
+async def compact_all(lease: JobLease | None = None) -> int:
+    """Применить политики хранения всех ботов, у которых они заданы"""
+    archived = 0
+    async for chatbot in ChatBot.find(Or(ChatBot.retention_days != None, ChatBot.retention_messages != None)):  # noqa: E711
+        archived += await compact_chatbot(chatbot, lease=lease)
+    logger.info(f"Retention compaction archived {archived} messages")
+    return archived
+
+
+async def run_compaction(interval: float, force: bool = False) -> int | None:
+    """Архивация под арендой задачи, None если её уже выполняет другой процесс"""
+    lease = await ScheduledJob.acquire(JOB_NAME, interval, settings.retention.lease, force)
+    if lease is None:
+        return None
+    try:
+        return await compact_all(lease)
+    except LeaseLostError:
+        logger.warning("Retention compaction lease expired and was taken by another process")
+        return None
+    finally:
+        await lease.release()
+
+
+class Compactor:
+    """Периодическая архивация в процессе приложения, запуск один на все воркеры"""
+
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    async def _run(self) -> None:
+        # Срок проверяется чаще интервала, чтобы после перезапуска не ждать его целиком
+        poll = min(self.interval, 60.0)
+        while True:
+            try:
+                await run_compaction(self.interval)
+            except Exception:
+                logger.exception("Retention compaction failed")
+            await asyncio.sleep(poll)
+
+
+_compactor: Compactor | None = None
+
+
+def start_compactor() -> None:
+    global _compactor
+    if not settings.retention.in_app:
+        return
+    _compactor = Compactor(settings.retention.interval)
+    _compactor.start()
+
+
+async def stop_compactor() -> None:
+    global _compactor
+    if _compactor is not None:
+        await _compactor.stop()
+        _compactor = None
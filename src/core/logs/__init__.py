@@ -1,13 +1,34 @@
+import json
 import sys
 
 from loguru import logger
 
 from core.logs.handlers import UvicornHandler
+from core.logs.sinks import BackgroundSink
+from core.settings_model import LoggingSettings, settings
 
-__all__ = ["UvicornHandler", "configure_logger", "get_uvicorn_log_config"]
+__all__ = ["BackgroundSink", "UvicornHandler", "configure_logger", "get_uvicorn_log_config", "json_format"]
 
 
-def configure_logger() -> None:
+def json_format(record: "Record") -> str:  # type: ignore  # noqa: F821
+    # Плоская строка вместо serialize=True: loguru форматирует в потоке запроса, в фон уходит только запись
+    entry = {
+        "time": record["time"].isoformat(),
+        "level": record["level"].name,
+        "logger": record["name"],
+        "function": record["function"],
+        "line": record["line"],
+        "message": record["message"],
+        **record["extra"],
+    }
+    if record["exception"] is not None:
+        entry["exception"] = repr(record["exception"].value)
+    record["extra"]["_json"] = json.dumps(entry, ensure_ascii=False, default=str)
+    return "{extra[_json]}\n"
+
+
+def configure_logger(config: LoggingSettings | None = None) -> None:
+    config = config or settings.logging
     log_format_all = "<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level> {exception}\n"
     log_format_request = (
         "<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | {message} {exception}\n"
@@ -19,23 +40,38 @@ def configure_logger() -> None:
         return log_format_all
 
     logger.remove()
-    logger.add(
-        sys.stdout,
-        colorize=True,
-        format=log_format,
-        diagnose=True,
-        backtrace=False,
-    )
+    if config.mode == "production":
+        # Запись в очередь вместо синхронного stdout, без цветов и разбора переменных в трейсбеке
+        logger.add(
+            BackgroundSink(sys.stdout),
+            colorize=False,
+            format=json_format,
+            diagnose=False,
+            backtrace=False,
+        )
+    else:
+        logger.add(
+            sys.stdout,
+            colorize=True,
+            format=log_format,
+            diagnose=True,
+            backtrace=False,
+        )
     logger.level("DEBUG", color="<fg #7f7f7f>")
     logger.level("INFO", color="<white>")
     logger.level("SUCCESS", color="<green>")
     logger.level("WARNING", color="<yellow>")
     logger.level("ERROR", color="<red>")
     logger.level("CRITICAL", color="<bold><white><RED>")
-    logger.level("REQUEST", no=38, color="<magenta>")
+    # Повторная настройка в воркере uvicorn не может заново задать номер уровня
+    try:
+        logger.level("REQUEST")
+    except ValueError:
+        logger.level("REQUEST", no=38, color="<magenta>")
 
 
-def get_uvicorn_log_config() -> dict:
+def get_uvicorn_log_config(config: LoggingSettings | None = None) -> dict:
+    config = config or settings.logging
     return {
         "version": 1,
         "disable_existing_loggers": False,
@@ -54,6 +90,8 @@ def get_uvicorn_log_config() -> dict:
             },
             "uvicorn": {
                 "()": "core.logs.handlers.UvicornHandler",
+                "find_caller": config.mode != "production",
+                "access_sample_rate": config.access_sample_rate,
             },
         },
         "loggers": {
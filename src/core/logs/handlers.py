@@ -1,11 +1,23 @@
 import inspect
 import logging
+import random
 
 from loguru import logger
 
+ACCESS_LOGGER = "uvicorn.access"
+
 
 class UvicornHandler(logging.Handler):
+    def __init__(self, find_caller: bool = True, access_sample_rate: float = 1.0) -> None:
+        super().__init__()
+        self.find_caller = find_caller
+        self.access_sample_rate = access_sample_rate
+
     def emit(self, record: logging.LogRecord) -> None:
+        is_access = record.name == ACCESS_LOGGER
+        if is_access and not self._sampled(record):
+            return
+
         # Get corresponding Loguru level if it exists.
         level: str | int
         try:
@@ -14,12 +26,24 @@ class UvicornHandler(logging.Handler):
             level = record.levelno
 
         # Find caller from where originated the logged message.
-        frame, depth = inspect.currentframe(), 0
-        while frame and (depth == 0 or frame.f_code.co_filename == logging.__file__):
-            frame = frame.f_back
-            depth += 1
+        # Для access логов в production кадр не ищем: он всегда один и тот же, а обход стоит на каждом запросе
+        depth = 0
+        if self.find_caller or not is_access:
+            frame = inspect.currentframe()
+            while frame and (depth == 0 or frame.f_code.co_filename == logging.__file__):
+                frame = frame.f_back
+                depth += 1
 
-        if record.name == "uvicorn.access":
+        if is_access:
             level = "REQUEST"
 
         logger.opt(depth=depth, exception=record.exc_info).log(level, record.getMessage())
+
+    def _sampled(self, record: logging.LogRecord) -> bool:
+        if self.access_sample_rate >= 1:
+            return True
+        # Аргументы access лога uvicorn: (client, method, path, http_version, status)
+        args = record.args
+        if isinstance(args, tuple) and len(args) == 5 and isinstance(args[4], int) and args[4] >= 500:
+            return True
+        return random.random() < self.access_sample_rate
@@ -0,0 +1,54 @@
+import asyncio
+import queue
+import threading
+from typing import TextIO
+
+
+class BackgroundSink:
+    """Неблокирующий sink: готовая строка кладётся в очередь, в поток вывода пишет фоновый поток
+
+    Дешевле enqueue=True loguru, который на каждую запись сериализует весь record
+    в межпроцессную очередь.
+    """
+
+    def __init__(self, stream: TextIO) -> None:
+        self.stream = stream
+        # Строки лога, отметки для complete() и None для остановки
+        self._queue: queue.SimpleQueue[str | threading.Event | None] = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._drain, name="log-sink", daemon=True)
+        self._thread.start()
+
+    def write(self, message: str) -> None:
+        self._queue.put(message)
+
+    async def complete(self) -> None:
+        # Вызывается loguru из logger.complete(): ждём, пока поток допишет всё, что уже в очереди
+        if not self._thread.is_alive():
+            return
+        written = threading.Event()
+        self._queue.put(written)
+        await asyncio.to_thread(written.wait)
+
+    def stop(self) -> None:
+        # Вызывается loguru из logger.remove(): дописываем всё, что уже в очереди
+        self._queue.put(None)
+        self._thread.join()
+
+    def _drain(self) -> None:
+        while True:
+            message = self._queue.get()
+            # Всё, что накопилось за время записи, уходит одним write
+            batch: list[str] = []
+            while isinstance(message, str):
+                batch.append(message)
+                try:
+                    message = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                self.stream.write("".join(batch))
+                self.stream.flush()
+            if isinstance(message, threading.Event):
+                message.set()
+            elif message is None:
+                return
@@ -0,0 +1,105 @@
+import os
+import shutil
+from pathlib import Path
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from pymongo import monitoring
+
+from core import settings
+
+# Режим нескольких процессов выбирается по переменной окружения при импорте prometheus_client,
+# поэтому каталог задаётся в main() до запуска воркеров uvicorn
+MULTIPROC_DIR_ENV = "PROMETHEUS_MULTIPROC_DIR"
+
+LLM_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Время обработки HTTP запроса",
+    ["method", "route", "status"],
+)
+MONGO_OPERATION_DURATION = Histogram(
+    "mongo_operation_duration_seconds",
+    "Время команды mongo",
+    ["collection", "operation"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+MONGO_OPERATION_FAILURES = Counter(
+    "mongo_operation_failures_total",
+    "Команды mongo, завершившиеся ошибкой",
+    ["collection", "operation"],
+)
+LLM_CALL_DURATION = Histogram("llm_call_duration_seconds", "Время вызова llm", buckets=LLM_BUCKETS)
+LLM_CALLS = Counter("llm_calls_total", "Вызовы llm по исходу", ["outcome"])
+INFERENCE_QUEUE_WAIT = Histogram(
+    "inference_queue_wait_seconds",
+    "Ожидание вызова llm в очереди планировщика",
+    buckets=LLM_BUCKETS,
+)
+INFERENCE_QUEUE_DEPTH = Gauge("inference_queue_depth", "Вызовы llm в очереди", multiprocess_mode="livesum")
+INFERENCE_REJECTED = Counter("inference_rejected_total", "Сообщения, отбитые из-за полной очереди llm")
+DELIVERY_DURATION = Histogram(
+    "delivery_duration_seconds",
+    "Время попытки доставки ответа в канал",
+    ["outcome"],
+)
+DELIVERY_FAILURES = Counter(
+    "delivery_failures_total",
+    "Неудачные попытки доставки по итоговому статусу",
+    ["status"],
+)
+MESSAGES_ARCHIVED = Counter("messages_archived_total", "Сообщения, перенесённые в архив по сроку хранения")
+CACHE_REQUESTS = Counter("cache_requests_total", "Обращения к кэшу", ["cache", "result"])
+CACHE_INVALIDATIONS = Counter("cache_invalidations_total", "Изменения из change stream", ["collection"])
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Время команд mongo по коллекции и операции из событий драйвера"""
+
+    def __init__(self) -> None:
+        self._collections: dict[int, str] = {}
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        # Имя коллекции есть только в начале команды, getMore хранит его отдельно
+        target = event.command.get(event.command_name)
+        self._collections[event.request_id] = target if isinstance(target, str) else event.command.get("collection", "")
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        collection = self._collections.pop(event.request_id, "")
+        MONGO_OPERATION_DURATION.labels(collection, event.command_name).observe(event.duration_micros / 1_000_000)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        collection = self._collections.pop(event.request_id, "")
+        MONGO_OPERATION_DURATION.labels(collection, event.command_name).observe(event.duration_micros / 1_000_000)
+        MONGO_OPERATION_FAILURES.labels(collection, event.command_name).inc()
+
+
+def prepare_multiprocess_dir() -> None:
+    """Очистить каталог метрик до старта воркеров: файлы прошлого запуска исказят счётчики"""
+    path = Path(os.environ.setdefault(MULTIPROC_DIR_ENV, settings.metrics.multiproc_dir))
+    shutil.rmtree(path, ignore_errors=True)
+    path.mkdir(parents=True)
+
+
+def mark_worker_dead() -> None:
+    # Живые gauge завершившегося воркера больше не должны попадать в сумму
+    if MULTIPROC_DIR_ENV in os.environ:
+        multiprocess.mark_process_dead(os.getpid())
+
+
+def render_metrics() -> tuple[bytes, str]:
+    if MULTIPROC_DIR_ENV not in os.environ:
+        return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+    # Каждый запрос собирает значения всех воркеров из их файлов
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,57 @@
+import time
+from collections import OrderedDict
+
+from core.settings_model import RateLimit
+
+
+def allowance(limit: RateLimit, cost: float) -> float:
+    # Пачка больше burst проходит в долг, иначе её нельзя было бы принять никогда
+    return min(cost, limit.burst)
+
+
+def retry_after(limit: RateLimit, tokens: float, cost: float) -> float:
+    return (allowance(limit, cost) - tokens) / limit.rate
+
+
+class InMemoryRateLimiter:
+    """Token bucket в памяти процесса, ограниченный по числу корзин как LRU"""
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self.rejected = 0
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    async def acquire(self, key: str, limit: RateLimit, cost: float = 1) -> float:
+        """Списать cost токенов, вернуть 0 или через сколько секунд повторить"""
+        if limit.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.get(key, (limit.burst, now))
+        tokens = min(limit.burst, tokens + (now - updated_at) * limit.rate)
+
+        wait = 0.0
+        if tokens >= allowance(limit, cost):
+            tokens -= cost
+        else:
+            wait = retry_after(limit, tokens, cost)
+            self.rejected += 1
+
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        # Вытесненная корзина просто начнётся заново полной
+        while len(self._buckets) > self.maxsize:
+            self._buckets.popitem(last=False)
+        return wait
+
+    async def refund(self, key: str, limit: RateLimit, cost: float = 1) -> None:
+        """Вернуть списанные токены запроса, который отклонила следующая корзина"""
+        if limit.rate <= 0 or key not in self._buckets:
+            return
+        tokens, updated_at = self._buckets[key]
+        self._buckets[key] = (min(limit.burst, tokens + cost), updated_at)
+
+    def clear(self) -> None:
+        self._buckets.clear()
@@ -1,6 +1,6 @@
-from typing import Annotated
+from typing import Annotated, Literal
 
-from pydantic import BaseModel, MongoDsn
+from pydantic import BaseModel, MongoDsn, SecretStr, model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -13,6 +13,122 @@ class ServerSettings(BaseModel):
     workers: int = 1
 
 
+class CacheSettings(BaseModel):
+    maxsize: int = 10_000
+    ttl: float = 60.0
+    # Пока change stream сбрасывает кэши при изменениях, записи живут дольше
+    change_stream: bool = True
+    stream_ttl: float = 3600.0
+
+
+class ChannelSettings(BaseModel):
+    # Сколько секунд после ротации ещё принимается прошлый токен канала
+    token_grace: float = 86400.0
+    # Ключ Fernet для токенов каналов в очереди доставки, общий для всех воркеров.
+    # Без него ключ создаётся на процесс: допустимо только с одним воркером,
+    # и ответы из очереди не переживут перезапуск
+    outbox_key: SecretStr | None = None
+
+
+class HttpClientSettings(BaseModel):
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    max_connections_per_host: int = 10
+    keepalive_expiry: float = 30.0
+    http2: bool = True
+    connect_timeout: float = 5.0
+    read_timeout: float = 10.0
+    write_timeout: float = 10.0
+    pool_timeout: float = 5.0
+
+
+class DeliverySettings(BaseModel):
+    workers: int = 4
+    max_attempts: int = 8
+    backoff_base: float = 1.0
+    backoff_max: float = 300.0
+    lease: float = 60.0
+    poll_interval: float = 1.0
+
+
+class PurgeSettings(BaseModel):
+    # История удалённых каналов удаляется пачками с паузой между ними
+    chunk_size: int = 1000
+    pause: float = 0.05
+    lease: float = 300.0
+    poll_interval: float = 5.0
+
+
+class RetentionSettings(BaseModel):
+    # Запускать архивацию по расписанию в процессах приложения, иначе только через CLI compact
+    in_app: bool = True
+    interval: float = 3600.0
+    chunk_size: int = 500
+    pause: float = 0.05
+    # Аренда запуска продлевается по ходу работы, упавший процесс отпустит её через lease секунд
+    lease: float = 600.0
+
+
+class InferenceSettings(BaseModel):
+    concurrency: int = 16
+    max_queue: int = 1000
+    coalesce_window: float = 0.5
+
+
+class LLMSettings(BaseModel):
+    backend: Literal["mock", "http"] = "mock"
+    # Предел на весь ответ, более долгая генерация обрывается
+    deadline: float = 30.0
+    # Задержка первого токена mock равномерно в диапазоне, равные границы дают детерминированную
+    mock_latency_min: float = 1.0
+    mock_latency_max: float = 5.0
+    mock_token_interval: float = 0.0
+    # OpenAI-совместимый сервер для backend="http"
+    http_url: str = "http://localhost:8080/v1"
+    http_model: str = "local"
+    http_api_key: str | None = None
+
+
+class ContextSettings(BaseModel):
+    max_turns: int = 20
+    max_tokens: int = 2000
+    summary_max_chars: int = 2000
+
+
+class ResponseCacheSettings(BaseModel):
+    maxsize: int = 10_000
+    ttl: float = 3600.0
+    # Второй уровень в mongo, общий для всех воркеров uvicorn
+    shared: bool = False
+
+
+class RateLimit(BaseModel):
+    # Пополнение в токенах в секунду, 0 выключает лимит
+    rate: float
+    burst: float
+
+
+class RateLimitSettings(BaseModel):
+    # Общие для всех воркеров uvicorn корзины в mongo вместо памяти процесса
+    shared: bool = False
+    maxsize: int = 100_000
+    channel: RateLimit = RateLimit(rate=20.0, burst=200.0)
+    chatbot: RateLimit = RateLimit(rate=100.0, burst=1000.0)
+    chat: RateLimit = RateLimit(rate=1.0, burst=20.0)
+
+
+class MetricsSettings(BaseModel):
+    # Файлы метрик воркеров uvicorn, если PROMETHEUS_MULTIPROC_DIR не задан
+    multiproc_dir: str = "/tmp/app-metrics"  # noqa: S108
+
+
+class LoggingSettings(BaseModel):
+    # production: JSON в неблокирующий sink без поиска кадра вызова для access логов
+    mode: Literal["dev", "production"] = "dev"
+    # Доля записываемых access логов, ответы 5xx пишутся всегда
+    access_sample_rate: float = 1.0
+
+
 class Settings(BaseSettings):
     model_config = SettingsConfigDict(
         extra="ignore",
@@ -23,6 +139,26 @@ class Settings(BaseSettings):
 
     mongo: MongoSettings
     server: ServerSettings = ServerSettings()
+    cache: CacheSettings = CacheSettings()
+    channel: ChannelSettings = ChannelSettings()
+    http_client: HttpClientSettings = HttpClientSettings()
+    delivery: DeliverySettings = DeliverySettings()
+    purge: PurgeSettings = PurgeSettings()
+    retention: RetentionSettings = RetentionSettings()
+    inference: InferenceSettings = InferenceSettings()
+    llm: LLMSettings = LLMSettings()
+    context: ContextSettings = ContextSettings()
+    response_cache: ResponseCacheSettings = ResponseCacheSettings()
+    rate_limit: RateLimitSettings = RateLimitSettings()
+    metrics: MetricsSettings = MetricsSettings()
+    logging: LoggingSettings = LoggingSettings()
+
+    @model_validator(mode="after")
+    def _check_outbox_key(self) -> "Settings":
+        # Доставку из очереди берёт любой воркер, токен, зашифрованный ключом другого процесса, он не прочтёт
+        if self.server.workers > 1 and self.channel.outbox_key is None:
+            raise ValueError("CHANNEL__OUTBOX_KEY is required when SERVER__WORKERS > 1")
+        return self
 
 
 settings = Settings()  # type: ignore[call-arg]
@@ -0,0 +1,54 @@
+import hashlib
+import re
+import secrets
+
+from cryptography.fernet import Fernet, InvalidToken
+from loguru import logger
+
+from core import settings
+
+CHANNEL_TOKEN_PREFIX = "ch_"  # noqa: S105
+# Новый токен - префикс и 32 случайных байта в base64url, устаревший - ObjectId канала
+_CHANNEL_TOKEN = re.compile(r"ch_[A-Za-z0-9_-]{43}|[0-9a-f]{24}")
+
+
+def new_channel_token() -> str:
+    return CHANNEL_TOKEN_PREFIX + secrets.token_urlsafe(32)
+
+
+def is_channel_token(token: str) -> bool:
+    """Проверка формата без обращения к бд: мусорные токены отсекаются сразу"""
+    return _CHANNEL_TOKEN.fullmatch(token) is not None
+
+
+def hash_token(token: str) -> str:
+    # В токене достаточно случайности, медленный хэш как для паролей не нужен
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+_outbox_fernet: Fernet | None = None
+
+
+def _fernet() -> Fernet:
+    global _outbox_fernet
+    if _outbox_fernet is None:
+        key = settings.channel.outbox_key
+        if key is None:
+            logger.warning("CHANNEL__OUTBOX_KEY is not set, queued replies won't survive a restart")
+            _outbox_fernet = Fernet(Fernet.generate_key())
+        else:
+            _outbox_fernet = Fernet(key.get_secret_value())
+    return _outbox_fernet
+
+
+def seal_token(token: str) -> bytes:
+    """Зашифровать токен канала для очереди доставки"""
+    return _fernet().encrypt(token.encode())
+
+
+def open_token(sealed: bytes) -> str | None:
+    """Расшифровать токен из очереди, None если он зашифрован другим ключом"""
+    try:
+        return _fernet().decrypt(sealed).decode()
+    except InvalidToken:
+        return None
@@ -0,0 +1,77 @@
+import asyncio
+from dataclasses import dataclass
+from typing import Any
+
+import httpx
+from loguru import logger
+
+from core import settings
+from core.settings_model import HttpClientSettings
+
+
+@dataclass
+class _HostSlots:
+    semaphore: asyncio.Semaphore
+    # Запросы, которые держат или ждут слот хоста
+    users: int = 0
+
+
+class ChannelHttpClient:
+    """Общий пул соединений для исходящих запросов в каналы"""
+
+    def __init__(self, config: HttpClientSettings, transport: httpx.AsyncBaseTransport | None = None) -> None:
+        self._client = httpx.AsyncClient(
+            transport=transport,
+            http2=config.http2,
+            limits=httpx.Limits(
+                max_connections=config.max_connections,
+                max_keepalive_connections=config.max_keepalive_connections,
+                keepalive_expiry=config.keepalive_expiry,
+            ),
+            timeout=httpx.Timeout(
+                connect=config.connect_timeout,
+                read=config.read_timeout,
+                write=config.write_timeout,
+                pool=config.pool_timeout,
+            ),
+        )
+        # httpx ограничивает только весь пул, лимит на хост держим сами,
+        # чтобы один медленный канал не занял все соединения
+        self._max_per_host = config.max_connections_per_host
+        self._host_slots: dict[str, _HostSlots] = {}
+
+    async def post(self, url: str, **kwargs: Any) -> httpx.Response:
+        host = httpx.URL(url).host
+        slots = self._host_slots.get(host)
+        if slots is None:
+            slots = self._host_slots[host] = _HostSlots(asyncio.Semaphore(self._max_per_host))
+        slots.users += 1
+        try:
+            async with slots.semaphore:
+                return await self._client.post(url, **kwargs)
+        finally:
+            slots.users -= 1
+            # Свободный семафор ничего не помнит: убираем его, чтобы не копить по записи на каждый хост
+            if not slots.users:
+                del self._host_slots[host]
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+
+_http_client: ChannelHttpClient | None = None
+
+
+def get_http_client() -> ChannelHttpClient:
+    global _http_client
+    if _http_client is None:
+        _http_client = ChannelHttpClient(settings.http_client)
+    return _http_client
+
+
+async def close_http_client() -> None:
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+        logger.info("Channel HTTP client closed")
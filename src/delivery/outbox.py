@@ -0,0 +1,79 @@
+import asyncio
+import random
+from datetime import UTC, datetime, timedelta
+from typing import Any
+
+import orjson
+from beanie import PydanticObjectId
+from pymongo import ASCENDING, ReturnDocument
+
+from core import settings
+from core.database.models import DeliveryStatus, OutboxItem
+from core.metrics import DELIVERY_FAILURES
+from core.tokens import seal_token
+
+# Будит простаивающие воркеры этого процесса сразу после постановки в очередь
+delivery_available = asyncio.Event()
+
+
+async def enqueue_reply(dialogue_id: PydanticObjectId, url: str, token: str, chat_id: str, text: str) -> OutboxItem:
+    item = OutboxItem(
+        dialogue_id=dialogue_id,
+        url=url,
+        sealed_token=seal_token(token),
+        body=orjson.dumps({"event_type": "new_message", "chat_id": chat_id, "text": text}),
+    )
+    await item.insert()
+    delivery_available.set()
+    return item
+
+
+async def claim_next() -> OutboxItem | None:
+    """Взять в аренду ближайшую готовую доставку
+
+    Просроченная аренда (упавший воркер) подхватывается тем же запросом.
+    """
+    now = datetime.now(UTC)
+    raw = await OutboxItem.get_motor_collection().find_one_and_update(
+        {
+            "status": {"$in": [DeliveryStatus.PENDING, DeliveryStatus.IN_PROGRESS]},
+            "available_at": {"$lte": now},
+        },
+        {
+            "$set": {
+                "status": DeliveryStatus.IN_PROGRESS,
+                "available_at": now + timedelta(seconds=settings.delivery.lease),
+            },
+            "$inc": {"attempts": 1},
+        },
+        sort=[("available_at", ASCENDING)],
+        return_document=ReturnDocument.AFTER,
+    )
+    if raw is None:
+        return None
+    return OutboxItem.model_validate(raw)
+
+
+def backoff(attempts: int) -> float:
+    # Экспоненциальная задержка с full jitter, чтобы ретраи не шли волной
+    ceiling = min(settings.delivery.backoff_max, settings.delivery.backoff_base * 2 ** (attempts - 1))
+    return random.uniform(0, ceiling)
+
+
+async def complete(item: OutboxItem) -> None:
+    await item.delete()
+
+
+async def fail(item: OutboxItem, error: str) -> None:
+    update: dict[str, Any]
+    if item.attempts >= settings.delivery.max_attempts:
+        status = DeliveryStatus.DEAD
+        # Мёртвую запись никто не отправит, токен канала в ней больше не нужен
+        update = {"$set": {"status": status, "last_error": error}, "$unset": {"sealed_token": ""}}
+    else:
+        status = DeliveryStatus.PENDING
+        available_at = datetime.now(UTC) + timedelta(seconds=backoff(item.attempts))
+        update = {"$set": {"status": status, "available_at": available_at, "last_error": error}}
+    DELIVERY_FAILURES.labels(status).inc()
+    # Если аренда истекла и доставку уже взял другой воркер, его попытку не трогаем
+    await OutboxItem.get_motor_collection().update_one({"_id": item.id, "attempts": item.attempts}, update)
@@ -0,0 +1,91 @@
+import asyncio
+import contextlib
+import time
+
+import httpx
+import orjson
+from loguru import logger
+
+from core import settings
+from core.database.models import OutboxItem
+from core.metrics import DELIVERY_DURATION
+from core.tokens import open_token
+from delivery.http_client import get_http_client
+from delivery.outbox import claim_next, complete, delivery_available, fail
+
+
+async def deliver(item: OutboxItem) -> None:
+    token = open_token(item.sealed_token) if item.sealed_token is not None else None
+    if token is None:
+        # Ответ поставлен процессом с другим ключом: его может прочесть другой воркер
+        # или этот после исправления ключа, поэтому это обычный ретрай, а не сразу DEAD
+        logger.error(f"Delivery {item.id} has no readable channel token, check CHANNEL__OUTBOX_KEY")
+        await fail(item, "channel token can't be decrypted")
+        return
+    headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+    body = item.body if item.body is not None else orjson.dumps(item.payload)
+    started = time.perf_counter()
+    try:
+        response = await get_http_client().post(item.url, content=body, headers=headers)
+        response.raise_for_status()
+    except httpx.HTTPError as e:
+        DELIVERY_DURATION.labels("failed").observe(time.perf_counter() - started)
+        logger.warning(f"Delivery {item.id} attempt {item.attempts} failed: {e!r}")
+        await fail(item, repr(e))
+        return
+    DELIVERY_DURATION.labels("delivered").observe(time.perf_counter() - started)
+    await complete(item)
+
+
+class DeliveryWorkerPool:
+    def __init__(self, size: int, poll_interval: float) -> None:
+        self.size = size
+        self.poll_interval = poll_interval
+        self._tasks: list[asyncio.Task] = []
+
+    def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self.size)]
+        logger.info(f"Started {self.size} delivery workers")
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _run(self) -> None:
+        while True:
+            # Сбрасываем до запроса, чтобы не проспать постановку между claim и ожиданием
+            delivery_available.clear()
+            try:
+                item = await claim_next()
+            except Exception:
+                logger.exception("Failed to claim delivery")
+                item = None
+
+            if item is None:
+                # Ретраи и доставки из других процессов подхватит опрос
+                with contextlib.suppress(TimeoutError):
+                    await asyncio.wait_for(delivery_available.wait(), self.poll_interval)
+                continue
+
+            try:
+                await deliver(item)
+            except Exception:
+                logger.exception(f"Delivery {item.id} crashed, lease will expire")
+
+
+_pool: DeliveryWorkerPool | None = None
+
+
+def start_delivery_workers() -> None:
+    global _pool
+    _pool = DeliveryWorkerPool(settings.delivery.workers, settings.delivery.poll_interval)
+    _pool.start()
+
+
+async def stop_delivery_workers() -> None:
+    global _pool
+    if _pool is not None:
+        await _pool.stop()
+        _pool = None
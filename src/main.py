@@ -1,13 +1,20 @@
+import asyncio
+
 import uvicorn
 from loguru import logger
 
+from core.database import initialize_database
+from core.database.retention import run_compaction
 from core.logs import configure_logger, get_uvicorn_log_config
+from core.metrics import prepare_multiprocess_dir
 from core.settings_model import settings
 
 
 def main() -> None:
     configure_logger()
     logger.info("Starting app...")
+    if settings.server.workers > 1:
+        prepare_multiprocess_dir()
 
     uvicorn.run(
         "app.app:app",
@@ -18,5 +25,18 @@ def main() -> None:
     )
 
 
+async def _compact() -> None:
+    await initialize_database()
+    # Запуск из cron не ждёт срока, но и не идёт параллельно с уже идущей архивацией
+    if await run_compaction(settings.retention.interval, force=True) is None:
+        logger.warning("Retention compaction is already running in another process")
+
+
+def compact() -> None:
+    """Однократная архивация истории по политикам хранения, например из cron"""
+    configure_logger()
+    asyncio.run(_compact())
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,77 @@
+import asyncio
+from collections.abc import Awaitable, Callable, Hashable
+from dataclasses import dataclass, field
+from functools import partial
+
+from core import settings
+from predict.scheduler import InferenceScheduler, inference_scheduler
+
+type TurnRun = Callable[[asyncio.Event], Awaitable[None]]
+
+
+@dataclass
+class _Turn:
+    run: TurnRun
+    started: bool = False
+    rerun: bool = False
+    superseded: asyncio.Event = field(default_factory=asyncio.Event)
+
+
+class TurnCoalescer:
+    """Склеивает серию сообщений диалога в один вызов llm
+
+    Первое сообщение ждёт окно `window`, следующие за это время сообщения
+    едут в тот же вызов. Пришедшие во время генерации выставляют идущему
+    вызову событие superseded, чтобы он бросил устаревший ответ, и дают ровно
+    один повторный вызов после него, а не по вызову на сообщение.
+    """
+
+    def __init__(self, scheduler: InferenceScheduler, window: float) -> None:
+        self.scheduler = scheduler
+        self.window = window
+        self.turns = 0
+        self.coalesced = 0
+        self._turns: dict[Hashable, _Turn] = {}
+
+    def request(self, key: Hashable, fair_key: Hashable, run: TurnRun) -> bool:
+        """Запросить ответ по диалогу, False если запрос склеен с уже ожидающим"""
+        turn = self._turns.get(key)
+        if turn is not None:
+            # Берём последние аргументы: ответ уйдёт в чат последнего сообщения
+            turn.run = run
+            if turn.started:
+                turn.rerun = True
+                turn.superseded.set()
+            self.coalesced += 1
+            return False
+
+        self._turns[key] = _Turn(run)
+        self.turns += 1
+        # Ход ждёт окна вне очереди планировщика, поэтому место под него занимаем сразу
+        self.scheduler.reserve()
+        asyncio.get_running_loop().call_later(self.window, self._submit, key, fair_key, True)
+        return True
+
+    def stats(self) -> dict[str, int]:
+        return {"turns": self.turns, "coalesced": self.coalesced, "pending": len(self._turns)}
+
+    def _submit(self, key: Hashable, fair_key: Hashable, reserved: bool = False) -> None:
+        self.scheduler.submit(fair_key, partial(self._execute, key, fair_key), reserved)
+
+    async def _execute(self, key: Hashable, fair_key: Hashable) -> None:
+        turn = self._turns[key]
+        turn.started = True
+        turn.rerun = False
+        turn.superseded = asyncio.Event()
+        try:
+            await turn.run(turn.superseded)
+        finally:
+            if turn.rerun:
+                turn.started = False
+                self.turns += 1
+                self._submit(key, fair_key)
+            else:
+                del self._turns[key]
+
+
+inference_coalescer = TurnCoalescer(inference_scheduler, settings.inference.coalesce_window)
@@ -0,0 +1,91 @@
+from beanie import PydanticObjectId
+from pydantic import BaseModel
+
+from core import settings
+from core.database.models import Conversation, DialogueMessage, Message, MessageRole
+
+
+class _ContextMessage(BaseModel):
+    seq: int
+    role: MessageRole
+    text: str
+
+
+class _ConversationSummary(BaseModel):
+    summary: str | None = None
+    summary_seq: int | None = None
+
+
+def estimate_tokens(text: str) -> int:
+    # Грубая оценка без токенизатора: ~4 символа на токен
+    return len(text) // 4 + 1
+
+
+async def build_context(dialogue_id: PydanticObjectId, chat_id: str | None) -> list[DialogueMessage]:
+    """Собрать контекст для llm по одному чату: свёртка старой истории и хвост в пределах бюджета"""
+    config = settings.context
+    state = await Conversation.find_one(
+        Conversation.dialogue_id == dialogue_id,
+        Conversation.chat_id == chat_id,
+    ).project(_ConversationSummary)
+    if state is None:
+        return []
+
+    # Читаем только хвост своего чата по индексу (dialogue_id, chat_id, seq), а не всю историю канала
+    tail = (
+        await Message.find(Message.dialogue_id == dialogue_id, Message.chat_id == chat_id)
+        .sort(-Message.seq)
+        .limit(config.max_turns)
+        .project(_ContextMessage)
+        .to_list()
+    )
+
+    window: list[_ContextMessage] = []
+    budget = config.max_tokens - estimate_tokens(state.summary or "")
+    for message in tail:
+        if state.summary_seq is not None and message.seq <= state.summary_seq:
+            break
+        budget -= estimate_tokens(message.text)
+        if budget < 0 and window:
+            break
+        window.append(message)
+
+    summary = await _fold_into_summary(dialogue_id, chat_id, state, tail, dropped=tail[len(window) :])
+
+    context = [DialogueMessage(role=m.role, text=m.text) for m in reversed(window)]
+    if summary:
+        context.insert(0, DialogueMessage(role=MessageRole.SYSTEM, text=f"Summary of earlier conversation:\n{summary}"))
+    return context
+
+
+async def _fold_into_summary(
+    dialogue_id: PydanticObjectId,
+    chat_id: str | None,
+    state: _ConversationSummary,
+    tail: list[_ContextMessage],
+    dropped: list[_ContextMessage],
+) -> str | None:
+    """Дописать в свёртку сообщения, выпавшие из окна с прошлого хода"""
+    folded_seq = state.summary_seq
+    older: list[_ContextMessage] = []
+
+    # Сообщения старше хвоста дочитываем, только если они есть и ещё не свёрнуты.
+    # Для длинной старой истории хватает последних: свёртка всё равно обрезается по длине
+    if len(tail) == settings.context.max_turns and (folded_seq is None or folded_seq < tail[-1].seq - 1):
+        query = Message.find(Message.dialogue_id == dialogue_id, Message.chat_id == chat_id, Message.seq < tail[-1].seq)
+        if folded_seq is not None:
+            query = query.find(Message.seq > folded_seq)
+        older = await query.sort(-Message.seq).limit(settings.context.max_turns).project(_ContextMessage).to_list()
+
+    new_messages = [m for m in reversed(dropped + older) if folded_seq is None or m.seq > folded_seq]
+    if not new_messages:
+        return state.summary
+
+    lines = [f"{m.role}: {m.text}" for m in new_messages]
+    summary = "\n".join([state.summary, *lines] if state.summary else lines)[-settings.context.summary_max_chars :]
+    # Условие на summary_seq не даёт параллельному ходу затереть более свежую свёртку
+    await Conversation.get_motor_collection().update_one(
+        {"dialogue_id": dialogue_id, "chat_id": chat_id, "summary_seq": folded_seq},
+        {"$set": {"summary": summary, "summary_seq": new_messages[-1].seq}},
+    )
+    return summary
@@ -0,0 +1,150 @@
+import asyncio
+import json
+import time
+from collections.abc import AsyncGenerator
+from random import uniform
+from typing import Protocol
+
+import httpx
+from loguru import logger
+
+from core import settings
+from core.database.models import DialogueMessage
+from core.metrics import LLM_CALL_DURATION, LLM_CALLS
+from core.settings_model import LLMSettings
+
+
+class LLMBackend(Protocol):
+    def stream(self, messages: list[DialogueMessage]) -> AsyncGenerator[str]:
+        """Токены ответа по мере генерации, закрытие итератора останавливает генерацию"""
+        ...
+
+    async def aclose(self) -> None: ...
+
+
+class MockBackend:
+    """Заглушка с задержкой первого токена из диапазона и паузой между токенами"""
+
+    reply = "New message from llm"
+
+    def __init__(self, latency_min: float, latency_max: float, token_interval: float = 0.0) -> None:
+        self.latency_min = latency_min
+        self.latency_max = latency_max
+        self.token_interval = token_interval
+
+    async def stream(self, messages: list[DialogueMessage]) -> AsyncGenerator[str]:
+        await asyncio.sleep(uniform(self.latency_min, self.latency_max))
+        first, *rest = self.reply.split(" ")
+        yield first
+        for word in rest:
+            await asyncio.sleep(self.token_interval)
+            yield f" {word}"
+
+    async def aclose(self) -> None:
+        pass
+
+
+class HttpBackend:
+    """OpenAI-совместимый /chat/completions со stream, например локальный llama.cpp или vLLM"""
+
+    def __init__(self, config: LLMSettings, transport: httpx.AsyncBaseTransport | None = None) -> None:
+        headers = {"Authorization": f"Bearer {config.http_api_key}"} if config.http_api_key else None
+        # Общий предел на ответ задаёт deadline, здесь только подключение
+        self._client = httpx.AsyncClient(
+            base_url=config.http_url,
+            headers=headers,
+            transport=transport,
+            timeout=httpx.Timeout(None, connect=5.0),
+        )
+        self.model = config.http_model
+
+    async def stream(self, messages: list[DialogueMessage]) -> AsyncGenerator[str]:
+        body = {
+            "model": self.model,
+            "stream": True,
+            "messages": [{"role": m.role.value, "content": m.text} for m in messages],
+        }
+        # Выход из async with при отмене рвёт соединение, и сервер перестаёт генерировать
+        async with self._client.stream("POST", "/chat/completions", json=body) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line.removeprefix("data:").strip()
+                if data == "[DONE]":
+                    return
+                token = json.loads(data)["choices"][0]["delta"].get("content")
+                if token:
+                    yield token
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+
+async def generate(
+    backend: LLMBackend,
+    messages: list[DialogueMessage],
+    deadline: float,
+    superseded: asyncio.Event | None = None,
+) -> str | None:
+    """Собрать ответ целиком, None если ход перебит новым сообщением клиента
+
+    Генерация дольше deadline обрывается с TimeoutError.
+    """
+
+    async def collect() -> str:
+        stream = backend.stream(messages)
+        try:
+            return "".join([token async for token in stream])
+        finally:
+            await stream.aclose()
+
+    started = time.perf_counter()
+    generation = asyncio.create_task(collect())
+    waiters: set[asyncio.Future] = {generation}
+    if superseded is not None:
+        waiters.add(asyncio.ensure_future(superseded.wait()))
+    try:
+        async with asyncio.timeout(deadline):
+            await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+    except TimeoutError:
+        LLM_CALLS.labels("timeout").inc()
+        raise
+    finally:
+        # Недоделанный ответ устарел или опоздал: отменяем, чтобы не платить за генерацию
+        for waiter in waiters:
+            waiter.cancel()
+
+    LLM_CALL_DURATION.observe(time.perf_counter() - started)
+    if not generation.done() or generation.cancelled():
+        LLM_CALLS.labels("superseded").inc()
+        return None
+    if generation.exception() is not None:
+        LLM_CALLS.labels("failed").inc()
+    reply = generation.result()
+    LLM_CALLS.labels("completed").inc()
+    return reply
+
+
+_backend: LLMBackend | None = None
+
+
+def create_llm_backend(config: LLMSettings) -> LLMBackend:
+    if config.backend == "http":
+        return HttpBackend(config)
+    return MockBackend(config.mock_latency_min, config.mock_latency_max, config.mock_token_interval)
+
+
+def get_llm_backend() -> LLMBackend:
+    global _backend
+    if _backend is None:
+        _backend = create_llm_backend(settings.llm)
+        logger.info(f"Using {settings.llm.backend} LLM backend")
+    return _backend
+
+
+async def close_llm_backend() -> None:
+    global _backend
+    if _backend is not None:
+        await _backend.aclose()
+        _backend = None
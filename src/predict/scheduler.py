@@ -0,0 +1,144 @@
+import asyncio
+import time
+from collections import deque
+from collections.abc import Awaitable, Callable, Hashable
+from dataclasses import dataclass, field
+
+from loguru import logger
+
+from core import settings
+from core.metrics import INFERENCE_QUEUE_DEPTH, INFERENCE_QUEUE_WAIT, INFERENCE_REJECTED
+
+
+class SchedulerFullError(Exception):
+    pass
+
+
+@dataclass
+class _Job:
+    run: Callable[[], Awaitable[None]]
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class InferenceScheduler:
+    """Очередь вызовов llm с общим лимитом параллельности
+
+    Задачи разных чат ботов выбираются по кругу, поэтому всплеск одного бота
+    не задерживает остальных дольше, чем на одну задачу.
+    """
+
+    def __init__(self, concurrency: int, max_queue: int) -> None:
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.depth = 0
+        # Места, обещанные ходам, которые ещё ждут окна склейки и не попали в очередь
+        self.reserved = 0
+        self.in_flight = 0
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self._queues: dict[Hashable, deque[_Job]] = {}
+        self._ready: deque[Hashable] = deque()
+        self._pending = asyncio.Semaphore(0)
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._workers: list[asyncio.Task] = []
+
+    @property
+    def is_full(self) -> bool:
+        return self.depth + self.reserved >= self.max_queue
+
+    def admit(self, count: int = 1) -> None:
+        """Проверить место под count задач в очереди до записи сообщений в бд"""
+        if self.depth + self.reserved + count > self.max_queue:
+            self.rejected += 1
+            INFERENCE_REJECTED.inc()
+            raise SchedulerFullError
+
+    def reserve(self) -> None:
+        """Занять место под задачу, которая будет поставлена позже через submit(reserved=True)"""
+        self.reserved += 1
+
+    def submit(self, key: Hashable, run: Callable[[], Awaitable[None]], reserved: bool = False) -> None:
+        # Не отказывает: место проверено в admit(), сверх лимита могут попасть только повторные ходы склейки
+        if reserved:
+            self.reserved -= 1
+        if not self._workers:
+            self.start()
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = deque()
+            self._ready.append(key)
+        queue.append(_Job(run))
+        self.depth += 1
+        INFERENCE_QUEUE_DEPTH.inc()
+        self.submitted += 1
+        self._idle.clear()
+        self._pending.release()
+
+    def start(self) -> None:
+        self._workers = [asyncio.create_task(self._run()) for _ in range(self.concurrency)]
+
+    async def drain(self) -> None:
+        """Дождаться, пока очередь опустеет и все вызовы завершатся"""
+        await self._idle.wait()
+
+    async def stop(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def stats(self) -> dict[str, float]:
+        finished = self.completed + self.failed
+        return {
+            "queue_depth": self.depth,
+            "reserved": self.reserved,
+            "in_flight": self.in_flight,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "completed": self.completed,
+            "failed": self.failed,
+            "wait_time_avg": self.wait_time_total / finished if finished else 0.0,
+            "wait_time_max": self.wait_time_max,
+        }
+
+    def _next_job(self) -> _Job:
+        key = self._ready.popleft()
+        queue = self._queues[key]
+        job = queue.popleft()
+        self.depth -= 1
+        INFERENCE_QUEUE_DEPTH.dec()
+        if queue:
+            self._ready.append(key)
+        else:
+            del self._queues[key]
+        return job
+
+    async def _run(self) -> None:
+        while True:
+            await self._pending.acquire()
+            job = self._next_job()
+            wait_time = time.monotonic() - job.enqueued_at
+            self.wait_time_total += wait_time
+            self.wait_time_max = max(self.wait_time_max, wait_time)
+            INFERENCE_QUEUE_WAIT.observe(wait_time)
+
+            self.in_flight += 1
+            try:
+                await job.run()
+            except Exception:
+                self.failed += 1
+                logger.exception("Inference job failed")
+            else:
+                self.completed += 1
+            finally:
+                self.in_flight -= 1
+                if not self.in_flight and not self._queues:
+                    self._idle.set()
+
+
+inference_scheduler = InferenceScheduler(settings.inference.concurrency, settings.inference.max_queue)
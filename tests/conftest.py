@@ -8,6 +8,8 @@ from httpx import ASGITransport, AsyncClient
 
 from core import settings
 from core.database import initialize_database
+from core.database.cache import channel_cache, chatbot_cache, chatbot_id_cache
+from core.database.response_cache import response_cache
 from src.app.app import app
 
 pytest_plugins = ["pytest_asyncio"]
@@ -33,12 +35,17 @@ async def init_db() -> None:
 
 @pytest.fixture(autouse=True)
 async def drop_db() -> None:
-    """Дропнуть бд перед каждым тестом"""
+    """Дропнуть бд перед каждым тестом и заново создать индексы"""
     if not settings.mongo.db_name.lower().endswith("test"):
         raise RuntimeError
 
     mongo: motor.motor_asyncio.AsyncIOMotorClient = motor.motor_asyncio.AsyncIOMotorClient(settings.mongo.url)
     await mongo.drop_database(settings.mongo.db_name)
+    await initialize_database()
+    chatbot_cache.clear()
+    channel_cache.clear()
+    chatbot_id_cache.clear()
+    response_cache.clear()
 
 
 @pytest.fixture(scope="session")
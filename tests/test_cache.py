@@ -0,0 +1,82 @@
+import pytest
+from beanie import PydanticObjectId
+
+from core import settings
+from core.cache import TTLCache
+from core.database.models import ChatBot, DialogueMessage, MessageRole
+from core.database.response_cache import ResponseCache, response_key
+
+
+def test_cache_hit_and_miss() -> None:
+    cache: TTLCache[str, int] = TTLCache(maxsize=10, ttl=60)
+
+    assert cache.get("a") is None
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    assert cache.stats() == {"hits": 1, "misses": 1, "size": 1}
+
+
+def test_cache_evicts_least_recently_used() -> None:
+    cache: TTLCache[str, int] = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_cache_expires_and_invalidates(monkeypatch: pytest.MonkeyPatch) -> None:
+    now = 1000.0
+    monkeypatch.setattr("core.cache.time.monotonic", lambda: now)
+    cache: TTLCache[str, int] = TTLCache(maxsize=10, ttl=5)
+    cache.set("a", 1)
+    cache.set("b", 2)
+
+    cache.invalidate("b")
+    assert cache.get("b") is None
+
+    now += 10
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_cache_invalidates_by_second_key() -> None:
+    cache: TTLCache[str, tuple[str, int]] = TTLCache(maxsize=3, ttl=60, index_by=lambda value: value[0])
+    # Два токена одного канала и один токен другого
+    cache.set("token-1", ("channel-a", 1))
+    cache.set("token-2", ("channel-a", 2))
+    cache.set("token-3", ("channel-b", 3))
+
+    assert cache.invalidate_by("channel-a") == 2
+    assert cache.get("token-1") is None
+    assert cache.get("token-3") == ("channel-b", 3)
+
+    # Перезапись и вытеснение не оставляют в индексе устаревших ключей
+    cache.set("token-3", ("channel-c", 3))
+    assert cache.invalidate_by("channel-b") == 0
+    for i in range(4):
+        cache.set(f"other-{i}", ("channel-d", i))
+    assert cache.invalidate_by("channel-c") == 0
+    assert cache.invalidate_by("channel-d") == 3
+    assert len(cache) == 0
+
+
+async def test_response_cache_shared_tier(monkeypatch: pytest.MonkeyPatch) -> None:
+    chatbot = await ChatBot(name="bot", secret_token="cache-secret").insert()  # noqa: S106
+    context = [DialogueMessage(role=MessageRole.USER, text="Какие часы работы?")]
+    key = response_key(chatbot, context)
+    monkeypatch.setattr(settings.response_cache, "shared", True)
+
+    await ResponseCache(settings.response_cache).set(key, chatbot, "С 9 до 18")
+    # Другой процесс с пустой памятью находит ответ в mongo
+    other = ResponseCache(settings.response_cache)
+    assert await other.get(key) == "С 9 до 18"
+    assert other.memory.get(key) == "С 9 до 18"
+
+    normalized = [DialogueMessage(role=MessageRole.USER, text="  какие часы   работы ")]
+    assert response_key(chatbot, normalized) == key
+    other_bot = ChatBot(id=PydanticObjectId(), name="bot", secret_token="other")  # noqa: S106
+    assert response_key(other_bot, context) != key
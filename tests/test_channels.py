@@ -1,13 +1,22 @@
 # tests/test_channels.py
+import asyncio
+import json
+
 import pytest
-from httpx import AsyncClient
 from bson import ObjectId
 from fastapi import status
+from httpx import AsyncClient
+
+from core import settings
+from core.database.migrations import MIGRATIONS, apply_migrations, migrate_embedded_histories, split_conversations
+from core.database.models import AppliedMigration, Conversation, Dialogue, Message, MessageRole, PurgeJob
+from core.database.purge import claim_purge, run_purge
 
 BASE_PATH = "/api/channel"
 
+
 @pytest.mark.asyncio
-async def test_create_and_update_channel(client: AsyncClient):
+async def test_create_and_update_channel(client: AsyncClient) -> None:
     # Создаем бота для теста
     bot_payload = {"name": "ChannelTestBot", "secret_token": "bot-secret"}
     bot_response = await client.post("/api/chatbots/", json=bot_payload)
@@ -20,9 +29,9 @@ async def test_create_and_update_channel(client: AsyncClient):
     create_response = await client.post(
         f"{BASE_PATH}/",
         params={"chat_bot_id": chatbot_id},
-        json=channel_payload
+        json=channel_payload,
     )
-    
+
     assert create_response.status_code == status.HTTP_201_CREATED
     channel_data = create_response.json()
     assert channel_data["chat_bot_id"] == chatbot_id
@@ -34,9 +43,9 @@ async def test_create_and_update_channel(client: AsyncClient):
     new_url = "https://updated-url.com/webhook"
     update_response = await client.put(
         f"{BASE_PATH}/{channel_id}",
-        json={"webhook_url": new_url}
+        json={"webhook_url": new_url},
     )
-    
+
     assert update_response.status_code == status.HTTP_200_OK
     assert update_response.json() == {}
 
@@ -48,8 +57,9 @@ async def test_create_and_update_channel(client: AsyncClient):
     assert updated is not None
     assert updated["webhook_url"] == new_url
 
+
 @pytest.mark.asyncio
-async def test_delete_channel(client: AsyncClient):
+async def test_delete_channel(client: AsyncClient) -> None:
     # Создаем бота
     bot_payload = {"name": "DeleteTestBot", "secret_token": "delete-secret"}
     bot_response = await client.post("/api/chatbots/", json=bot_payload)
@@ -61,7 +71,7 @@ async def test_delete_channel(client: AsyncClient):
     create_response = await client.post(
         f"{BASE_PATH}/",
         params={"chat_bot_id": chatbot_id},
-        json=channel_payload
+        json=channel_payload,
     )
     assert create_response.status_code == status.HTTP_201_CREATED
     channel_id = create_response.json()["_id"]
@@ -74,9 +84,10 @@ async def test_delete_channel(client: AsyncClient):
     get_response = await client.get(f"{BASE_PATH}/{channel_id}/messages")
     assert get_response.status_code == status.HTTP_404_NOT_FOUND
 
-#тест чисто по приколу
+
+# тест чисто по приколу
 @pytest.mark.asyncio
-async def test_list_channels(client: AsyncClient):
+async def test_list_channels(client: AsyncClient) -> None:
     # Очищаем предыдущие данные
     list_response = await client.get(f"{BASE_PATH}/")
     assert list_response.status_code == status.HTTP_200_OK
@@ -93,7 +104,7 @@ async def test_list_channels(client: AsyncClient):
     create1_response = await client.post(
         f"{BASE_PATH}/",
         params={"chat_bot_id": chatbot_id},
-        json=channel1_payload
+        json=channel1_payload,
     )
     assert create1_response.status_code == status.HTTP_201_CREATED
     channel1_id = create1_response.json()["_id"]
@@ -103,7 +114,7 @@ async def test_list_channels(client: AsyncClient):
     create2_response = await client.post(
         f"{BASE_PATH}/",
         params={"chat_bot_id": chatbot_id},
-        json=channel2_payload
+        json=channel2_payload,
     )
     assert create2_response.status_code == status.HTTP_201_CREATED
     channel2_id = create2_response.json()["_id"]
@@ -111,14 +122,15 @@ async def test_list_channels(client: AsyncClient):
     # Получаем список каналов
     list_response = await client.get(f"{BASE_PATH}/")
     assert list_response.status_code == status.HTTP_200_OK
-    
+
     channels = list_response.json()
     assert len(channels) == initial_count + 2
     assert any(ch["id"] == channel1_id for ch in channels)
     assert any(ch["id"] == channel2_id for ch in channels)
 
+
 @pytest.mark.asyncio
-async def test_get_channel_messages(client: AsyncClient):
+async def test_get_channel_messages(client: AsyncClient) -> None:
     # Создаем бота
     bot_payload = {"name": "MessagesTestBot", "secret_token": "messages-secret"}
     bot_response = await client.post("/api/chatbots/", json=bot_payload)
@@ -130,18 +142,15 @@ async def test_get_channel_messages(client: AsyncClient):
     create_response = await client.post(
         f"{BASE_PATH}/",
         params={"chat_bot_id": chatbot_id},
-        json=channel_payload
+        json=channel_payload,
     )
     assert create_response.status_code == status.HTTP_201_CREATED
     channel_id = create_response.json()["_id"]
 
     # Добавляем тестовые сообщения (через прямое обращение к модели)
-    from core.database.models import Dialogue
-    channel = await Dialogue.find_one({"_id": ObjectId(channel_id)})
-    if channel:
-        channel.message_list = [{"text": "Test message 1"}, {"text": "Test message 2"}]
-        await channel.save()
-    
+    await Message.append(ObjectId(channel_id), MessageRole.USER, "Test message 1")
+    await Message.append(ObjectId(channel_id), MessageRole.ASSISTANT, "Test message 2")
+
     # Получаем сообщения
     response = await client.get(f"{BASE_PATH}/{channel_id}/messages")
     assert response.status_code == status.HTTP_200_OK
@@ -151,21 +160,289 @@ async def test_get_channel_messages(client: AsyncClient):
     assert messages[0]["text"] == "Test message 1"
     assert messages[1]["text"] == "Test message 2"
 
+
+@pytest.mark.asyncio
+async def test_get_channel_messages_pagination(client: AsyncClient) -> None:
+    bot_response = await client.post("/api/chatbots/", json={"name": "PageBot", "secret_token": "page-secret"})
+    chatbot_id = bot_response.json()["id"]
+    create_response = await client.post(
+        f"{BASE_PATH}/",
+        params={"chat_bot_id": chatbot_id},
+        json={"webhook_url": "https://page-test.com/webhook"},
+    )
+    channel_id = create_response.json()["_id"]
+
+    for i in range(5):
+        await Message.append(ObjectId(channel_id), MessageRole.USER, f"Message {i}")
+
+    first_page = await client.get(f"{BASE_PATH}/{channel_id}/messages", params={"limit": 2})
+    assert first_page.status_code == status.HTTP_200_OK
+    assert [m["text"] for m in first_page.json()] == ["Message 0", "Message 1"]
+
+    next_page = await client.get(
+        f"{BASE_PATH}/{channel_id}/messages",
+        params={"limit": 2, "cursor": first_page.headers["X-Next-Cursor"]},
+    )
+    assert [m["text"] for m in next_page.json()] == ["Message 2", "Message 3"]
+
+
 @pytest.mark.asyncio
-async def test_not_found_cases(client: AsyncClient):
+async def test_chats_of_channel_have_separate_histories(client: AsyncClient) -> None:
+    channel = Dialogue(chat_bot_id=ObjectId(), webhook_url="https://chats-test.com/webhook")
+    await channel.insert()
+    for i in range(3):
+        await Message.append(channel.id, MessageRole.USER, f"A{i}", chat_id="chat-a")
+        await Message.append(channel.id, MessageRole.USER, f"B{i}", chat_id="chat-b")
+
+    assert await Conversation.find(Conversation.dialogue_id == channel.id).count() == 2
+    response = await client.get(f"{BASE_PATH}/{channel.id}/messages", params={"chat_id": "chat-b"})
+    assert [(m["text"], m["seq"]) for m in response.json()] == [("B0", 0), ("B1", 1), ("B2", 2)]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_appends_get_distinct_positions(client: AsyncClient) -> None:
+    channel = Dialogue(chat_bot_id=ObjectId(), webhook_url="https://append-test.com/webhook")
+    await channel.insert()
+
+    messages = await asyncio.gather(
+        *(Message.append(channel.id, MessageRole.USER, f"Message {i}") for i in range(10)),
+    )
+    assert sorted(m.seq for m in messages) == list(range(10))
+    # Ответ бота не создаёт разговор заново, если канал удалили во время генерации
+    assert await Message.append(ObjectId(), MessageRole.ASSISTANT, "orphan") is None
+
+
+@pytest.mark.asyncio
+async def test_migrate_embedded_history(client: AsyncClient) -> None:
+    dialogue_id = ObjectId()
+    await Dialogue.get_motor_collection().insert_one(
+        {
+            "_id": dialogue_id,
+            "chat_bot_id": ObjectId(),
+            "webhook_url": "https://legacy.com/webhook",
+            "message_list": [{"role": "user", "text": "old 1"}, {"role": "assistant", "text": "old 2"}],
+        },
+    )
+
+    assert await migrate_embedded_histories() == 1
+    # Повторный запуск ничего не делает
+    assert await migrate_embedded_histories() == 0
+
+    await Message.append(dialogue_id, MessageRole.USER, "new")
+    response = await client.get(f"{BASE_PATH}/{dialogue_id}/messages")
+    assert [m["text"] for m in response.json()] == ["old 1", "old 2", "new"]
+
+
+@pytest.mark.asyncio
+async def test_split_shared_counter_into_conversations(client: AsyncClient) -> None:
+    dialogue_id = ObjectId()
+    await Dialogue.get_motor_collection().insert_one(
+        {
+            "_id": dialogue_id,
+            "chat_bot_id": ObjectId(),
+            "webhook_url": "https://shared.com/webhook",
+            "next_seq": 3,
+            "summary": "mixed chats",
+            "summary_seq": 0,
+        },
+    )
+    await Message.get_motor_collection().insert_many(
+        [
+            {"dialogue_id": dialogue_id, "seq": 0, "role": "user", "text": "a0", "chat_id": "chat-a"},
+            {"dialogue_id": dialogue_id, "seq": 1, "role": "user", "text": "b1", "chat_id": "chat-b"},
+            {"dialogue_id": dialogue_id, "seq": 2, "role": "user", "text": "a2", "chat_id": "chat-a"},
+        ],
+    )
+
+    assert await split_conversations() == 1
+    assert await split_conversations() == 0
+
+    conversations = await Conversation.find(Conversation.dialogue_id == dialogue_id).to_list()
+    assert {c.chat_id: c.next_seq for c in conversations} == {"chat-a": 3, "chat-b": 2}
+    message = await Message.append(dialogue_id, MessageRole.USER, "b2", chat_id="chat-b")
+    assert message is not None
+    assert message.seq == 2
+    raw = await Dialogue.get_motor_collection().find_one({"_id": dialogue_id})
+    assert raw is not None
+    assert "next_seq" not in raw
+    assert "summary" not in raw
+
+
+@pytest.mark.asyncio
+async def test_migrations_apply_once() -> None:
+    # Новая база отмечена при инициализации, повторный старт миграций не запускает
+    assert await apply_migrations() == []
+
+    await AppliedMigration.get_motor_collection().delete_many({})
+    dialogue_id = ObjectId()
+    await Dialogue.get_motor_collection().insert_one(
+        {
+            "_id": dialogue_id,
+            "chat_bot_id": ObjectId(),
+            "webhook_url": "https://legacy.com/webhook",
+            "message_list": [{"role": "user", "text": "old"}],
+        },
+    )
+
+    assert await apply_migrations() == [migration.__name__ for migration in MIGRATIONS]
+    assert await Message.find(Message.dialogue_id == dialogue_id).count() == 1
+    raw = await Dialogue.get_motor_collection().find_one({"_id": dialogue_id})
+    assert raw is not None
+    assert "message_list" not in raw
+    assert raw["token_hash"] is not None
+    assert await apply_migrations() == []
+
+
+@pytest.mark.asyncio
+async def test_not_found_cases(client: AsyncClient) -> None:
     fake_id = "5f9d9b3d9c6d6f3a7c8b9a9a"  # Valid but non-existent ObjectId
-    
+
     # Обновление несуществующего канала
     update_response = await client.put(
         f"{BASE_PATH}/{fake_id}",
-        json={"webhook_url": "https://test.com"}
+        json={"webhook_url": "https://test.com"},
     )
     assert update_response.status_code == status.HTTP_404_NOT_FOUND
-    
+
     # Удаление несуществующего канала
     delete_response = await client.delete(f"{BASE_PATH}/{fake_id}")
     assert delete_response.status_code == status.HTTP_404_NOT_FOUND
-    
+
     # Получение сообщений несуществующего канала
     messages_response = await client.get(f"{BASE_PATH}/{fake_id}/messages")
-    assert messages_response.status_code == status.HTTP_404_NOT_FOUND
\ No newline at end of file
+    assert messages_response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.asyncio
+async def test_list_channels_cursor_pagination(client: AsyncClient) -> None:
+    bot_ids = []
+    for name in ("PagedBot1", "PagedBot2"):
+        bot_response = await client.post("/api/chatbots/", json={"name": name, "secret_token": f"{name}-secret"})
+        bot_ids.append(bot_response.json()["id"])
+
+    created = []
+    for i in range(5):
+        response = await client.post(
+            f"{BASE_PATH}/",
+            params={"chat_bot_id": bot_ids[i % 2]},
+            json={"webhook_url": f"https://paged-{i}.com/webhook"},
+        )
+        created.append(response.json()["_id"])
+
+    first_page = await client.get(f"{BASE_PATH}/", params={"limit": 3})
+    assert [ch["id"] for ch in first_page.json()] == created[:3]
+    assert "message_list" not in first_page.json()[0]
+    cursor = first_page.headers["X-Next-Cursor"]
+
+    last_page = await client.get(f"{BASE_PATH}/", params={"limit": 3, "cursor": cursor})
+    assert [ch["id"] for ch in last_page.json()] == created[3:]
+    assert "X-Next-Cursor" not in last_page.headers
+
+    by_bot = await client.get(f"{BASE_PATH}/", params={"chat_bot_id": bot_ids[1]})
+    assert [ch["id"] for ch in by_bot.json()] == [created[1], created[3]]
+
+
+@pytest.mark.asyncio
+async def test_export_channel_messages_ndjson(client: AsyncClient) -> None:
+    bot_response = await client.post("/api/chatbots/", json={"name": "ExportBot", "secret_token": "export-secret"})
+    create_response = await client.post(
+        f"{BASE_PATH}/",
+        params={"chat_bot_id": bot_response.json()["id"]},
+        json={"webhook_url": "https://export-test.com/webhook"},
+    )
+    channel_id = create_response.json()["_id"]
+    for i in range(4):
+        await Message.append(ObjectId(channel_id), MessageRole.USER, f"Message {i}")
+
+    response = await client.get(f"{BASE_PATH}/{channel_id}/messages/export")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"] == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["text"] for row in rows] == [f"Message {i}" for i in range(4)]
+
+    # Продолжение с последней полученной строки
+    resumed = await client.get(f"{BASE_PATH}/{channel_id}/messages/export", params={"after": rows[1]["id"]})
+    assert [json.loads(line)["text"] for line in resumed.text.splitlines()] == ["Message 2", "Message 3"]
+
+    missing = await client.get(f"{BASE_PATH}/{ObjectId()}/messages/export")
+    assert missing.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.asyncio
+async def test_create_channel_requires_existing_chatbot(client: AsyncClient) -> None:
+    response = await client.post(
+        f"{BASE_PATH}/",
+        params={"chat_bot_id": str(ObjectId())},
+        json={"webhook_url": "https://orphan-test.com/webhook"},
+    )
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    bulk_response = await client.post(
+        f"{BASE_PATH}/bulk",
+        json={"chat_bot_id": str(ObjectId()), "channels": [{"webhook_url": "https://orphan-test.com/webhook"}]},
+    )
+    assert bulk_response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.asyncio
+async def test_bulk_create_update_and_delete(client: AsyncClient) -> None:
+    bot_response = await client.post("/api/chatbots/", json={"name": "BulkBot", "secret_token": "bulk-secret"})
+    create_response = await client.post(
+        f"{BASE_PATH}/bulk",
+        json={
+            "chat_bot_id": bot_response.json()["id"],
+            "channels": [{"webhook_url": f"https://bulk-{i}.com/webhook"} for i in range(3)],
+        },
+    )
+    assert create_response.status_code == status.HTTP_201_CREATED
+    created = create_response.json()
+    assert all(ch["token"].startswith("ch_") and "token_hash" not in ch for ch in created)
+    ids = [ch["_id"] for ch in created]
+
+    update_response = await client.patch(
+        f"{BASE_PATH}/bulk",
+        json={"ids": ids[:2], "webhook_url": "https://bulk-moved.com/webhook"},
+    )
+    assert update_response.json() == {"matched": 2, "modified": 2}
+
+    delete_response = await client.post(f"{BASE_PATH}/bulk/delete", json={"ids": [ids[1], ids[2], str(ObjectId())]})
+    assert delete_response.json() == {"deleted": 2}
+
+    channels = (await client.get(f"{BASE_PATH}/")).json()
+    assert [(ch["id"], ch["webhook_url"]) for ch in channels] == [(ids[0], "https://bulk-moved.com/webhook")]
+    assert sorted(str(job.dialogue_id) for job in await PurgeJob.find_all().to_list()) == sorted(ids[1:])
+
+
+@pytest.mark.asyncio
+async def test_deleted_channel_history_is_purged_in_chunks(
+    client: AsyncClient,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(settings.purge, "chunk_size", 2)
+    monkeypatch.setattr(settings.purge, "pause", 0)
+    bot_response = await client.post("/api/chatbots/", json={"name": "PurgeBot", "secret_token": "purge-secret"})
+    channels = []
+    for i in range(2):
+        create_response = await client.post(
+            f"{BASE_PATH}/",
+            params={"chat_bot_id": bot_response.json()["id"]},
+            json={"webhook_url": f"https://purge-{i}.com/webhook"},
+        )
+        channels.append(ObjectId(create_response.json()["_id"]))
+        for j in range(5):
+            await Message.append(channels[i], MessageRole.USER, f"Message {j}", chat_id=f"chat-{j % 2}")
+
+    # Удаление отвечает сразу, история остаётся до фоновой очистки
+    delete_response = await client.delete(f"{BASE_PATH}/{channels[0]}")
+    assert delete_response.status_code == status.HTTP_204_NO_CONTENT
+    assert await Message.find(Message.dialogue_id == channels[0]).count() == 5
+
+    job = await claim_purge()
+    assert job is not None
+    await run_purge(job)
+
+    assert await Message.find(Message.dialogue_id == channels[0]).count() == 0
+    assert await Conversation.find(Conversation.dialogue_id == channels[0]).count() == 0
+    assert await Message.find(Message.dialogue_id == channels[1]).count() == 5
+    assert await PurgeJob.count() == 0
+    assert await claim_purge() is None
@@ -1,10 +1,14 @@
 import pytest
-from httpx import AsyncClient
 from fastapi import status
+from httpx import AsyncClient
+
+from core import settings
+from core.database.models import ChatBot, Dialogue, PurgeJob
 
 # Base path for the API
 BASE_PATH = "/api/chatbots"
 
+
 @pytest.mark.asyncio
 async def test_create_and_get_chatbot(client: AsyncClient) -> None:
     # Create a new chatbot
@@ -24,8 +28,9 @@ async def test_create_and_get_chatbot(client: AsyncClient) -> None:
     assert fetched.get("name") == payload["name"]
     assert fetched.get("secret_token") == payload["secret_token"]
 
+
 @pytest.mark.asyncio
-async def test_get_all_chatbots_empty_and_nonempty(client: AsyncClient):
+async def test_get_all_chatbots_empty_and_nonempty(client: AsyncClient) -> None:
     # Initially, no chatbots
     resp_empty = await client.get(BASE_PATH)
     assert resp_empty.status_code == status.HTTP_200_OK
@@ -43,8 +48,9 @@ async def test_get_all_chatbots_empty_and_nonempty(client: AsyncClient):
     assert len(data_list) == 1
     assert data_list[0]["name"] == payload["name"]
 
+
 @pytest.mark.asyncio
-async def test_update_chatbot_and_partial_update(client: AsyncClient):
+async def test_update_chatbot_and_partial_update(client: AsyncClient) -> None:
     # Create chatbot
     payload = {"name": "Original", "secret_token": "orig"}
     create_resp = await client.post(f"{BASE_PATH}/", json=payload)
@@ -66,8 +72,9 @@ async def test_update_chatbot_and_partial_update(client: AsyncClient):
     assert partial_data["name"] == "PartialOnly"
     assert partial_data["secret_token"] == update_payload["secret_token"]
 
+
 @pytest.mark.asyncio
-async def test_delete_chatbot_and_not_found_behaviour(client: AsyncClient):
+async def test_delete_chatbot_and_not_found_behaviour(client: AsyncClient) -> None:
     # Create chatbot
     payload = {"name": "ToDelete", "secret_token": "deltoken"}
     create_resp = await client.post(f"{BASE_PATH}/", json=payload)
@@ -92,3 +99,80 @@ async def test_delete_chatbot_and_not_found_behaviour(client: AsyncClient):
     del_resp2 = await client.delete(f"{BASE_PATH}/{chatbot_id}")
     assert del_resp2.status_code == status.HTTP_404_NOT_FOUND
     assert del_resp2.json()["detail"] == "ChatBot not found"
+
+
+@pytest.mark.asyncio
+async def test_secret_token_is_unique(client: AsyncClient) -> None:
+    await client.post(f"{BASE_PATH}/", json={"name": "First", "secret_token": "shared"})
+    duplicate_resp = await client.post(f"{BASE_PATH}/", json={"name": "Second", "secret_token": "shared"})
+    assert duplicate_resp.status_code == status.HTTP_409_CONFLICT
+
+    other_resp = await client.post(f"{BASE_PATH}/", json={"name": "Other", "secret_token": "other"})
+    update_resp = await client.put(f"{BASE_PATH}/{other_resp.json()['id']}", json={"secret_token": "shared"})
+    assert update_resp.status_code == status.HTTP_409_CONFLICT
+
+
+@pytest.mark.asyncio
+async def test_list_chatbots_cursor_pagination(client: AsyncClient) -> None:
+    for i in range(3):
+        await client.post(f"{BASE_PATH}/", json={"name": f"Paged{i}", "secret_token": f"paged-{i}"})
+
+    first_page = await client.get(BASE_PATH, params={"limit": 2})
+    assert [bot["name"] for bot in first_page.json()] == ["Paged0", "Paged1"]
+
+    next_page = await client.get(BASE_PATH, params={"limit": 2, "cursor": first_page.headers["X-Next-Cursor"]})
+    assert [bot["name"] for bot in next_page.json()] == ["Paged2"]
+    assert "X-Next-Cursor" not in next_page.headers
+
+
+@pytest.mark.asyncio
+async def test_delete_chatbot_cascades_to_channels(client: AsyncClient, monkeypatch: pytest.MonkeyPatch) -> None:
+    # Очистка ставится пачками по одному каналу
+    monkeypatch.setattr(settings.purge, "chunk_size", 1)
+    bot = (await client.post(f"{BASE_PATH}/", json={"name": "Cascade", "secret_token": "cascade"})).json()
+    other = (await client.post(f"{BASE_PATH}/", json={"name": "Kept", "secret_token": "kept"})).json()
+    channels = []
+    for chatbot in (bot, bot, other):
+        response = await client.post(
+            "/api/channel/",
+            params={"chat_bot_id": chatbot["id"]},
+            json={"webhook_url": "https://cascade-test.com/webhook"},
+        )
+        channels.append(response.json())
+    headers = {"Authorization": f"Bearer {channels[0]['token']}"}
+    message = {"message_id": "m-1", "chat_id": "chat-1", "text": "Привет", "message_sender": "employee"}
+    assert (await client.post("/api/webhook/new_message", json=message, headers=headers)).status_code == 200
+
+    await client.delete(f"{BASE_PATH}/{bot['id']}")
+
+    # Вебхук удалённого канала больше не проходит, в том числе из кэша токенов
+    response = await client.post("/api/webhook/new_message", json=message, headers=headers)
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    remaining = (await client.get("/api/channel/")).json()
+    assert [ch["id"] for ch in remaining] == [channels[2]["_id"]]
+    assert sorted(str(job.dialogue_id) for job in await PurgeJob.find_all().to_list()) == sorted(
+        ch["_id"] for ch in channels[:2]
+    )
+
+
+@pytest.mark.asyncio
+async def test_failed_chatbot_delete_leaves_no_live_channels(
+    client: AsyncClient,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    bot = (await client.post(f"{BASE_PATH}/", json={"name": "Crash", "secret_token": "crash"})).json()
+    await client.post(
+        "/api/channel/",
+        params={"chat_bot_id": bot["id"]},
+        json={"webhook_url": "https://crash-test.com/webhook"},
+    )
+
+    async def crash(self: ChatBot) -> None:
+        raise RuntimeError("crash")
+
+    monkeypatch.setattr(ChatBot, "delete", crash)
+    with pytest.raises(RuntimeError):
+        await client.delete(f"{BASE_PATH}/{bot['id']}")
+
+    # Бот остался, и повторный DELETE его удалит, но каналы уже не принимают вебхуки
+    assert await Dialogue.find_all().count() == 0
@@ -0,0 +1,93 @@
+import asyncio
+
+from predict.coalescer import TurnCoalescer
+from predict.scheduler import InferenceScheduler, SchedulerFullError
+
+
+async def test_burst_is_coalesced_into_one_call() -> None:
+    scheduler = InferenceScheduler(concurrency=4, max_queue=100)
+    coalescer = TurnCoalescer(scheduler, window=0.02)
+    calls: list[str] = []
+
+    async def reply(chat_id: str) -> None:
+        calls.append(chat_id)
+
+    for i in range(4):
+        coalescer.request("dialogue", "bot", lambda _, i=i: reply(f"chat-{i}"))
+    await asyncio.sleep(0.05)
+    await scheduler.drain()
+    await scheduler.stop()
+
+    assert calls == ["chat-3"]
+    assert coalescer.stats() == {"turns": 1, "coalesced": 3, "pending": 0}
+
+
+async def test_messages_during_generation_give_one_more_call() -> None:
+    scheduler = InferenceScheduler(concurrency=4, max_queue=100)
+    coalescer = TurnCoalescer(scheduler, window=0)
+    generating = asyncio.Event()
+    release = asyncio.Event()
+    calls = 0
+
+    superseded: list[bool] = []
+
+    async def reply(event: asyncio.Event) -> None:
+        nonlocal calls
+        calls += 1
+        generating.set()
+        await release.wait()
+        superseded.append(event.is_set())
+
+    coalescer.request("dialogue", "bot", reply)
+    await generating.wait()
+    for _ in range(3):
+        coalescer.request("dialogue", "bot", reply)
+    release.set()
+    await asyncio.sleep(0.01)
+    await scheduler.drain()
+    await scheduler.stop()
+
+    assert calls == 2
+    # Первый ход узнаёт, что его ответ устарел, повторный - нет
+    assert superseded == [True, False]
+    assert coalescer.stats()["pending"] == 0
+
+
+async def test_dialogues_are_not_coalesced_together() -> None:
+    scheduler = InferenceScheduler(concurrency=4, max_queue=100)
+    coalescer = TurnCoalescer(scheduler, window=0)
+    calls: list[str] = []
+
+    async def reply(dialogue: str) -> None:
+        calls.append(dialogue)
+
+    assert coalescer.request("first", "bot", lambda _: reply("first"))
+    assert coalescer.request("second", "bot", lambda _: reply("second"))
+    await asyncio.sleep(0.01)
+    await scheduler.drain()
+    await scheduler.stop()
+
+    assert sorted(calls) == ["first", "second"]
+
+
+async def test_turns_waiting_for_window_count_against_queue() -> None:
+    scheduler = InferenceScheduler(concurrency=1, max_queue=3)
+    coalescer = TurnCoalescer(scheduler, window=0.02)
+    release = asyncio.Event()
+    rejected = 0
+
+    for i in range(5):
+        try:
+            scheduler.admit()
+        except SchedulerFullError:
+            rejected += 1
+            continue
+        coalescer.request(f"dialogue-{i}", "bot", lambda _: release.wait())
+    await asyncio.sleep(0.05)
+
+    assert rejected == 2
+    assert scheduler.stats()["queue_depth"] + scheduler.stats()["in_flight"] == 3
+    assert scheduler.reserved == 0
+    release.set()
+    await scheduler.drain()
+    await scheduler.stop()
@@ -0,0 +1,63 @@
+import pytest
+from bson import ObjectId
+
+from core import settings
+from core.database.models import Conversation, Dialogue, Message, MessageRole
+from predict.context import build_context
+
+
+@pytest.fixture
+async def dialogue(monkeypatch: pytest.MonkeyPatch) -> Dialogue:
+    monkeypatch.setattr(settings.context, "max_turns", 3)
+    monkeypatch.setattr(settings.context, "max_tokens", 1000)
+    dialogue = Dialogue(chat_bot_id=ObjectId(), webhook_url="https://context-test.com/webhook")
+    await dialogue.insert()
+    return dialogue
+
+
+async def append(dialogue: Dialogue, *texts: str) -> None:
+    for text in texts:
+        await Message.append(dialogue.id, MessageRole.USER, text, chat_id="chat-1")
+
+
+async def test_short_dialogue_is_sent_whole(dialogue: Dialogue) -> None:
+    await append(dialogue, "a", "b")
+
+    context = await build_context(dialogue.id, "chat-1")
+    assert [m.text for m in context] == ["a", "b"]
+
+
+async def test_old_messages_are_folded_into_summary_once(dialogue: Dialogue) -> None:
+    await append(dialogue, "m0", "m1", "m2", "m3", "m4")
+
+    context = await build_context(dialogue.id, "chat-1")
+    assert context[0].role == MessageRole.SYSTEM
+    assert context[0].text.endswith("user: m0\nuser: m1")
+    assert [m.text for m in context[1:]] == ["m2", "m3", "m4"]
+
+    await append(dialogue, "m5")
+    context = await build_context(dialogue.id, "chat-1")
+    assert context[0].text.endswith("user: m0\nuser: m1\nuser: m2")
+    assert [m.text for m in context[1:]] == ["m3", "m4", "m5"]
+
+    stored = await Conversation.find_one(Conversation.dialogue_id == dialogue.id, Conversation.chat_id == "chat-1")
+    assert stored is not None
+    assert stored.summary_seq == 2
+
+
+async def test_window_respects_token_budget(dialogue: Dialogue, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings.context, "max_tokens", 30)
+    await append(dialogue, "x" * 100, "short")
+
+    context = await build_context(dialogue.id, "chat-1")
+    assert [m.text for m in context[1:]] == ["short"]
+    assert context[0].text.endswith("x" * 100)
+
+
+async def test_context_is_built_from_own_chat_only(dialogue: Dialogue) -> None:
+    await append(dialogue, "mine")
+    await Message.append(dialogue.id, MessageRole.USER, "someone else", chat_id="chat-2")
+
+    context = await build_context(dialogue.id, "chat-1")
+    assert [m.text for m in context] == ["mine"]
+    assert await build_context(dialogue.id, "chat-3") == []
@@ -0,0 +1,210 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+from bson import ObjectId
+from cryptography.fernet import Fernet
+from pydantic import SecretStr, ValidationError
+
+from core import settings
+from core.database.migrations import seal_outbox_tokens
+from core.database.models import DeliveryStatus, OutboxItem
+from core.settings_model import ChannelSettings, HttpClientSettings, ServerSettings, Settings
+from delivery.http_client import ChannelHttpClient
+from delivery.outbox import claim_next, enqueue_reply
+from delivery.worker import DeliveryWorkerPool, deliver
+
+
+async def test_connections_per_host_are_capped() -> None:
+    in_flight: dict[str, int] = {"slow.com": 0, "fast.com": 0}
+    peak: dict[str, int] = {"slow.com": 0, "fast.com": 0}
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        in_flight[host] += 1
+        peak[host] = max(peak[host], in_flight[host])
+        await asyncio.sleep(0.01 if host == "slow.com" else 0)
+        in_flight[host] -= 1
+        return httpx.Response(200)
+
+    client = ChannelHttpClient(HttpClientSettings(max_connections_per_host=2), transport=httpx.MockTransport(handler))
+    responses = await asyncio.gather(
+        *(client.post("https://slow.com/webhook", json={}) for _ in range(6)),
+        *(client.post("https://fast.com/webhook", json={}) for _ in range(2)),
+    )
+    await client.aclose()
+
+    assert all(r.status_code == httpx.codes.OK for r in responses)
+    assert peak == {"slow.com": 2, "fast.com": 2}
+    # Семафоры простаивающих хостов не копятся
+    assert client._host_slots == {}
+
+
+@pytest.fixture
+def channel_responses(monkeypatch: pytest.MonkeyPatch) -> list[int]:
+    """Коды ответов фейкового канала, по одному на запрос"""
+    codes: list[int] = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(codes.pop(0))
+
+    client = ChannelHttpClient(HttpClientSettings(), transport=httpx.MockTransport(handler))
+    monkeypatch.setattr("delivery.worker.get_http_client", lambda: client)
+    return codes
+
+
+async def test_reply_body_is_encoded_once(monkeypatch: pytest.MonkeyPatch) -> None:
+    bodies: list[bytes] = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        assert request.headers["content-type"] == "application/json"
+        bodies.append(request.content)
+        return httpx.Response(500 if len(bodies) == 1 else 200)
+
+    client = ChannelHttpClient(HttpClientSettings(), transport=httpx.MockTransport(handler))
+    monkeypatch.setattr("delivery.worker.get_http_client", lambda: client)
+    monkeypatch.setattr(settings.delivery, "backoff_base", 0)
+    queued = await enqueue_reply(ObjectId(), "https://channel.com/webhook", "token", "chat-1", "Ответ")
+
+    for _ in range(2):
+        item = await claim_next()
+        assert item is not None
+        await deliver(item)
+
+    assert bodies == [queued.body, queued.body]
+    assert json.loads(bodies[0]) == {"event_type": "new_message", "chat_id": "chat-1", "text": "Ответ"}
+
+
+async def test_delivered_reply_leaves_outbox(channel_responses: list[int]) -> None:
+    channel_responses.append(200)
+    await enqueue_reply(ObjectId(), "https://channel.com/webhook", "token", "chat-1", "Ответ")
+
+    item = await claim_next()
+    assert item is not None
+    assert item.status == DeliveryStatus.IN_PROGRESS
+    assert await claim_next() is None
+
+    await deliver(item)
+    assert await OutboxItem.count() == 0
+
+
+async def test_failed_reply_is_retried_then_dead_lettered(
+    channel_responses: list[int],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(settings.delivery, "max_attempts", 2)
+    monkeypatch.setattr(settings.delivery, "backoff_base", 0)
+    channel_responses.extend([500, 503])
+    queued = await enqueue_reply(ObjectId(), "https://channel.com/webhook", "token", "chat-1", "Ответ")
+
+    item = await claim_next()
+    assert item is not None
+    await deliver(item)
+    item = await OutboxItem.get(queued.id)
+    assert item is not None
+    assert (item.status, item.attempts) == (DeliveryStatus.PENDING, 1)
+    assert item.sealed_token is not None
+
+    item = await claim_next()
+    assert item is not None
+    await deliver(item)
+    item = await OutboxItem.get(queued.id)
+    assert item is not None
+    assert (item.status, item.attempts) == (DeliveryStatus.DEAD, 2)
+    assert "503" in (item.last_error or "")
+    assert item.sealed_token is None
+    assert await claim_next() is None
+
+
+async def test_channel_token_is_stored_encrypted(monkeypatch: pytest.MonkeyPatch) -> None:
+    authorization: list[str] = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        authorization.append(request.headers["authorization"])
+        return httpx.Response(200)
+
+    client = ChannelHttpClient(HttpClientSettings(), transport=httpx.MockTransport(handler))
+    monkeypatch.setattr("delivery.worker.get_http_client", lambda: client)
+    await enqueue_reply(ObjectId(), "https://channel.com/webhook", "ch_secret", "chat-1", "Ответ")
+
+    raw = await OutboxItem.get_motor_collection().find_one()
+    assert raw is not None
+    assert "token" not in raw
+    assert b"ch_secret" not in raw["sealed_token"]
+
+    item = await claim_next()
+    assert item is not None
+    await deliver(item)
+    assert authorization == ["Bearer ch_secret"]
+
+
+async def test_unreadable_token_is_retried(channel_responses: list[int], monkeypatch: pytest.MonkeyPatch) -> None:
+    queued = await enqueue_reply(ObjectId(), "https://channel.com/webhook", "token", "chat-1", "Ответ")
+    # Ответ поставил процесс с другим ключом, его ещё может доставить процесс с нужным
+    monkeypatch.setattr("core.tokens._outbox_fernet", Fernet(Fernet.generate_key()))
+
+    item = await claim_next()
+    assert item is not None
+    await deliver(item)
+
+    item = await OutboxItem.get(queued.id)
+    assert item is not None
+    assert (item.status, item.attempts) == (DeliveryStatus.PENDING, 1)
+    assert item.sealed_token is not None
+    assert channel_responses == []
+
+
+def test_several_workers_require_outbox_key() -> None:
+    with pytest.raises(ValidationError, match="CHANNEL__OUTBOX_KEY"):
+        Settings(mongo=settings.mongo, server=ServerSettings(workers=2), channel=ChannelSettings())
+    Settings(
+        mongo=settings.mongo,
+        server=ServerSettings(workers=2),
+        channel=ChannelSettings(outbox_key=SecretStr(Fernet.generate_key().decode())),
+    )
+
+
+async def test_plaintext_tokens_are_sealed() -> None:
+    outbox = OutboxItem.get_motor_collection()
+    legacy = {"dialogue_id": ObjectId(), "url": "https://channel.com/webhook", "token": "ch_secret"}
+    pending = await outbox.insert_one({**legacy, "status": DeliveryStatus.PENDING})
+    dead = await outbox.insert_one({**legacy, "status": DeliveryStatus.DEAD})
+
+    assert await seal_outbox_tokens() == 2
+    assert await seal_outbox_tokens() == 0
+
+    item = await OutboxItem.get(pending.inserted_id)
+    assert item is not None
+    assert item.sealed_token is not None
+    raw = await outbox.find_one({"_id": dead.inserted_id})
+    assert raw is not None
+    assert "token" not in raw
+    assert "sealed_token" not in raw
+
+
+async def test_expired_lease_is_reclaimed(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings.delivery, "lease", 0)
+    await enqueue_reply(ObjectId(), "https://channel.com/webhook", "token", "chat-1", "Ответ")
+
+    first = await claim_next()
+    second = await claim_next()
+    assert first is not None
+    assert second is not None
+    assert (first.id, second.attempts) == (second.id, 2)
+
+
+async def test_worker_pool_delivers_queued_reply(channel_responses: list[int]) -> None:
+    channel_responses.append(200)
+    pool = DeliveryWorkerPool(size=2, poll_interval=0.05)
+    pool.start()
+    await enqueue_reply(ObjectId(), "https://channel.com/webhook", "token", "chat-1", "Ответ")
+
+    for _ in range(50):
+        if await OutboxItem.count() == 0:
+            break
+        await asyncio.sleep(0.01)
+    await pool.stop()
+
+    assert await OutboxItem.count() == 0
+    assert channel_responses == []
@@ -0,0 +1,95 @@
+from typing import Any
+
+import pytest
+from beanie import Document
+
+from core.database.cache import channel_token_query
+from core.database.models import ChatBot, Conversation, Dialogue, Message, MessageArchive, MessageRole, OutboxItem
+from core.tokens import hash_token, new_channel_token
+
+
+def plan_stages(plan: Any) -> set[str]:
+    """Собрать все стадии плана запроса, включая вложенные"""
+    if isinstance(plan, list):
+        return set().union(*(plan_stages(item) for item in plan))
+    if not isinstance(plan, dict):
+        return set()
+    stages = {plan["stage"]} if "stage" in plan else set()
+    return stages.union(*(plan_stages(value) for value in plan.values()))
+
+
+def plan_indexes(plan: Any) -> set[str]:
+    """Собрать имена индексов всех IXSCAN плана"""
+    if isinstance(plan, list):
+        return set().union(*(plan_indexes(item) for item in plan))
+    if not isinstance(plan, dict):
+        return set()
+    indexes = {plan["indexName"]} if plan.get("stage") == "IXSCAN" else set()
+    return indexes.union(*(plan_indexes(value) for value in plan.values()))
+
+
+async def winning_plan(model: type[Document], query: dict, sort: list | None = None) -> dict:
+    cursor = model.get_motor_collection().find(query)
+    if sort:
+        cursor = cursor.sort(sort)
+    explain = await cursor.explain()
+    return explain["queryPlanner"]["winningPlan"]
+
+
+async def winning_plan_stages(model: type[Document], query: dict, sort: list | None = None) -> set[str]:
+    return plan_stages(await winning_plan(model, query, sort))
+
+
+@pytest.fixture
+async def dialogue() -> Dialogue:
+    chatbot = ChatBot(name="IndexBot", secret_token="index-secret")  # noqa: S106
+    await chatbot.insert()
+    dialogue = Dialogue(
+        chat_bot_id=chatbot.id,
+        webhook_url="https://index-test.com/webhook",
+        token_hash=hash_token(new_channel_token()),
+    )
+    await dialogue.insert()
+    for i in range(3):
+        await Message.append(dialogue.id, MessageRole.USER, f"Message {i}", message_id=f"m-{i}", chat_id="chat-1")
+    return dialogue
+
+
+def hot_path_queries(dialogue: Dialogue) -> dict[str, tuple[type[Document], dict, list | None]]:
+    return {
+        "chatbot_by_token": (ChatBot, {"secret_token": "index-secret"}, None),
+        "channel_by_token": (Dialogue, channel_token_query(dialogue.token_hash or ""), None),
+        "channels_by_chatbot": (Dialogue, {"chat_bot_id": dialogue.chat_bot_id}, None),
+        "conversation": (Conversation, {"dialogue_id": dialogue.id, "chat_id": "chat-1"}, None),
+        "context_tail": (Message, {"dialogue_id": dialogue.id, "chat_id": "chat-1"}, [("seq", -1)]),
+        "messages_page": (Message, {"dialogue_id": dialogue.id, "_id": {"$gt": dialogue.id}}, [("_id", 1)]),
+        "message_by_channel_id": (Message, {"dialogue_id": dialogue.id, "message_id": "m-1"}, None),
+        "outbox_purge": (OutboxItem, {"dialogue_id": dialogue.id}, None),
+        "archive_purge": (MessageArchive, {"dialogue_id": dialogue.id}, None),
+    }
+
+
+@pytest.mark.parametrize(
+    "name",
+    [
+        "chatbot_by_token",
+        "channel_by_token",
+        "channels_by_chatbot",
+        "conversation",
+        "context_tail",
+        "messages_page",
+        "message_by_channel_id",
+        "outbox_purge",
+        "archive_purge",
+    ],
+)
+async def test_hot_path_queries_use_indexes(dialogue: Dialogue, name: str) -> None:
+    model, query, sort = hot_path_queries(dialogue)[name]
+    assert "COLLSCAN" not in await winning_plan_stages(model, query, sort)
+
+
+async def test_channel_token_lookup_uses_both_token_indexes(dialogue: Dialogue) -> None:
+    # Ветка прошлого токена без своего индекса превратила бы весь $or в COLLSCAN
+    plan = await winning_plan(Dialogue, channel_token_query(dialogue.token_hash or ""))
+    assert "COLLSCAN" not in plan_stages(plan)
+    assert plan_indexes(plan) == {"token_hash_1", "previous_token_hash_1"}
@@ -0,0 +1,113 @@
+import asyncio
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
+import pytest
+from httpx import AsyncClient
+from pymongo.errors import AutoReconnect, OperationFailure
+
+from core import settings
+from core.database.cache import channel_cache, chatbot_cache, chatbot_id_cache, resolve_channel, resolve_chatbot
+from core.database.invalidation import CacheInvalidator, Change
+from core.database.models import ChatBot, Dialogue
+
+
+class LocalChangeStream:
+    """Подмена change stream mongo: события и обрывы подаются из теста"""
+
+    def __init__(self) -> None:
+        self.opened: list[Change | None] = []
+        self._queue: asyncio.Queue[Change | Exception] = asyncio.Queue()
+
+    def push(self, change: Change | Exception) -> None:
+        self._queue.put_nowait(change)
+
+    @asynccontextmanager
+    async def __call__(self, resume_after: Change | None) -> AsyncIterator[AsyncIterator[Change]]:
+        self.opened.append(resume_after)
+        yield self._events()
+
+    async def _events(self) -> AsyncIterator[Change]:
+        while True:
+            item = await self._queue.get()
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+
+def update_event(document: ChatBot | Dialogue, token: int) -> Change:
+    return {
+        "_id": {"_data": token},
+        "operationType": "update",
+        "ns": {"db": settings.mongo.db_name, "coll": type(document).get_collection_name()},
+        "documentKey": {"_id": document.id},
+    }
+
+
+async def settle() -> None:
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+@pytest.fixture
+async def stream() -> AsyncIterator[LocalChangeStream]:
+    stream = LocalChangeStream()
+    invalidator = CacheInvalidator(stream, retry_max=0)
+    invalidator.start()
+    await settle()
+    yield stream
+    await invalidator.stop()
+
+
+async def create_channel(client: AsyncClient) -> tuple[Dialogue, str]:
+    bot = await client.post("/api/chatbots/", json={"name": "StreamBot", "secret_token": "stream-secret"})
+    response = await client.post(
+        "/api/channel/",
+        params={"chat_bot_id": bot.json()["id"]},
+        json={"webhook_url": "https://stream-test.com/webhook"},
+    )
+    channel = await Dialogue.get(response.json()["_id"])
+    return channel, response.json()["token"]
+
+
+async def test_changes_from_other_workers_evict_entries(client: AsyncClient, stream: LocalChangeStream) -> None:
+    channel, token = await create_channel(client)
+    chatbot = await resolve_chatbot("stream-secret")
+    assert await resolve_channel(token) is not None
+    assert len(channel_cache) == len(chatbot_cache) == 1
+    assert channel_cache.ttl == settings.cache.stream_ttl
+
+    stream.push(update_event(channel, 1))
+    stream.push(update_event(chatbot, 2))
+    await settle()
+
+    assert len(channel_cache) == len(chatbot_cache) == len(chatbot_id_cache) == 0
+
+
+async def test_stream_loss_clears_caches_and_resumes(client: AsyncClient, stream: LocalChangeStream) -> None:
+    channel, token = await create_channel(client)
+    stream.push(update_event(channel, 1))
+    await settle()
+    await resolve_channel(token)
+
+    stream.push(AutoReconnect("primary stepped down"))
+    await settle()
+
+    # Изменения за время обрыва неизвестны: кэш пуст, поток продолжается с последнего события
+    assert len(channel_cache) == 0
+    assert stream.opened == [None, {"_data": 1}]
+    assert channel_cache.ttl == settings.cache.stream_ttl
+
+
+async def test_without_change_streams_caches_use_ttl() -> None:
+    stream = LocalChangeStream()
+    invalidator = CacheInvalidator(stream, retry_max=0)
+    invalidator.start()
+    stream.push(OperationFailure("The $changeStream stage is only supported on replica sets", code=40573))
+    await settle()
+
+    # Без повторных попыток: на standalone mongod поток не появится
+    assert stream.opened == [None]
+    assert not invalidator.connected
+    assert channel_cache.ttl == settings.cache.ttl
+    await invalidator.stop()
@@ -0,0 +1,54 @@
+import asyncio
+
+import httpx
+import pytest
+
+from core.database.models import DialogueMessage, MessageRole
+from core.settings_model import LLMSettings
+from predict.llm import HttpBackend, MockBackend, generate
+
+MESSAGES = [DialogueMessage(role=MessageRole.USER, text="Привет")]
+
+
+async def test_mock_backend_streams_tokens() -> None:
+    backend = MockBackend(0, 0)
+    tokens = [token async for token in backend.stream(MESSAGES)]
+
+    assert len(tokens) > 1
+    assert "".join(tokens) == MockBackend.reply
+    assert await generate(backend, MESSAGES, deadline=1) == MockBackend.reply
+
+
+async def test_generation_past_deadline_is_cancelled() -> None:
+    with pytest.raises(TimeoutError):
+        await generate(MockBackend(10, 10), MESSAGES, deadline=0.01)
+
+
+async def test_superseded_generation_is_abandoned() -> None:
+    superseded = asyncio.Event()
+    asyncio.get_running_loop().call_later(0.01, superseded.set)
+
+    assert await generate(MockBackend(10, 10), MESSAGES, deadline=1, superseded=superseded) is None
+
+
+async def test_http_backend_reads_openai_stream() -> None:
+    requests: list[dict] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(httpx.Response(200, content=request.content).json())
+        chunks = [
+            'data: {"choices": [{"delta": {"role": "assistant"}}]}',
+            'data: {"choices": [{"delta": {"content": "Здравствуйте"}}]}',
+            'data: {"choices": [{"delta": {"content": "!"}}]}',
+            "data: [DONE]",
+        ]
+        return httpx.Response(200, text="\n\n".join(chunks), headers={"content-type": "text/event-stream"})
+
+    backend = HttpBackend(LLMSettings(http_model="test-model"), transport=httpx.MockTransport(handler))
+    reply = await generate(backend, MESSAGES, deadline=1)
+    await backend.aclose()
+
+    assert reply == "Здравствуйте!"
+    assert requests[0]["model"] == "test-model"
+    assert requests[0]["stream"] is True
+    assert requests[0]["messages"] == [{"role": "user", "content": "Привет"}]
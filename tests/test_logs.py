@@ -0,0 +1,75 @@
+import io
+import json
+import logging
+import time
+from collections.abc import Iterator
+
+import pytest
+from loguru import logger
+
+from core.logs import BackgroundSink, UvicornHandler, json_format
+
+
+def access_record(status: int) -> logging.LogRecord:
+    return logging.LogRecord(
+        "uvicorn.access",
+        logging.INFO,
+        __file__,
+        0,
+        '%s - "%s %s HTTP/%s" %d',
+        ("127.0.0.1:50000", "POST", "/api/webhook/new_message", "1.1", status),
+        None,
+    )
+
+
+@pytest.fixture
+def captured() -> Iterator[list[str]]:
+    try:
+        logger.level("REQUEST")
+    except ValueError:
+        logger.level("REQUEST", no=38)
+    messages: list[str] = []
+    handler_id = logger.add(messages.append, format="{message}")
+    yield messages
+    logger.remove(handler_id)
+
+
+def test_access_log_sampling_keeps_server_errors(captured: list[str]) -> None:
+    handler = UvicornHandler(find_caller=False, access_sample_rate=0.0)
+
+    handler.emit(access_record(200))
+    handler.emit(access_record(502))
+
+    assert [m.rstrip() for m in captured] == ['127.0.0.1:50000 - "POST /api/webhook/new_message HTTP/1.1" 502']
+
+
+def test_json_lines_go_through_background_sink() -> None:
+    stream = io.StringIO()
+    handler_id = logger.add(BackgroundSink(stream), format=json_format, colorize=False)
+
+    logger.bind(dialogue_id="d-1").info("Привет")
+    logger.remove(handler_id)
+
+    entry = json.loads(stream.getvalue())
+    assert entry["message"] == "Привет"
+    assert entry["level"] == "INFO"
+    assert entry["dialogue_id"] == "d-1"
+
+
+class SlowStream(io.StringIO):
+    def write(self, s: str) -> int:
+        time.sleep(0.01)
+        return super().write(s)
+
+
+async def test_complete_waits_for_queued_records() -> None:
+    stream = SlowStream()
+    handler_id = logger.add(BackgroundSink(stream), format="{message}", colorize=False)
+
+    for i in range(20):
+        logger.info(f"Запись {i}")
+    # Как при остановке приложения: lifespan ждёт logger.complete(), sink остаётся подключённым
+    await logger.complete()
+
+    assert stream.getvalue().splitlines()[-1] == "Запись 19"
+    logger.remove(handler_id)
@@ -0,0 +1,43 @@
+from types import SimpleNamespace
+from typing import Any
+
+from fastapi import status
+from httpx import AsyncClient
+from prometheus_client import REGISTRY
+
+from core.metrics import MongoCommandListener
+
+
+def sample(name: str, labels: dict[str, str]) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+async def test_metrics_endpoint_exposes_route_latency(client: AsyncClient) -> None:
+    await client.get("/api/hello_world")
+
+    response = await client.get("/metrics")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'http_request_duration_seconds_count{method="GET",route="/api/hello_world",status="200"}' in response.text
+
+
+async def test_routes_are_labelled_by_template(client: AsyncClient) -> None:
+    labels = {"method": "GET", "route": "/api/channel/{channel_id}/messages", "status": "404"}
+    before = sample("http_request_duration_seconds_count", labels)
+
+    await client.get("/api/channel/5f9d9b3d9c6d6f3a7c8b9a9a/messages")
+
+    assert sample("http_request_duration_seconds_count", labels) == before + 1
+
+
+def test_mongo_listener_times_commands_by_collection() -> None:
+    listener = MongoCommandListener()
+    labels = {"collection": "messages", "operation": "find"}
+    before = sample("mongo_operation_duration_seconds_count", labels)
+
+    event: Any = SimpleNamespace(request_id=1, command_name="find", command={"find": "messages"})
+    listener.started(event)
+    listener.succeeded(SimpleNamespace(request_id=1, command_name="find", duration_micros=1500))  # type: ignore[arg-type]
+
+    assert sample("mongo_operation_duration_seconds_count", labels) == before + 1
+    assert listener._collections == {}
@@ -0,0 +1,67 @@
+import pytest
+
+from core.database.rate_limit import MongoRateLimiter
+from core.rate_limit import InMemoryRateLimiter
+from core.settings_model import RateLimit
+
+LIMIT = RateLimit(rate=1.0, burst=3.0)
+
+
+async def test_bucket_allows_burst_then_refills(monkeypatch: pytest.MonkeyPatch) -> None:
+    now = 1000.0
+    monkeypatch.setattr("core.rate_limit.time.monotonic", lambda: now)
+    limiter = InMemoryRateLimiter(maxsize=10)
+
+    assert [await limiter.acquire("k", LIMIT) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert await limiter.acquire("k", LIMIT) == pytest.approx(1.0)
+    assert await limiter.acquire("other", LIMIT) == 0.0
+
+    now += 2
+    assert await limiter.acquire("k", LIMIT, cost=2) == 0.0
+    assert await limiter.acquire("k", LIMIT) > 0
+    assert limiter.rejected == 2
+
+
+async def test_oversized_batch_goes_into_debt(monkeypatch: pytest.MonkeyPatch) -> None:
+    now = 1000.0
+    monkeypatch.setattr("core.rate_limit.time.monotonic", lambda: now)
+    limiter = InMemoryRateLimiter(maxsize=10)
+
+    assert await limiter.acquire("k", LIMIT, cost=5) == 0.0
+    # Долг в 2 токена плюс один на новый запрос
+    assert await limiter.acquire("k", LIMIT) == pytest.approx(3.0)
+
+
+async def test_bucket_count_is_bounded() -> None:
+    limiter = InMemoryRateLimiter(maxsize=2)
+    for key in ("a", "b", "c"):
+        await limiter.acquire(key, LIMIT)
+    assert len(limiter) == 2
+
+
+async def test_disabled_limit_is_not_tracked() -> None:
+    limiter = InMemoryRateLimiter(maxsize=2)
+    assert await limiter.acquire("k", RateLimit(rate=0, burst=0), cost=100) == 0.0
+    assert len(limiter) == 0
+
+
+async def test_shared_bucket_is_stored_in_mongo() -> None:
+    limiter = MongoRateLimiter()
+    slow = RateLimit(rate=0.001, burst=2.0)
+
+    assert await limiter.acquire("shared", slow) == 0.0
+    # Второй экземпляр видит ту же корзину, как воркер в другом процессе
+    assert await MongoRateLimiter().acquire("shared", slow) == 0.0
+    assert await limiter.acquire("shared", slow) > 0
+    assert limiter.rejected == 1
+
+
+async def test_refund_returns_spent_tokens() -> None:
+    slow = RateLimit(rate=0.001, burst=2.0)
+    for limiter in (InMemoryRateLimiter(maxsize=10), MongoRateLimiter()):
+        assert await limiter.acquire("refund", slow, cost=2) == 0.0
+        await limiter.refund("refund", slow, cost=2)
+        # Возврат не поднимает корзину выше burst
+        await limiter.refund("refund", slow, cost=2)
+        assert await limiter.acquire("refund", slow, cost=2) == 0.0
+        assert await limiter.acquire("refund", slow) > 0
@@ -0,0 +1,105 @@
+from datetime import UTC, datetime, timedelta
+
+import pytest
+from bson import ObjectId
+from httpx import AsyncClient
+
+from core import settings
+from core.database.models import Message, MessageArchive, MessageRole, ScheduledJob
+from core.database.models.scheduled_job import LeaseLostError
+from core.database.purge import claim_purge, run_purge
+from core.database.retention import JOB_NAME, compact_all, run_compaction
+
+
+async def create_channel(client: AsyncClient, **retention: float) -> ObjectId:
+    bot = await client.post("/api/chatbots/", json={"name": "RetentionBot", "secret_token": "retention", **retention})
+    response = await client.post(
+        "/api/channel/",
+        params={"chat_bot_id": bot.json()["id"]},
+        json={"webhook_url": "https://retention-test.com/webhook"},
+    )
+    return ObjectId(response.json()["_id"])
+
+
+async def test_messages_over_count_are_archived(client: AsyncClient, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings.retention, "chunk_size", 2)
+    monkeypatch.setattr(settings.retention, "pause", 0)
+    channel_id = await create_channel(client, retention_messages=3)
+    for i in range(7):
+        await Message.append(channel_id, MessageRole.USER, f"Вопрос {i}", chat_id="chat-1")
+    for i in range(2):
+        await Message.append(channel_id, MessageRole.USER, f"Другой чат {i}", chat_id="chat-2")
+
+    assert await compact_all() == 4
+
+    kept = await Message.find(Message.dialogue_id == channel_id).sort(+Message.id).to_list()
+    assert [m.text for m in kept] == ["Вопрос 4", "Вопрос 5", "Вопрос 6", "Другой чат 0", "Другой чат 1"]
+    archives = await MessageArchive.find_all().sort(+MessageArchive.first_seq).to_list()
+    assert [(a.first_seq, a.last_seq, a.message_count) for a in archives] == [(0, 1, 2), (2, 3, 2)]
+    assert [m.text for a in archives for m in a.unpack()] == [f"Вопрос {i}" for i in range(4)]
+    assert await compact_all() == 0
+
+
+async def test_messages_over_age_are_archived(client: AsyncClient) -> None:
+    channel_id = await create_channel(client, retention_days=30)
+    for i in range(3):
+        await Message.append(channel_id, MessageRole.USER, f"Вопрос {i}", chat_id="chat-1")
+    old = datetime.now(UTC) - timedelta(days=31)
+    await Message.find(Message.dialogue_id == channel_id, Message.seq < 2).update({"$set": {"created_at": old}})
+
+    assert await compact_all() == 2
+    assert [m.text for m in await Message.find(Message.dialogue_id == channel_id).to_list()] == ["Вопрос 2"]
+
+
+async def test_archive_is_purged_with_channel(client: AsyncClient) -> None:
+    channel_id = await create_channel(client, retention_messages=1)
+    for i in range(3):
+        await Message.append(channel_id, MessageRole.USER, f"Вопрос {i}", chat_id="chat-1")
+    assert await compact_all() == 2
+    assert await MessageArchive.count() == 1
+
+    await client.delete(f"/api/channel/{channel_id}")
+    job = await claim_purge()
+    assert job is not None
+    await run_purge(job)
+
+    assert await MessageArchive.count() == 0
+    assert await Message.count() == 0
+
+
+async def test_scheduled_run_is_leased_once() -> None:
+    lease = await ScheduledJob.acquire("retention", 0, 3600)
+    assert lease is not None
+    # Срок следующего запуска подошёл, но первый ещё идёт
+    assert await ScheduledJob.acquire("retention", 0, 3600) is None
+    assert await ScheduledJob.acquire("retention", 0, 3600, force=True) is None
+    assert await ScheduledJob.acquire("other", 0, 3600) is not None
+
+    await lease.release()
+    assert await ScheduledJob.acquire("retention", 3600, 3600) is not None
+    assert await ScheduledJob.acquire("retention", 3600, 3600) is None
+
+
+async def test_expired_lease_is_taken_over() -> None:
+    stalled = await ScheduledJob.acquire("retention", 0, 0)
+    assert stalled is not None
+    assert await ScheduledJob.acquire("retention", 0, 3600) is not None
+
+    with pytest.raises(LeaseLostError):
+        await stalled.renew()
+
+
+async def test_compaction_does_not_overlap(client: AsyncClient) -> None:
+    channel_id = await create_channel(client, retention_messages=1)
+    for i in range(3):
+        await Message.append(channel_id, MessageRole.USER, f"Вопрос {i}", chat_id="chat-1")
+    running = await ScheduledJob.acquire(JOB_NAME, 3600, 3600)
+    assert running is not None
+
+    # Запуск из CLI не идёт поверх уже идущей архивации
+    assert await run_compaction(3600, force=True) is None
+    assert await MessageArchive.count() == 0
+
+    await running.release()
+    assert await run_compaction(3600, force=True) == 2
+    assert await MessageArchive.count() == 1
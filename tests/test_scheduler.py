@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+from predict.scheduler import InferenceScheduler, SchedulerFullError
+
+
+async def test_concurrency_is_limited() -> None:
+    scheduler = InferenceScheduler(concurrency=2, max_queue=100)
+    running = 0
+    peak = 0
+
+    async def job() -> None:
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    for i in range(6):
+        scheduler.submit(f"bot-{i % 3}", job)
+    await scheduler.drain()
+    await scheduler.stop()
+
+    assert peak == 2
+    assert scheduler.stats()["queue_depth"] == 0
+    assert scheduler.stats()["wait_time_max"] > 0
+
+
+async def test_chatbots_are_served_round_robin() -> None:
+    scheduler = InferenceScheduler(concurrency=1, max_queue=100)
+    order: list[str] = []
+
+    async def job(key: str) -> None:
+        order.append(key)
+        await asyncio.sleep(0)
+
+    # Всплеск одного бота не должен задерживать второго
+    for _ in range(3):
+        scheduler.submit("noisy", lambda: job("noisy"))
+    scheduler.submit("quiet", lambda: job("quiet"))
+    await scheduler.drain()
+    await scheduler.stop()
+
+    assert order == ["noisy", "quiet", "noisy", "noisy"]
+
+
+async def test_failed_job_does_not_stop_worker() -> None:
+    scheduler = InferenceScheduler(concurrency=1, max_queue=100)
+
+    async def broken() -> None:
+        raise RuntimeError
+
+    scheduler.submit("bot", broken)
+    scheduler.submit("bot", lambda: asyncio.sleep(0))
+    await scheduler.drain()
+    await scheduler.stop()
+
+    assert (scheduler.completed, scheduler.failed) == (1, 1)
+
+
+async def test_admit_rejects_when_queue_is_full() -> None:
+    scheduler = InferenceScheduler(concurrency=1, max_queue=1)
+    release = asyncio.Event()
+    scheduler.admit()
+    scheduler.submit("bot", release.wait)
+    await asyncio.sleep(0)
+    scheduler.admit()
+    scheduler.submit("bot", release.wait)
+
+    with pytest.raises(SchedulerFullError):
+        scheduler.admit()
+    assert scheduler.rejected == 1
+
+    release.set()
+    await scheduler.stop()
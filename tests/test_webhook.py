@@ -0,0 +1,316 @@
+import asyncio
+from typing import NoReturn
+
+import pytest
+from bson import ObjectId
+from fastapi import status
+from httpx import AsyncClient
+
+from core import settings
+from core.database.cache import channel_cache
+from core.database.migrations import hash_legacy_channel_tokens
+from core.database.models import Dialogue, DialogueMessage, Message
+from core.settings_model import RateLimit
+from predict.coalescer import inference_coalescer
+from predict.llm import LLMBackend
+from predict.scheduler import inference_scheduler
+
+BASE_PATH = "/api/webhook/new_message"
+BATCH_PATH = "/api/webhook/new_messages"
+
+
+@pytest.fixture
+def scheduled(monkeypatch: pytest.MonkeyPatch) -> list[tuple]:
+    """Перехватить запросы ответа вместо вызова llm"""
+    calls: list[tuple] = []
+    monkeypatch.setattr(inference_coalescer, "request", lambda *args: calls.append(args))
+    return calls
+
+
+async def create_channel(client: AsyncClient) -> tuple[str, dict[str, str]]:
+    bot_response = await client.post("/api/chatbots/", json={"name": "WebhookBot", "secret_token": "webhook-secret"})
+    response = await client.post(
+        "/api/channel/",
+        params={"chat_bot_id": bot_response.json()["id"]},
+        json={"webhook_url": "https://webhook-test.com/webhook"},
+    )
+    return response.json()["_id"], {"Authorization": f"Bearer {response.json()['token']}"}
+
+
+def incoming(message_id: str = "m-1", text: str = "Привет", sender: str = "customer") -> dict:
+    return {"message_id": message_id, "chat_id": "chat-1", "text": text, "message_sender": sender}
+
+
+async def test_inbound_message_is_stored(client: AsyncClient, scheduled: list[tuple]) -> None:
+    channel_id, headers = await create_channel(client)
+
+    response = await client.post(BASE_PATH, json=incoming(), headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+
+    messages = await Message.find(Message.dialogue_id == ObjectId(channel_id)).to_list()
+    assert [(m.message_id, m.chat_id, m.text) for m in messages] == [("m-1", "chat-1", "Привет")]
+    assert len(scheduled) == 1
+
+
+async def test_retried_message_is_processed_once(client: AsyncClient, scheduled: list[tuple]) -> None:
+    channel_id, headers = await create_channel(client)
+
+    responses = await asyncio.gather(*(client.post(BASE_PATH, json=incoming(), headers=headers) for _ in range(5)))
+    assert all(r.status_code == status.HTTP_200_OK for r in responses)
+
+    await client.post(BASE_PATH, json=incoming("m-2", "Ещё вопрос"), headers=headers)
+
+    assert await Message.find(Message.dialogue_id == ObjectId(channel_id)).count() == 2
+    assert len(scheduled) == 2
+
+
+async def test_inbound_message_requires_token(client: AsyncClient, scheduled: list[tuple]) -> None:
+    response = await client.post(BASE_PATH, json=incoming())
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    response = await client.post(BASE_PATH, json=incoming(), headers={"Authorization": f"Bearer {ObjectId()}"})
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert scheduled == []
+
+
+async def test_deleted_channel_is_evicted_from_cache(client: AsyncClient, scheduled: list[tuple]) -> None:
+    channel_id, headers = await create_channel(client)
+
+    response = await client.post(BASE_PATH, json=incoming(), headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert len(channel_cache) == 1
+
+    await client.delete(f"/api/channel/{channel_id}")
+    assert len(channel_cache) == 0
+    response = await client.post(BASE_PATH, json=incoming("m-2"), headers=headers)
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+async def test_full_inference_queue_rejects_without_keeping_message(
+    client: AsyncClient,
+    scheduled: list[tuple],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    channel_id, headers = await create_channel(client)
+    monkeypatch.setattr(inference_scheduler, "max_queue", 0)
+
+    response = await client.post(BASE_PATH, json=incoming(), headers=headers)
+    assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+    assert response.headers["Retry-After"] == "1"
+    batch = [incoming("m-2", sender="employee"), incoming("m-3")]
+    response = await client.post(BATCH_PATH, json={"messages": batch}, headers=headers)
+    assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+    assert await Message.find(Message.dialogue_id == ObjectId(channel_id)).count() == 0
+    assert scheduled == []
+
+    # Повтор канала после освобождения очереди не считается дублем и получает ответ
+    monkeypatch.setattr(inference_scheduler, "max_queue", 1000)
+    response = await client.post(BASE_PATH, json=incoming(), headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert len(scheduled) == 1
+
+
+async def test_full_inference_queue_accepts_messages_without_reply(
+    client: AsyncClient,
+    scheduled: list[tuple],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    channel_id, headers = await create_channel(client)
+    assert (await client.post(BASE_PATH, json=incoming("m-1"), headers=headers)).status_code == status.HTTP_200_OK
+    monkeypatch.setattr(inference_scheduler, "max_queue", 0)
+
+    # Ни сотруднику, ни повтору уже принятого сообщения ответ llm не нужен
+    for message in (incoming("m-2", sender="employee"), incoming("m-1")):
+        response = await client.post(BASE_PATH, json=message, headers=headers)
+        assert response.status_code == status.HTTP_200_OK
+    response = await client.post(BATCH_PATH, json={"messages": [incoming("m-3", sender="employee")]}, headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+
+    messages = await Message.find(Message.dialogue_id == ObjectId(channel_id)).sort(+Message.id).to_list()
+    assert [m.message_id for m in messages] == ["m-1", "m-2", "m-3"]
+    assert len(scheduled) == 1
+
+
+async def test_employee_message_is_stored_without_reply(client: AsyncClient, scheduled: list[tuple]) -> None:
+    channel_id, headers = await create_channel(client)
+
+    response = await client.post(
+        BASE_PATH,
+        json=incoming(sender="employee"),
+        headers=headers,
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert await Message.find(Message.dialogue_id == ObjectId(channel_id)).count() == 1
+    assert scheduled == []
+
+
+async def test_batch_is_stored_deduplicated_and_replied_once(client: AsyncClient, scheduled: list[tuple]) -> None:
+    channel_id, headers = await create_channel(client)
+    await client.post(BASE_PATH, json=incoming("m-1"), headers=headers)
+
+    batch = [
+        incoming("m-1"),
+        incoming("m-2", "Второе"),
+        incoming("m-2", "Второе"),
+        incoming("m-3", "Ответ сотрудника", sender="employee"),
+        {**incoming("m-4", "Из другого чата"), "chat_id": "chat-2"},
+    ]
+    response = await client.post(BATCH_PATH, json={"messages": batch}, headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert [r["status"] for r in response.json()["results"]] == [
+        "duplicate",
+        "accepted",
+        "duplicate",
+        "accepted",
+        "accepted",
+    ]
+
+    messages = await Message.find(Message.dialogue_id == ObjectId(channel_id)).sort(+Message.id).to_list()
+    assert [(m.message_id, m.chat_id) for m in messages] == [
+        ("m-1", "chat-1"),
+        ("m-2", "chat-1"),
+        ("m-3", "chat-1"),
+        ("m-4", "chat-2"),
+    ]
+    assert messages[-1].seq == 0
+    # Один запрос ответа на одиночное сообщение и по одному на каждый чат пачки
+    assert [key for key, _, _ in scheduled] == [
+        (ObjectId(channel_id), "chat-1"),
+        (ObjectId(channel_id), "chat-1"),
+        (ObjectId(channel_id), "chat-2"),
+    ]
+
+
+async def test_batch_requires_messages(client: AsyncClient, scheduled: list[tuple]) -> None:
+    channel_id, headers = await create_channel(client)
+    response = await client.post(
+        BATCH_PATH,
+        json={"messages": []},
+        headers=headers,
+    )
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+async def test_chat_over_rate_limit_is_rejected_before_write(
+    client: AsyncClient,
+    scheduled: list[tuple],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(settings.rate_limit, "chat", RateLimit(rate=0.1, burst=2.0))
+    channel_id, headers = await create_channel(client)
+
+    for i in range(2):
+        response = await client.post(BASE_PATH, json=incoming(f"m-{i}"), headers=headers)
+        assert response.status_code == status.HTTP_200_OK
+
+    response = await client.post(BASE_PATH, json=incoming("m-2"), headers=headers)
+    assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+    assert int(response.headers["Retry-After"]) >= 1
+    assert await Message.find(Message.dialogue_id == ObjectId(channel_id)).count() == 2
+
+    # Другой чат того же канала не упирается в чужой лимит
+    other_chat = {**incoming("m-3"), "chat_id": "chat-2"}
+    response = await client.post(BASE_PATH, json=other_chat, headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+
+
+async def test_rejected_request_does_not_spend_chat_limit(
+    client: AsyncClient,
+    scheduled: list[tuple],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(settings.rate_limit, "chat", RateLimit(rate=0.001, burst=3.0))
+    monkeypatch.setattr(settings.rate_limit, "channel", RateLimit(rate=0.001, burst=1.0))
+    _, headers = await create_channel(client)
+    assert (await client.post(BASE_PATH, json=incoming("m-0"), headers=headers)).status_code == status.HTTP_200_OK
+
+    # Канал исчерпан: повторы отбиваются, но лимит чата не тратят
+    for i in range(3):
+        response = await client.post(BASE_PATH, json=incoming(f"m-retry-{i}"), headers=headers)
+        assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+
+    monkeypatch.setattr(settings.rate_limit, "channel", RateLimit(rate=0, burst=0))
+    for i in range(1, 3):
+        response = await client.post(BASE_PATH, json=incoming(f"m-{i}"), headers=headers)
+        assert response.status_code == status.HTTP_200_OK
+
+
+async def test_cached_reply_skips_inference(
+    client: AsyncClient,
+    scheduled: list[tuple],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    generated: list[str] = []
+
+    async def generate(
+        backend: LLMBackend,
+        context: list[DialogueMessage],
+        deadline: float,
+        superseded: asyncio.Event | None,
+    ) -> str:
+        generated.append(context[-1].text)
+        return "Здравствуйте!"
+
+    monkeypatch.setattr("app.routers.api.webhook.generate", generate)
+    bot = await client.post("/api/chatbots/", json={"name": "Cached", "secret_token": "cached", "response_cache": True})
+    channel = await client.post(
+        "/api/channel/",
+        params={"chat_bot_id": bot.json()["id"]},
+        json={"webhook_url": "https://webhook-test.com/webhook"},
+    )
+    headers = {"Authorization": f"Bearer {channel.json()['token']}"}
+
+    await client.post(BASE_PATH, json={**incoming("m-1", "Привет!"), "chat_id": "chat-1"}, headers=headers)
+    await client.post(BASE_PATH, json={**incoming("m-2", " привет"), "chat_id": "chat-2"}, headers=headers)
+    for _, _, run in scheduled:
+        await run(asyncio.Event())
+
+    assert generated == ["Привет!"]
+    replies = await Message.find(Message.role == "assistant").sort(+Message.id).to_list()
+    assert [(m.chat_id, m.text) for m in replies] == [("chat-1", "Здравствуйте!"), ("chat-2", "Здравствуйте!")]
+
+
+async def test_malformed_token_is_rejected_without_lookup(
+    client: AsyncClient,
+    scheduled: list[tuple],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    async def find_one(*args: object, **kwargs: object) -> NoReturn:
+        raise AssertionError
+
+    monkeypatch.setattr(Dialogue, "find_one", find_one)
+    for token in ["not-a-token", "ch_short", "0" * 25]:
+        response = await client.post(BASE_PATH, json=incoming(), headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+async def test_rotated_token_keeps_working_during_grace(
+    client: AsyncClient,
+    scheduled: list[tuple],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    channel_id, old_headers = await create_channel(client)
+    rotated = await client.post(f"/api/channel/{channel_id}/token")
+    assert rotated.status_code == status.HTTP_200_OK
+    new_headers = {"Authorization": f"Bearer {rotated.json()['token']}"}
+
+    for i, headers in enumerate([old_headers, new_headers]):
+        response = await client.post(BASE_PATH, json=incoming(f"m-{i}"), headers=headers)
+        assert response.status_code == status.HTTP_200_OK
+
+    # После окна старый токен не принимается, даже из кэша
+    monkeypatch.setattr(settings.channel, "token_grace", 0)
+    await client.post(f"/api/channel/{channel_id}/token")
+    response = await client.post(BASE_PATH, json=incoming("m-2"), headers=new_headers)
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    response = await client.post(BASE_PATH, json=incoming("m-3"), headers=old_headers)
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+async def test_legacy_channel_id_token_still_resolves(client: AsyncClient, scheduled: list[tuple]) -> None:
+    channel_id, _ = await create_channel(client)
+    await Dialogue.get_motor_collection().update_one({"_id": ObjectId(channel_id)}, {"$unset": {"token_hash": ""}})
+    assert await hash_legacy_channel_tokens() == 1
+
+    response = await client.post(BASE_PATH, json=incoming(), headers={"Authorization": f"Bearer {channel_id}"})
+    assert response.status_code == status.HTTP_200_OK